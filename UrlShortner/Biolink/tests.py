@@ -1,3 +1,23 @@
+from django.contrib.auth import get_user_model
 from django.test import TestCase
+from django.urls import reverse
 
-# Create your tests here.
+from urlLogic.benchmarks import seed_biolink
+from urlLogic.testing import QueryBudgetMixin
+
+
+class PublicBiolinkBudgetTest(QueryBudgetMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = get_user_model().objects.create_user(
+            email="bio@example.com", username="bioowner", password="x", is_active=True
+        )
+        seed_biolink(cls.owner, 60)
+
+    def test_public_page(self):
+        url = reverse("public_biolink_slug", args=["bioowner"])
+        response = self.assertWithinBudget(
+            lambda: self.client.get(url), max_queries=2, max_ms=100
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(all(link.is_public for link in response.context["links"]))
@@ -3,6 +3,14 @@ ASGI config for UrlShortner project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Run it with an ASGI server and ``ASYNC_REDIRECTS=True`` so the public
+redirect endpoints use the native async views, e.g.::
+
+    ASYNC_REDIRECTS=True uvicorn UrlShortner.asgi:application --workers 4
+
+``python manage.py loadtest_redirect`` compares this against the sync
+views under ``gunicorn UrlShortner.wsgi:application``.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 """
@@ -6,6 +6,7 @@ It configures:
 - Django settings integration
 - Automatic task discovery from installed apps
 - Celery namespace settings to avoid conflicts
+- A task base class counting failed enqueues for the metrics endpoint
 
 The Celery instance is used for tasks like:
 - Email sending
@@ -15,9 +16,26 @@ The Celery instance is used for tasks like:
 
 import os
 
-from celery import Celery
+from celery import Celery, Task
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "UrlShortner.settings")
-app = Celery("UrlShortner")
+
+
+class CountedTask(Task):
+    """
+    Task base class that counts enqueue failures (e.g. broker unreachable).
+    """
+
+    def apply_async(self, *args, **kwargs):
+        try:
+            return super().apply_async(*args, **kwargs)
+        except Exception:
+            from urlLogic.metrics import request_metrics
+
+            request_metrics.increment("celery_enqueue_failures", task=self.name)
+            raise
+
+
+app = Celery("UrlShortner", task_cls=CountedTask)
 app.config_from_object("django.conf:settings", namespace="CELERY")
 app.autodiscover_tasks()
@@ -28,6 +28,32 @@ Environment Variables:
     Optional:
     - DEBUG: Set to True for development environment (default: False)
     - CELERY_BROKER_URL: Redis URL for production (uses localhost in dev)
+    - CACHE_URL: Redis URL for the shared cache (defaults to CELERY_BROKER_URL)
+    - LINK_CACHE_TIMEOUT: Seconds a resolved short link stays cached (default: 3600)
+    - REDIRECT_MAX_AGE: Browser/CDN cache lifetime of 301 redirects (default: 86400)
+    - CLICK_COUNTER_*/CLICK_FLUSH_INTERVAL: Buffered click counting (see urlLogic.counters)
+    - VISIT_*: Batched visit ingestion (see urlLogic.visits)
+    - ANALYTICS_*: Bot and sampling policies for visit storage (see urlLogic.sampling)
+    - GEOIP_*: GeoLite2 database path, open mode and lookup cache (see urlLogic.geoip)
+    - BLOOM_FILTER_*: Filter of existing short codes (see urlLogic.bloom)
+    - HOT_LINKS_*: Hot link detection and cache pinning (see urlLogic.hotlinks)
+    - REQUEST_METRICS_ENABLED/REQUEST_SLOW_MS/SERVER_TIMING_TOKEN: Per-view
+      request metrics and slow request logging (see urlLogic.metrics)
+    - ID_BLOCK_SIZE: Primary keys reserved per round trip for new links (see urlLogic.ids)
+    - SLUG_GENERATOR/SNOWFLAKE_*: Hashids or coordination-free Snowflake ids
+      for generated slugs (see urlLogic.snowflake)
+    - SLUG_POOL_*: Pools of pre-generated random short codes for new links
+      (see urlLogic.slugpool)
+    - BLOCKLIST_PATH/BLOCKLIST_RELOAD_INTERVAL: File of blocked link domains,
+      reloaded when it changes (see urlLogic.blocklist)
+    - THREAT_*: Malicious URL feed screening at link creation and, optionally,
+      on redirects (see urlLogic.threats)
+    - URL_TRACKING_PARAMS: Query parameters ignored when detecting duplicate
+      links (see urlLogic.canonical)
+    - BULK_SHORTEN_MAX_ROWS/BULK_SHORTEN_CHUNK_SIZE: CSV/JSON-lines bulk
+      shortening limits (see urlLogic.bulk)
+    - METRICS_TOKEN/METRICS_DIR/METRICS_PUBLISH_INTERVAL: Prometheus /metrics
+      endpoint and multi-process aggregation (see urlLogic.prometheus)
 
 Security:
     Production environment enables additional security features:
@@ -71,6 +97,176 @@ CELERY_TASK_SERIALIZER = "json"
 CELERY_RESULT_SERIALIZER = "json"
 CELERY_TIMEZONE = "UTC"
 
+if DEBUG:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+            "LOCATION": "urlly",
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": config("CACHE_URL", default=CELERY_BROKER_URL),
+        }
+    }
+
+# Lifetime (seconds) of the slug -> destination entries used by the redirect views.
+LINK_CACHE_TIMEOUT = config("LINK_CACHE_TIMEOUT", cast=int, default=60 * 60)
+# Lifetime (seconds) of cached misses for slugs that match no link.
+NEGATIVE_LINK_CACHE_TIMEOUT = config("NEGATIVE_LINK_CACHE_TIMEOUT", cast=int, default=60)
+
+# Default Cache-Control max-age (seconds) of links using permanent (301)
+# redirects; a link's own cache_max_age and expires_at take precedence.
+REDIRECT_MAX_AGE = config("REDIRECT_MAX_AGE", cast=int, default=60 * 60 * 24)
+
+# Serve /u/<slug>/ and /s/<code>/ with the async views. Enable when running
+# under an ASGI server (see UrlShortner/asgi.py); WSGI keeps the sync views.
+ASYNC_REDIRECTS = config("ASYNC_REDIRECTS", cast=bool, default=False)
+
+# Click counting: "auto" uses Redis hashes when the cache is Redis, otherwise
+# in-process counters. Pending clicks are flushed every CLICK_FLUSH_INTERVAL seconds.
+CLICK_COUNTER_BACKEND = config("CLICK_COUNTER_BACKEND", default="auto")
+CLICK_COUNTER_SHARDS = config("CLICK_COUNTER_SHARDS", cast=int, default=16)
+CLICK_FLUSH_INTERVAL = config("CLICK_FLUSH_INTERVAL", cast=int, default=10)
+
+# Visit ingestion: visits are buffered and bulk inserted VISIT_BATCH_SIZE at a
+# time, at the latest VISIT_MAX_LATENCY seconds after the click.
+VISIT_BUFFER_BACKEND = config("VISIT_BUFFER_BACKEND", default="auto")
+VISIT_BATCH_SIZE = config("VISIT_BATCH_SIZE", cast=int, default=500)
+VISIT_MAX_LATENCY = config("VISIT_MAX_LATENCY", cast=int, default=5)
+
+# Number of distinct parsed user agents memoized per process.
+UA_CACHE_SIZE = config("UA_CACHE_SIZE", cast=int, default=4096)
+
+# Analytics policies (see urlLogic.sampling): what to do with bot visits
+# ("store", "aggregate" or "drop") and the per-link clicks/second above which
+# visits are sampled and weighted (0 stores every visit).
+ANALYTICS_BOT_POLICY = config("ANALYTICS_BOT_POLICY", default="store")
+ANALYTICS_SAMPLE_THRESHOLD = config("ANALYTICS_SAMPLE_THRESHOLD", cast=int, default=50)
+
+# GeoLite2 database, opened lazily on the first lookup (see urlLogic.geoip).
+GEOIP_PATH = config("GEOIP_PATH", default=str(BASE_DIR / "GeoLite2-City.mmdb"))
+GEOIP_MODE = config("GEOIP_MODE", default="mmap")  # "mmap", "memory" or "auto"
+GEOIP_CACHE_SIZE = config("GEOIP_CACHE_SIZE", cast=int, default=10000)
+GEOIP_CACHE_GRANULARITY = config("GEOIP_CACHE_GRANULARITY", default="ip")  # or "24"
+
+# Bloom filter of existing short codes, used to 404 unknown slugs without a
+# query (see urlLogic.bloom and the build_slug_filter command).
+BLOOM_FILTER_ENABLED = config("BLOOM_FILTER_ENABLED", cast=bool, default=True)
+BLOOM_FILTER_BACKEND = config("BLOOM_FILTER_BACKEND", default="auto")  # redis/local
+BLOOM_FILTER_CAPACITY = config("BLOOM_FILTER_CAPACITY", cast=int, default=1_000_000)
+BLOOM_FILTER_FP_RATE = config("BLOOM_FILTER_FP_RATE", cast=float, default=0.001)
+BLOOM_FILTER_PATH = config("BLOOM_FILTER_PATH", default=str(BASE_DIR / "shortcodes.bloom"))
+BLOOM_FILTER_REFRESH_INTERVAL = config(
+    "BLOOM_FILTER_REFRESH_INTERVAL", cast=int, default=5
+)
+# Local filters rescan rows created this many seconds before their last
+# scan, for links that committed late or were created on a host whose
+# clock is behind.
+BLOOM_FILTER_CATCH_UP_OVERLAP = config("BLOOM_FILTER_CATCH_UP_OVERLAP", cast=int, default=60)
+
+# Streaming top-k of clicked links (see urlLogic.hotlinks).
+HOT_LINKS_CAPACITY = config("HOT_LINKS_CAPACITY", cast=int, default=100)
+HOT_LINKS_PUBLISH_INTERVAL = config("HOT_LINKS_PUBLISH_INTERVAL", cast=int, default=10)
+HOT_LINKS_HALF_LIFE = config("HOT_LINKS_HALF_LIFE", cast=int, default=300)
+HOT_LINKS_WARM_INTERVAL = config("HOT_LINKS_WARM_INTERVAL", cast=int, default=60)
+HOT_LINKS_PIN_COUNT = config("HOT_LINKS_PIN_COUNT", cast=int, default=50)
+HOT_LINKS_PIN_TIMEOUT = config("HOT_LINKS_PIN_TIMEOUT", cast=int, default=6 * 60 * 60)
+
+# New links get their primary key (and so their slug) before the INSERT;
+# each process reserves ID_BLOCK_SIZE keys at a time (urlLogic.ids).
+ID_BLOCK_SIZE = config("ID_BLOCK_SIZE", cast=int, default=50)
+
+# How generated slugs are made: "hashids" (Hashids of a key reserved from
+# the table's sequence) or "snowflake" (time + node + sequence ids made up
+# in-process, written as 10 base62 characters; urlLogic.snowflake). Each
+# process's node id is SNOWFLAKE_NODE_ID plus its gunicorn worker slot.
+SLUG_GENERATOR = config("SLUG_GENERATOR", default="hashids")
+SNOWFLAKE_NODE_ID = config("SNOWFLAKE_NODE_ID", cast=int, default=0)
+SNOWFLAKE_EPOCH = config("SNOWFLAKE_EPOCH", default="2025-01-01")
+
+# Pre-generated random short codes (urlLogic.slugpool): new links take a
+# SLUG_POOL_LENGTH-character code (or another of SLUG_POOL_LENGTHS, chosen
+# per link) from a pool that is refilled to SLUG_POOL_TARGET codes when it
+# drops below SLUG_POOL_LOW_WATER. "auto" keeps the pools in Redis when the
+# cache is Redis. Fill the pools (fill_slug_pool) before enabling.
+SLUG_POOL_ENABLED = config("SLUG_POOL_ENABLED", cast=bool, default=False)
+SLUG_POOL_BACKEND = config("SLUG_POOL_BACKEND", default="auto")  # redis/local
+SLUG_POOL_LENGTHS = [
+    int(length) for length in config("SLUG_POOL_LENGTHS", default="5,6,7").split(",")  # type: ignore
+]
+SLUG_POOL_LENGTH = config("SLUG_POOL_LENGTH", cast=int, default=SLUG_POOL_LENGTHS[0])
+SLUG_POOL_LOW_WATER = config("SLUG_POOL_LOW_WATER", cast=int, default=2000)
+SLUG_POOL_TARGET = config("SLUG_POOL_TARGET", cast=int, default=10000)
+SLUG_POOL_REFILL_INTERVAL = config("SLUG_POOL_REFILL_INTERVAL", cast=int, default=60)
+
+# Blocked link domains, one per line (hosts-file and adblock lines are
+# accepted); checked for changes every BLOCKLIST_RELOAD_INTERVAL seconds
+# (urlLogic.blocklist). Empty: only the built-in entries.
+BLOCKLIST_PATH = config("BLOCKLIST_PATH", default="")
+BLOCKLIST_RELOAD_INTERVAL = config("BLOCKLIST_RELOAD_INTERVAL", cast=int, default=30)
+
+# Malicious URL feed compiled by the build_threat_filter command into a
+# memory-mapped Bloom filter plus exact digests (urlLogic.threats). New
+# links are always screened; THREAT_SCREEN_REDIRECTS screens redirects too.
+THREAT_SCREEN_ENABLED = config("THREAT_SCREEN_ENABLED", cast=bool, default=True)
+THREAT_SCREEN_REDIRECTS = config("THREAT_SCREEN_REDIRECTS", cast=bool, default=False)
+THREAT_FILTER_PATH = config("THREAT_FILTER_PATH", default=str(BASE_DIR / "threats.filter"))
+THREAT_FILTER_FP_RATE = config("THREAT_FILTER_FP_RATE", cast=float, default=0.001)
+THREAT_FILTER_RELOAD_INTERVAL = config(
+    "THREAT_FILTER_RELOAD_INTERVAL", cast=int, default=30
+)
+
+# Query parameters ignored when comparing URLs for duplicates; a trailing
+# "*" matches by prefix (urlLogic.canonical). Comma-separated.
+URL_TRACKING_PARAMS = config(
+    "URL_TRACKING_PARAMS",
+    default="utm_*,fbclid,gclid,dclid,gbraid,wbraid,msclkid,mc_cid,mc_eid,igshid,yclid,_ga,_gl",
+).lower().split(",")  # type: ignore
+
+# Bulk shortening (urlLogic.bulk): rows accepted per upload and rows per
+# duplicate-check query and bulk INSERT.
+BULK_SHORTEN_MAX_ROWS = config("BULK_SHORTEN_MAX_ROWS", cast=int, default=10000)
+BULK_SHORTEN_CHUNK_SIZE = config("BULK_SHORTEN_CHUNK_SIZE", cast=int, default=500)
+
+# Per-view request metrics (urlLogic.metrics). Requests slower than
+# REQUEST_SLOW_MS are logged with their query fingerprints. Clients get a
+# Server-Timing header by sending X-Server-Timing: <SERVER_TIMING_TOKEN>
+# (any value when DEBUG is on; an empty token disables it otherwise).
+REQUEST_METRICS_ENABLED = config("REQUEST_METRICS_ENABLED", cast=bool, default=True)
+REQUEST_SLOW_MS = config("REQUEST_SLOW_MS", cast=float, default=500)
+SERVER_TIMING_TOKEN = config("SERVER_TIMING_TOKEN", default="")
+
+# Prometheus /metrics (urlLogic.prometheus), scraped with
+# "Authorization: Bearer <METRICS_TOKEN>". Under gunicorn set METRICS_DIR to
+# a directory writable by all workers so a scrape covers every process;
+# each one publishes its numbers there every METRICS_PUBLISH_INTERVAL seconds.
+METRICS_TOKEN = config("METRICS_TOKEN", default="")
+METRICS_DIR = config("METRICS_DIR", default="")
+METRICS_PUBLISH_INTERVAL = config("METRICS_PUBLISH_INTERVAL", cast=float, default=5)
+
+CELERY_BEAT_SCHEDULE = {
+    "flush-click-counts": {
+        "task": "urlLogic.tasks.flush_click_counts",
+        "schedule": CLICK_FLUSH_INTERVAL,
+    },
+    "drain-visit-buffer": {
+        "task": "urlLogic.tasks.drain_visit_buffer",
+        "schedule": VISIT_MAX_LATENCY,
+    },
+    "warm-hot-links": {
+        "task": "urlLogic.tasks.warm_hot_links",
+        "schedule": HOT_LINKS_WARM_INTERVAL,
+    },
+}
+if SLUG_POOL_ENABLED:
+    CELERY_BEAT_SCHEDULE["refill-slug-pools"] = {
+        "task": "urlLogic.tasks.refill_slug_pools",
+        "schedule": SLUG_POOL_REFILL_INTERVAL,
+    }
+
 CLOUDINARY_CLOUD_NAME = config("CLOUDINARY_CLOUD_NAME")
 CLOUDINARY_API_KEY = config("CLOUDINARY_API_KEY")
 CLOUDINARY_API_SECRET = config("CLOUDINARY_API_SECRET")
@@ -125,7 +321,11 @@ if ENABLE_DEV_TOOLS:
     ]
 
 MIDDLEWARE = [
+    # Times everything below it, so it stays first.
+    "urlLogic.middleware.RequestMetricsMiddleware",
     "django.middleware.security.SecurityMiddleware",
+    # Answers /u/<slug>/ and /s/<code>/ before sessions and auth are loaded.
+    "urlLogic.middleware.RedirectFastPathMiddleware",
     "whitenoise.middleware.WhiteNoiseMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
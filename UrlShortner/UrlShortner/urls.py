@@ -42,7 +42,9 @@ from django.views.generic.base import RedirectView
 from urlLogic.views import (
     anonymousShorturl,
     get_original_url,
+    metrics,
     redirect_to_original,
+    redirect_to_original_async,
 )
 
 handler404 = "urlLogic.errors.F404_page"
@@ -53,12 +55,17 @@ handler403 = "urlLogic.errors.custom_403_view"
 urlpatterns = [
     path("favicon.ico", RedirectView.as_view(url=settings.STATIC_URL + "favicon.ico")),
     path("health/", health, name="health"),
+    path("metrics", metrics, name="metrics"),
     path("admin/", admin.site.urls, name="admin"),
     path("auth/", include("social_django.urls", namespace="social")),
     path("", IndexView.as_view(), name="index"),
     path("preview/", get_original_url, name="preview"),
     path("s/", anonymousShorturl, name="urlshort"),
-    path("s/<str:short_code>/", redirect_to_original, name="redirect"),
+    path(
+        "s/<str:short_code>/",
+        redirect_to_original_async if settings.ASYNC_REDIRECTS else redirect_to_original,
+        name="redirect",
+    ),
     path("a/", include(("Auth.urls", "Auth"), namespace="a")),
     path("u/", include(("urlLogic.urls", "urlLogic"), namespace="u")),
     path("blog/", include(("blog.urls", "blog"), namespace="blog")),
@@ -1,3 +1,32 @@
 from django.test import TestCase
+from django.urls import reverse
 
-# Create your tests here.
+from urlLogic.benchmarks import seed_blog
+from urlLogic.testing import QueryBudgetMixin
+
+
+class BlogListBudgetTest(QueryBudgetMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seed_blog(posts=36, authors=4, readers=40)
+
+    def test_recent(self):
+        response = self.assertWithinBudget(
+            lambda: self.client.get(reverse("blog:blog_list")), max_queries=6, max_ms=250
+        )
+        self.assertEqual(len(response.context["posts"]), 9)
+
+    def test_popular_and_search(self):
+        for params in ({"sort": "popular"}, {"q": "Post 1"}):
+            with self.subTest(params=params):
+                self.assertWithinBudget(
+                    lambda: self.client.get(reverse("blog:blog_list"), params),
+                    max_queries=6,
+                    max_ms=250,
+                )
+
+    def test_counts_match_the_rows(self):
+        posts = self.client.get(reverse("blog:blog_list")).context["posts"]
+        for post in posts:
+            self.assertEqual(post.like_count, post.likes.count())
+            self.assertEqual(post.comment_count, post.comments.count())
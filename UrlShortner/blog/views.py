@@ -1,7 +1,8 @@
 from django.contrib.auth import get_user_model
 from django.contrib.auth.decorators import login_required
 from django.core.paginator import Paginator
-from django.db.models import Count, Q
+from django.db.models import Count, IntegerField, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
 from django.http import JsonResponse
 from django.shortcuts import get_object_or_404, redirect, render
 from django.views.decorators.http import require_POST
@@ -11,30 +12,47 @@ from .models import Blog, BlogProfile, Comment, Like, StatusUpdate
 User = get_user_model()
 
 
+def _count_per_post(model):
+    """Correlated subquery counting ``model`` rows of the outer post"""
+    return Subquery(
+        model.objects.filter(post=OuterRef("pk"))
+        .order_by()
+        .values("post")
+        .annotate(total=Count("pk"))
+        .values("total"),
+        output_field=IntegerField(),
+    )
+
+
+def published_cards():
+    """Published posts with everything a post card shows, in one query"""
+    return (
+        Blog.objects.filter(status=StatusUpdate.PUBLISHED)
+        .select_related("author__user")
+        .annotate(
+            like_count=Coalesce(_count_per_post(Like), 0),
+            comment_count=Coalesce(_count_per_post(Comment), 0),
+        )
+    )
+
+
 def blog_list(request):
     """Public blog listing with search and sorting"""
     query = request.GET.get("q", "")
     sort = request.GET.get("sort", "recent")
 
-    posts = Blog.objects.filter(status=StatusUpdate.PUBLISHED)
+    posts = published_cards()
 
     if query:
         posts = posts.filter(Q(title__icontains=query) | Q(content__icontains=query))
 
     if sort == "popular":
-        posts = posts.annotate(like_count=Count("likes")).order_by(
-            "-like_count", "-published_at"
-        )
+        posts = posts.order_by("-like_count", "-published_at")
     else:
         posts = posts.order_by("-published_at")
 
     # Featured post (most liked recent post)
-    featured_post = (
-        Blog.objects.filter(status=StatusUpdate.PUBLISHED)
-        .annotate(like_count=Count("likes"))
-        .order_by("-like_count", "-published_at")
-        .first()
-    )
+    featured_post = published_cards().order_by("-like_count", "-published_at").first()
 
     paginator = Paginator(posts, 9)
     page = request.GET.get("page", 1)
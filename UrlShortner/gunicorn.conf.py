@@ -0,0 +1,44 @@
+"""
+Gunicorn configuration for URL.ly.
+
+Gunicorn loads this file automatically when started from this directory
+(see Procfile). The hooks keep the multi-process metrics directory
+(``METRICS_DIR``, see ``urlLogic.prometheus``) consistent: it is emptied
+when the server starts, and an exiting worker's counters are archived so
+that totals reported on ``/metrics`` never go backwards.
+
+Each worker also gets the lowest slot number not held by a live worker,
+exported as ``SNOWFLAKE_WORKER_ID``; a replacement worker reuses the slot
+of the one it replaces, so Snowflake node ids (``SNOWFLAKE_NODE_ID`` plus
+the slot, see ``urlLogic.snowflake``) stay within a range as wide as the
+worker count.
+"""
+
+import os
+
+from decouple import config
+
+METRICS_DIR = config("METRICS_DIR", default="")
+
+
+def on_starting(server):
+    if METRICS_DIR:
+        from urlLogic.prometheus import clear_directory
+
+        clear_directory(METRICS_DIR)
+
+
+def pre_fork(server, worker):
+    taken = {getattr(live, "snowflake_slot", None) for live in server.WORKERS.values()}
+    worker.snowflake_slot = next(slot for slot in range(len(taken) + 1) if slot not in taken)
+
+
+def post_fork(server, worker):
+    os.environ["SNOWFLAKE_WORKER_ID"] = str(worker.snowflake_slot)
+
+
+def child_exit(server, worker):
+    if METRICS_DIR:
+        from urlLogic.prometheus import archive_process
+
+        archive_process(METRICS_DIR, worker.pid)
@@ -10,8 +10,13 @@ Provides a customized admin interface with search, filtering,
 and display options for effective URL management.
 """
 
+from django.conf import settings
 from django.contrib import admin
+from django.http import JsonResponse
+from django.template.response import TemplateResponse
+from django.urls import path
 
+from .hotlinks import hot_links
 from .models import ShortUrlAnonymous, UrlModel, UrlVisit
 
 admin.site.site_header = "URL Shortener Admin"
@@ -27,6 +32,7 @@ class UrlModelAdmin(admin.ModelAdmin):
     - Search functionality for URLs
     - Filtering by creation and expiration dates
     - Chronological ordering with newest first
+    - Live ranking of the hottest links at ``hot/`` (JSON at ``hot.json``)
 
     The interface provides all necessary tools for URL monitoring
     and management by administrative users.
@@ -38,13 +44,55 @@ class UrlModelAdmin(admin.ModelAdmin):
         "created_at",
         "expires_at",
         "click_count",
+        "redirect_type",
         "user",
     )
     list_display_links = ("user", "short_url", "original_url")
     search_fields = ("original_url", "short_url")
-    list_filter = ("created_at", "expires_at")
+    list_filter = ("created_at", "expires_at", "redirect_type")
     ordering = ("-created_at",)
 
+    def get_urls(self):
+        hot = [
+            path(
+                "hot/",
+                self.admin_site.admin_view(self.hot_links_view),
+                name="urlLogic_urlmodel_hot",
+            ),
+            path(
+                "hot.json",
+                self.admin_site.admin_view(self.hot_links_json),
+                name="urlLogic_urlmodel_hot_json",
+            ),
+        ]
+        return hot + super().get_urls()
+
+    def hot_links_limit(self, request):
+        """
+        Number of links asked for in ``?limit=``, between 1 and
+        ``HOT_LINKS_CAPACITY``; 50 when missing or not a number.
+        """
+        try:
+            limit = int(request.GET.get("limit", 50))
+        except (TypeError, ValueError):
+            limit = 50
+        return max(1, min(limit, settings.HOT_LINKS_CAPACITY))
+
+    def hot_links_view(self, request):
+        """
+        Show the hottest links across all workers (see urlLogic.hotlinks).
+        """
+        context = {
+            **self.admin_site.each_context(request),
+            "title": "Hot links",
+            "opts": self.model._meta,
+            "links": hot_links(limit=self.hot_links_limit(request)),
+        }
+        return TemplateResponse(request, "admin/urlLogic/urlmodel/hot_links.html", context)
+
+    def hot_links_json(self, request):
+        return JsonResponse({"links": hot_links(limit=self.hot_links_limit(request))})
+
 
 class UrlVisitAdmin(admin.ModelAdmin):
     """
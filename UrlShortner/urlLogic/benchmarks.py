@@ -0,0 +1,362 @@
+"""
+Shared helpers for the ``bench_*`` management commands.
+
+Benchmarks run against a throwaway test database (created and destroyed
+the same way ``manage.py test`` does), with Celery tasks executed eagerly
+and emails kept in memory, so they never touch development or production
+data and need nothing beyond SQLite or a local Postgres.
+
+The ``seed_*`` helpers build realistic amounts of data with bulk inserts;
+the query budget tests use them too (see ``urlLogic.testing``).
+"""
+
+import json
+import random
+import statistics
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+USER_AGENTS = [
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0.0.0 Safari/537.36",
+    "Mozilla/5.0 (iPhone; CPU iPhone OS 17_4 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.4 Mobile/15E148 Safari/604.1",
+    "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.4 Safari/605.1.15",
+    "Mozilla/5.0 (Linux; Android 14; Pixel 8) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0.0.0 Mobile Safari/537.36",
+    "Mozilla/5.0 (X11; Linux x86_64; rv:125.0) Gecko/20100101 Firefox/125.0",
+    "Mozilla/5.0 (compatible; Googlebot/2.1; +http://www.google.com/bot.html)",
+    "facebookexternalhit/1.1 (+http://www.facebook.com/externalhit_uatext.php)",
+    "curl/8.5.0",
+]
+
+# Roughly the shape of real traffic: a handful of agents dominate.
+USER_AGENT_WEIGHTS = [40, 25, 12, 10, 5, 4, 3, 1]
+
+REFERRERS = [None, "https://google.com/", "https://twitter.com/", "https://t.co/x"]
+
+
+@contextmanager
+def benchmark_database(verbosity=0):
+    """
+    Run the enclosed block against a freshly migrated test database.
+
+    Celery runs tasks eagerly and email goes to the in-memory backend for
+    the duration of the block.
+    """
+    from UrlShortner.celery import app
+
+    old_name = connection.settings_dict["NAME"]
+    old_eager = app.conf.task_always_eager
+    connection.creation.create_test_db(
+        verbosity=verbosity, autoclobber=True, serialize=False
+    )
+    app.conf.task_always_eager = True
+    try:
+        with override_settings(
+            EMAIL_BACKEND="django.core.mail.backends.locmem.EmailBackend"
+        ):
+            yield
+    finally:
+        app.conf.task_always_eager = old_eager
+        connection.creation.destroy_test_db(old_name, verbosity=verbosity)
+
+
+def random_ip(rng):
+    return f"{rng.randint(1, 223)}.{rng.randint(0, 255)}.{rng.randint(0, 255)}.{rng.randint(1, 254)}"
+
+
+def random_user_agent(rng):
+    return rng.choices(USER_AGENTS, weights=USER_AGENT_WEIGHTS)[0]
+
+
+def generate_user_agents(count, tail_ratio=0.05, seed=0):
+    """
+    Produce ``count`` user agent strings with a realistic, skewed distribution.
+
+    Most requests come from a few popular agents; ``tail_ratio`` of them are
+    long-tail variants (unusual browser builds) that are rarely repeated.
+    """
+    rng = random.Random(seed)
+    agents = []
+    for _ in range(count):
+        if rng.random() < tail_ratio:
+            agents.append(
+                "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+                f"(KHTML, like Gecko) Chrome/{rng.randint(60, 130)}.0."
+                f"{rng.randint(1000, 6999)}.{rng.randint(0, 200)} Safari/537.36"
+            )
+        else:
+            agents.append(random_user_agent(rng))
+    return agents
+
+
+def generate_visits(url_ids, count, seed=0):
+    """
+    Produce ``count`` synthetic visit dicts spread over ``url_ids``.
+
+    A few links receive most of the traffic, matching the skew of real
+    short-link clicks.
+    """
+    rng = random.Random(seed)
+    weights = [1 / (rank + 1) for rank in range(len(url_ids))]
+    return [
+        {
+            "url_id": rng.choices(url_ids, weights=weights)[0],
+            "ip_address": random_ip(rng),
+            "browser": "Chrome",
+            "os": "Windows",
+            "device": "Other",
+            "is_bot": False,
+            "country": None,
+            "region": None,
+            "city": None,
+            "referrer": rng.choice(REFERRERS),
+        }
+        for _ in range(count)
+    ]
+
+
+def _next_pk(model):
+    from django.db.models import Max
+
+    return (model.objects.aggregate(top=Max("pk"))["top"] or 0) + 1
+
+
+def seed_links(user, count, custom_ratio=0.1, seed=0):
+    """
+    Create ``count`` links for ``user`` with bulk inserts.
+
+    Most links get the slug ``make_short_url`` would generate from their
+    primary key; ``custom_ratio`` of them get custom aliases instead.
+
+    Returns:
+        list: The created UrlModel instances
+    """
+    from .canonical import url_hash
+    from .models import UrlModel
+    from .utils import SlugGenerator
+
+    rng = random.Random(seed)
+    slugs = SlugGenerator()
+    start = _next_pk(UrlModel)
+    links = []
+    for pk in range(start, start + count):
+        custom = rng.random() < custom_ratio
+        original_url = f"https://example.com/{seed}/{pk}"
+        links.append(
+            UrlModel(
+                id=pk,
+                original_url=original_url,
+                url_hash=url_hash(original_url),
+                short_url=f"c{seed}x{pk}" if custom else slugs.encode_url(pk),
+                user=user,
+            )
+        )
+    return UrlModel.objects.bulk_create(links, batch_size=500)
+
+
+def seed_anonymous_links(count, seed=0):
+    """
+    Create ``count`` anonymous links with generated short codes.
+
+    Returns:
+        list: The created ShortUrlAnonymous instances
+    """
+    from .models import ShortUrlAnonymous
+    from .utils import SlugGenerator
+
+    rng = random.Random(seed)
+    slugs = SlugGenerator()
+    start = _next_pk(ShortUrlAnonymous)
+    links = [
+        ShortUrlAnonymous(
+            id=pk,
+            original_url=f"https://example.org/{seed}/{pk}",
+            short_code=slugs.encode_url(pk),
+            ip_address=random_ip(rng),
+        )
+        for pk in range(start, start + count)
+    ]
+    return ShortUrlAnonymous.objects.bulk_create(links, batch_size=500)
+
+
+def seed_visits(url_ids, count, days=30, seed=0):
+    """
+    Insert ``count`` UrlVisit rows spread over the last ``days`` days.
+    """
+    from .models import UrlVisit
+
+    rng = random.Random(seed)
+    now = timezone.now()
+    countries = ["United States", "India", "Germany", "France", "Brazil", None]
+    rows = [
+        UrlVisit(
+            url_id=visit["url_id"],
+            timestamp=now - timedelta(seconds=rng.randrange(days * 86400)),
+            ip_address=visit["ip_address"],
+            browser=visit["browser"],
+            os=visit["os"],
+            device=rng.choice(["Other", "iPhone", "Pixel 8"]),
+            country=rng.choice(countries),
+            referrer=visit["referrer"],
+        )
+        for visit in generate_visits(url_ids, count, seed)
+    ]
+    UrlVisit.objects.bulk_create(rows, batch_size=1000)
+
+
+def seed_users(count, prefix="reader"):
+    """
+    Bulk create ``count`` active users with unusable passwords.
+
+    Signals do not run, so the users get no profiles.
+    """
+    User = get_user_model()
+    return User.objects.bulk_create(
+        User(
+            username=f"{prefix}{i}",
+            email=f"{prefix}{i}@example.com",
+            password="!",
+            is_active=True,
+        )
+        for i in range(count)
+    )
+
+
+def seed_blog(posts, authors=4, readers=40, max_comments=8, seed=0):
+    """
+    Create published blog posts with likes and comments.
+
+    Args:
+        posts: Number of posts, spread over ``authors`` authors
+        readers: Users who like and comment; each post is liked by a
+            random share of them
+        max_comments: Upper bound of comments per post
+
+    Returns:
+        list: The created Blog instances
+    """
+    from blog.models import Blog, BlogProfile, Comment, Like, StatusUpdate
+
+    rng = random.Random(seed)
+    profiles = BlogProfile.objects.bulk_create(
+        BlogProfile(user=user) for user in seed_users(authors, prefix="author")
+    )
+    audience = seed_users(readers)
+    now = timezone.now()
+    created = Blog.objects.bulk_create(
+        Blog(
+            author=profiles[i % len(profiles)],
+            title=f"Post {i}",
+            slug=f"post-{seed}-{i}",
+            content=" ".join(["word"] * rng.randrange(100, 1500)),
+            status=StatusUpdate.PUBLISHED,
+            published_at=now - timedelta(hours=i),
+        )
+        for i in range(posts)
+    )
+    Like.objects.bulk_create(
+        Like(post=post, user=user)
+        for post in created
+        for user in rng.sample(audience, rng.randrange(len(audience) + 1))
+    )
+    Comment.objects.bulk_create(
+        Comment(post=post, user=rng.choice(audience), content=f"Comment {n}")
+        for post in created
+        for n in range(rng.randrange(max_comments + 1))
+    )
+    return created
+
+
+def seed_biolink(user, count, public_ratio=0.8, seed=0):
+    """
+    Add ``count`` links to ``user``'s biolink profile.
+    """
+    from Biolink.models import BioLinkProfile, Link
+
+    rng = random.Random(seed)
+    profile = BioLinkProfile.objects.get(user=user)
+    return Link.objects.bulk_create(
+        Link(
+            profile=profile,
+            title=f"Link {i}",
+            url=f"https://example.net/{i}",
+            is_public=rng.random() < public_ratio,
+        )
+        for i in range(count)
+    )
+
+
+def measure(send, requests, before=None):
+    """
+    Time ``requests`` calls of ``send(i)`` and count their SQL queries.
+
+    ``before(i)``, if given, runs ahead of each call outside the timing
+    (e.g. to clear a cache).
+
+    Returns:
+        dict: ``percentiles`` of the latencies plus ``requests_per_sec``
+        and ``queries_per_request``
+    """
+    samples = []
+    with CaptureQueriesContext(connection) as queries:
+        for i in range(requests):
+            if before is not None:
+                before(i)
+            start = time.perf_counter()
+            send(i)
+            samples.append(time.perf_counter() - start)
+    result = percentiles(samples)
+    result["requests_per_sec"] = throughput(len(samples), sum(samples))
+    result["queries_per_request"] = len(queries) / requests if requests else 0
+    return result
+
+
+def percentiles(samples):
+    """
+    Summarise latency samples (seconds) as milliseconds.
+    """
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+
+    def point(p):
+        return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+    return {
+        "count": len(ordered),
+        "mean_ms": statistics.fmean(ordered) * 1000,
+        "p50_ms": point(50) * 1000,
+        "p95_ms": point(95) * 1000,
+        "p99_ms": point(99) * 1000,
+    }
+
+
+def throughput(count, seconds):
+    return count / seconds if seconds else float("inf")
+
+
+class Stopwatch:
+    """
+    Context manager measuring wall time with ``time.perf_counter``.
+    """
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.elapsed = time.perf_counter() - self.start
+
+
+def write_results(path, results):
+    """
+    Save benchmark results as JSON so runs can be compared.
+    """
+    with open(path, "w", encoding="utf-8") as fh:
+        json.dump(results, fh, indent=2, default=str)
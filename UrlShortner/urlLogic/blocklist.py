@@ -0,0 +1,200 @@
+"""
+Domain blocklist for link destinations.
+
+A blocked entry covers the domain itself and every subdomain, matched on
+whole labels: ``evil.com`` blocks ``evil.com`` and ``login.evil.com`` but
+not ``notevil.com`` or ``evil.com.example.org``. ``SuffixSet`` keeps the
+entries in a hash set and checks a host by looking up each of its label
+suffixes (``a.b.evil.com``, ``b.evil.com``, ``evil.com``, ``com``), so a
+lookup costs one set probe per label whatever the size of the list.
+
+The list is ``BUILTIN_DOMAINS`` plus the file at ``BLOCKLIST_PATH``, if
+set. The file holds one domain per line and can be an abuse/phishing feed
+as published: ``#`` comments, hosts-file lines (``0.0.0.0 evil.com``),
+wildcards (``*.evil.com``) and adblock rules (``||evil.com^``) are read as
+the plain domain. Every process checks the file's modification time at
+most every ``BLOCKLIST_RELOAD_INTERVAL`` seconds and reloads it when it
+changed, so feeds are updated by replacing the file (write a temporary
+file and rename it over the old one). If the file disappears, the last
+list loaded stays in force until a file is back.
+"""
+
+import logging
+import os
+import threading
+import time
+
+from django.conf import settings
+
+logger = logging.getLogger("urlLogic")
+
+# Always blocked: the site itself (links to it would loop) and local hosts.
+BUILTIN_DOMAINS = (
+    "url-ly.onrender.com",
+    "localhost",
+    "127.0.0.1",
+)
+
+
+def normalize_domain(value):
+    """
+    Read a blocklist line as a lowercase domain.
+
+    Returns:
+        str: The domain, or "" for blank lines, comments and lines that
+        hold no domain
+    """
+    value = value.split("#", 1)[0].strip()
+    if not value:
+        return ""
+    # Hosts-file lines: "0.0.0.0 evil.com".
+    value = value.split()[-1].lower()
+    if value.startswith("||"):
+        value = value[2:].split("^", 1)[0]
+    value = value.removeprefix("*.").strip(".")
+    if not value or "/" in value or "*" in value:
+        return ""
+    try:
+        return value.encode("idna").decode("ascii")
+    except UnicodeError:
+        return value
+
+
+class SuffixSet:
+    """
+    Immutable set of blocked domains with label-suffix lookups.
+    """
+
+    __slots__ = ("domains",)
+
+    def __init__(self, domains=()):
+        self.domains = frozenset(filter(None, map(normalize_domain, domains)))
+
+    def __len__(self):
+        return len(self.domains)
+
+    def match(self, host):
+        """
+        Return the entry that blocks ``host``, or None.
+
+        Args:
+            host: Lowercase host name without port
+        """
+        domains = self.domains
+        start = 0
+        while True:
+            suffix = host[start:] if start else host
+            if suffix in domains:
+                return suffix
+            dot = host.find(".", start)
+            if dot == -1:
+                return None
+            start = dot + 1
+
+
+def read_domains(path):
+    """
+    Yield the lines of a blocklist file.
+    """
+    with open(path, encoding="utf-8", errors="replace") as fh:
+        yield from fh
+
+
+class DomainBlocklist:
+    """
+    ``SuffixSet`` of the built-in domains and ``BLOCKLIST_PATH``, reloaded
+    when the file changes.
+    """
+
+    def __init__(self, builtin=()):
+        self.builtin = tuple(builtin)
+        self.lock = threading.Lock()
+        self.entries = None
+        self.signature = None
+        self.last_check = 0.0
+
+    def _signature(self, path):
+        if not path:
+            return None
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return (path, stat.st_mtime_ns, stat.st_size)
+
+    def current(self):
+        """
+        Return the loaded ``SuffixSet``, reloading it if the file changed.
+        """
+        entries = self.entries
+        if (
+            entries is None
+            or time.monotonic() - self.last_check >= settings.BLOCKLIST_RELOAD_INTERVAL
+        ):
+            entries = self.reload()
+        return entries
+
+    def reload(self, force=False):
+        """
+        Load the blocklist file if it changed since the last load.
+
+        Args:
+            force: Load even if the file looks unchanged
+
+        Returns:
+            SuffixSet: The entries in use. A file that cannot be read or
+            has gone missing is logged and the previous entries are kept.
+        """
+        with self.lock:
+            if (
+                not force
+                and self.entries is not None
+                and time.monotonic() - self.last_check < settings.BLOCKLIST_RELOAD_INTERVAL
+            ):
+                return self.entries
+            self.last_check = time.monotonic()
+            path = settings.BLOCKLIST_PATH
+            signature = self._signature(path)
+            if path and signature is None and self.entries is not None:
+                # Missing mid-deploy or mid-swap: dropping every listed domain
+                # would be worse than serving the last good list.
+                if self.signature is not None:
+                    logger.warning("Blocklist %s is missing; keeping the loaded entries", path)
+                return self.entries
+            if force or self.entries is None or signature != self.signature:
+                try:
+                    lines = list(read_domains(path)) if signature else []
+                except OSError as e:
+                    logger.warning("Cannot read blocklist %s: %s", path, e)
+                    if self.entries is not None:
+                        return self.entries
+                    lines = []
+                started = time.perf_counter()
+                self.entries = SuffixSet([*self.builtin, *lines])
+                self.signature = signature
+                logger.info(
+                    "Loaded %d blocked domains in %.2fs",
+                    len(self.entries),
+                    time.perf_counter() - started,
+                )
+            return self.entries
+
+    def match(self, host):
+        """
+        Return the blocklist entry that covers ``host``, or None.
+
+        Args:
+            host: Host name as parsed from a URL (``urlparse(url).hostname``)
+        """
+        host = host.strip(".").lower()
+        if not host:
+            return None
+        if not host.isascii():
+            try:
+                host = host.encode("idna").decode("ascii")
+            except UnicodeError:
+                pass
+        return self.current().match(host)
+
+
+domain_blocklist = DomainBlocklist(BUILTIN_DOMAINS)
@@ -0,0 +1,695 @@
+"""
+Bloom filter of every short code in use, to reject bogus slugs without SQL.
+
+Random, typo'd and scanned slugs each used to cost a database query before
+the redirect views could answer 404 (the negative link cache only helps
+from the second request for the same slug on). The filter answers "this
+slug definitely does not exist" from memory, so ``linkcache`` skips the
+query for nearly all of them. A "maybe" falls through to the normal cache
+and database lookup, so false positives only cost what every miss used to.
+
+The filter covers ``UrlModel.short_url`` and ``ShortUrlAnonymous.short_code``
+and is sized from:
+
+- ``BLOOM_FILTER_CAPACITY``: minimum number of codes the filter is sized for
+  (a build sizes for twice the current number of links when that is larger)
+- ``BLOOM_FILTER_FP_RATE``: target false-positive rate at capacity
+
+Two backends mirror ``urlLogic.counters``:
+
+- ``RedisSlugFilter``: the bits live in one Redis string shared by every
+  process; lookups and additions are single Lua script calls, so they
+  always use the parameters the current bits were built with. While a
+  rebuild runs, additions also go to the filter being built, so links
+  saved during the rebuild survive the swap even if they commit after its
+  final catch-up.
+- ``LocalSlugFilter``: a ``BloomFilter`` in process memory for development
+  and tests. It picks up links created by other processes every
+  ``BLOOM_FILTER_REFRESH_INTERVAL`` seconds by scanning rows created since
+  its last scan, looking ``BLOOM_FILTER_CATCH_UP_OVERLAP`` seconds further
+  back. Scans go by ``created_at`` rather than by id because ids are not
+  assigned in commit order (see ``_catch_up_since``). Until then a
+  generated slug newer than the last scan is answered "maybe" rather than
+  "no" (see ``LocalSlugFilter.might_exist``).
+
+The filter is built by the ``build_slug_filter`` management command or, at
+startup, on first use (inline for the local backend, through the
+``rebuild_slug_filter`` task for Redis; lookups answer "maybe" until it is
+ready). New links are added from ``urlLogic.signals`` as they are saved.
+Deleted links stay in the filter until the next rebuild, which is harmless.
+
+Filters can be saved to and loaded from a compact file
+(``BLOOM_FILTER_PATH``): a fixed header followed by the raw bit array.
+"""
+
+import hashlib
+import logging
+import math
+import os
+import struct
+import threading
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from . import snowflake
+from .utils import SlugGenerator, get_redis_client
+
+logger = logging.getLogger("urlLogic")
+
+REBUILD_SCHEDULED_KEY = "urlly:slugs:bloom:rebuild-scheduled"
+# A rebuild that has not swapped its filter in by then has died; additions
+# stop going to its half-built filter.
+REBUILD_TIMEOUT = 60 * 60
+
+slugs = SlugGenerator()
+
+
+def optimal_parameters(capacity, fp_rate):
+    """
+    Size a Bloom filter.
+
+    Args:
+        capacity: Number of items the filter should hold
+        fp_rate: Target false-positive rate once ``capacity`` items are in
+
+    Returns:
+        tuple: ``(num_bits, num_hashes)``
+    """
+    if not 0 < fp_rate < 1:
+        raise ValueError("fp_rate must be between 0 and 1.")
+    capacity = max(int(capacity), 1)
+    num_bits = math.ceil(-capacity * math.log(fp_rate) / (math.log(2) ** 2))
+    num_hashes = max(1, round(num_bits / capacity * math.log(2)))
+    # Round up to whole bytes; the extra bits only lower the error rate.
+    return num_bits + (-num_bits % 8), num_hashes
+
+
+def estimated_fp_rate(num_bits, num_hashes, count):
+    """
+    Expected false-positive rate of a filter holding ``count`` items.
+    """
+    return (1 - math.exp(-num_hashes * count / num_bits)) ** num_hashes
+
+
+def hash_pair(item):
+    """
+    Two independent 32-bit hashes of ``item`` for double hashing.
+
+    Bit ``i`` of an item is ``(h1 + i * h2) % num_bits``. The values are kept
+    to 32 bits so the Redis Lua scripts can compute the same positions
+    exactly with double-precision numbers.
+    """
+    digest = hashlib.blake2b(item.encode(), digest_size=8).digest()
+    h1, h2 = struct.unpack("<II", digest)
+    return h1, h2 | 1
+
+
+class BloomFilter:
+    """
+    Fixed-size Bloom filter over strings.
+
+    Bits are stored most significant bit first in each byte, the layout
+    Redis uses for ``SETBIT``/``GETBIT``, so ``bits`` can be copied into a
+    Redis string as is.
+
+    Attributes:
+        num_bits: Size of the bit array
+        num_hashes: Bits set per item
+        count: Number of items added
+        fp_rate: Target false-positive rate the filter was sized for
+        watermarks: Creation times (microseconds since the epoch) up to
+            which UrlModel / ShortUrlAnonymous rows are covered
+    """
+
+    MAGIC = b"URLYBLM1"
+    HEADER = struct.Struct("<8sQIQdQQ")
+
+    def __init__(self, num_bits, num_hashes, fp_rate, bits=None, count=0, watermarks=(0, 0)):
+        self.num_bits = num_bits
+        self.num_hashes = num_hashes
+        self.fp_rate = fp_rate
+        self.bits = bytearray(bits) if bits is not None else bytearray(num_bits // 8)
+        self.count = count
+        self.watermarks = tuple(watermarks)
+
+    @classmethod
+    def for_capacity(cls, capacity, fp_rate):
+        num_bits, num_hashes = optimal_parameters(capacity, fp_rate)
+        return cls(num_bits, num_hashes, fp_rate)
+
+    def positions(self, item):
+        h1, h2 = hash_pair(item)
+        return [(h1 + i * h2) % self.num_bits for i in range(self.num_hashes)]
+
+    def add(self, item):
+        for pos in self.positions(item):
+            self.bits[pos >> 3] |= 0x80 >> (pos & 7)
+        self.count += 1
+
+    def __contains__(self, item):
+        return all(
+            self.bits[pos >> 3] & (0x80 >> (pos & 7)) for pos in self.positions(item)
+        )
+
+    def stats(self):
+        """
+        Return the filter's size and error rates as a dict.
+        """
+        return {
+            "num_bits": self.num_bits,
+            "num_hashes": self.num_hashes,
+            "size_bytes": len(self.bits),
+            "count": self.count,
+            "capacity": int(
+                -self.num_bits * math.log(2) ** 2 / math.log(self.fp_rate)
+            ),
+            "target_fp_rate": self.fp_rate,
+            "estimated_fp_rate": estimated_fp_rate(
+                self.num_bits, self.num_hashes, self.count
+            ),
+        }
+
+    def to_bytes(self):
+        header = self.HEADER.pack(
+            self.MAGIC,
+            self.num_bits,
+            self.num_hashes,
+            self.count,
+            self.fp_rate,
+            *self.watermarks,
+        )
+        return header + bytes(self.bits)
+
+    @classmethod
+    def from_bytes(cls, data):
+        magic, num_bits, num_hashes, count, fp_rate, url_id, anon_id = (
+            cls.HEADER.unpack_from(data)
+        )
+        bits = data[cls.HEADER.size :]
+        if magic != cls.MAGIC or len(bits) != num_bits // 8:
+            raise ValueError("Not a short code Bloom filter file.")
+        return cls(num_bits, num_hashes, fp_rate, bits, count, (url_id, anon_id))
+
+    def save(self, path):
+        """
+        Write the filter to ``path``, replacing any previous file atomically.
+        """
+        tmp = f"{path}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(self.to_bytes())
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as f:
+            return cls.from_bytes(f.read())
+
+
+def _iter_codes(since=None):
+    """
+    Yield every short code, or those of rows created at or after ``since``.
+    """
+    from .models import ShortUrlAnonymous, UrlModel
+
+    links = UrlModel.objects.exclude(short_url__isnull=True).exclude(short_url="")
+    anonymous = ShortUrlAnonymous.objects.exclude(short_code="")
+    if since is not None:
+        links = links.filter(created_at__gte=since)
+        anonymous = anonymous.filter(created_at__gte=since)
+    yield from links.values_list("short_url", flat=True).iterator(chunk_size=5000)
+    yield from anonymous.values_list("short_code", flat=True).iterator(chunk_size=5000)
+
+
+def _current_watermarks():
+    """
+    Watermarks for a scan starting now: microseconds since the epoch, the
+    same for both tables (the file format has room for one per table).
+    """
+    now = int(timezone.now().timestamp() * 1_000_000)
+    return (now, now)
+
+
+def _catch_up_since(bloom):
+    """
+    Creation time from which rows may be missing from ``bloom``.
+
+    Keys are not handed out in commit order (each process reserves its own
+    block in ``urlLogic.ids``, Snowflake ids come from independent nodes)
+    and a row can commit some time after its ``created_at``, so catch-up
+    goes by creation time and looks ``BLOOM_FILTER_CATCH_UP_OVERLAP``
+    seconds further back than the previous scan.
+    """
+    covered = datetime.fromtimestamp(min(bloom.watermarks) / 1_000_000, tz=dt_timezone.utc)
+    return covered - timedelta(seconds=settings.BLOOM_FILTER_CATCH_UP_OVERLAP)
+
+
+def _highest_pks():
+    """
+    Highest primary key of each table, by model label.
+    """
+    from django.db.models import Max
+
+    from .models import ShortUrlAnonymous, UrlModel
+
+    return {
+        model._meta.label: model.objects.aggregate(top=Max("pk"))["top"] or 0
+        for model in (UrlModel, ShortUrlAnonymous)
+    }
+
+
+def empty_filter(capacity=None, fp_rate=None):
+    """
+    Size an empty ``BloomFilter`` for the links in the database.
+
+    Args:
+        capacity: Minimum capacity (defaults to ``BLOOM_FILTER_CAPACITY``)
+        fp_rate: Target error rate (defaults to ``BLOOM_FILTER_FP_RATE``)
+
+    Returns:
+        BloomFilter: The filter, with watermarks set to now
+    """
+    from .models import ShortUrlAnonymous, UrlModel
+
+    fp_rate = fp_rate or settings.BLOOM_FILTER_FP_RATE
+    existing = UrlModel.objects.count() + ShortUrlAnonymous.objects.count()
+    capacity = max(capacity or settings.BLOOM_FILTER_CAPACITY, existing * 2)
+
+    bloom = BloomFilter.for_capacity(capacity, fp_rate)
+    bloom.watermarks = _current_watermarks()
+    return bloom
+
+
+def _fill(bloom):
+    for code in _iter_codes():
+        bloom.add(code)
+
+
+def build_filter(capacity=None, fp_rate=None):
+    """
+    Build a ``BloomFilter`` holding every short code in the database.
+
+    Takes the same arguments as ``empty_filter``.
+
+    Returns:
+        BloomFilter: The filter, with watermarks set to the time the scan
+        started
+    """
+    bloom = empty_filter(capacity, fp_rate)
+    _fill(bloom)
+    return bloom
+
+
+def _catch_up(bloom):
+    """
+    Add codes of rows created since ``bloom.watermarks`` (minus the
+    overlap) and advance them. Codes already in the filter are skipped so
+    the overlap does not inflate ``count``.
+    """
+    watermarks = _current_watermarks()
+    for code in _iter_codes(_catch_up_since(bloom)):
+        if code not in bloom:
+            bloom.add(code)
+    bloom.watermarks = watermarks
+
+
+class LocalSlugFilter:
+    """
+    Short code filter held in process memory.
+
+    The filter is loaded (or built) by ``load`` on the first lookup, not
+    when the backend is created, so saving links never triggers a build.
+    Codes added before that are picked up by the initial build.
+
+    Attributes:
+        highest_pks: Highest primary key of each table when the filter was
+            last caught up, by model label
+        pending: Codes added while a rebuild runs, or None
+    """
+
+    def __init__(self, load):
+        self.bloom = None
+        self.lock = threading.Lock()
+        self.last_refresh = time.monotonic()
+        self.highest_pks = {}
+        self.pending = None
+        self._load = load
+
+    def __contains__(self, code):
+        if self.bloom is None:
+            with self.lock:
+                if self.bloom is None:
+                    highest = _highest_pks()
+                    self.bloom = self._load()
+                    self.highest_pks = highest
+                    self.last_refresh = time.monotonic()
+        elif time.monotonic() - self.last_refresh >= settings.BLOOM_FILTER_REFRESH_INTERVAL:
+            self.refresh()
+        return code in self.bloom
+
+    def might_exist(self, code, model=None):
+        """
+        Check ``code`` against the filter, allowing for links created by
+        other processes since the last refresh.
+
+        A generated slug missing from the filter is still a "maybe" if its
+        key was handed out after the last scan: for Snowflake slugs, when
+        the time in the id is at most ``BLOOM_FILTER_CATCH_UP_OVERLAP``
+        seconds before the scan; for Hashids slugs, when the key is above
+        the highest key of ``model``'s table (of either table without
+        ``model``) at the scan. Custom aliases and pooled codes created
+        elsewhere are found at the next refresh.
+
+        Args:
+            code: The short code
+            model: Label of the model ``code`` is looked up in, if known
+        """
+        if code in self:
+            return True
+        pk = slugs.decode_pk(code)
+        if pk is None:
+            return False
+        if slugs.coordination_free and len(code) == snowflake.SLUG_LENGTH:
+            created_us = snowflake.generator().parse(pk)["timestamp_ms"] * 1000
+            overlap_us = settings.BLOOM_FILTER_CATCH_UP_OVERLAP * 1_000_000
+            now_us = _current_watermarks()[0]
+            return min(self.bloom.watermarks) - overlap_us <= created_us <= now_us + overlap_us
+        if model in self.highest_pks:
+            return pk > self.highest_pks[model]
+        return pk > min(self.highest_pks.values(), default=0)
+
+    def add(self, code):
+        with self.lock:
+            if self.bloom is not None:
+                self.bloom.add(code)
+            if self.pending is not None:
+                self.pending.append(code)
+
+    def refresh(self):
+        """
+        Add codes of rows created since the filter's watermarks.
+        """
+        with self.lock:
+            self.last_refresh = time.monotonic()
+            if self.bloom is not None:
+                highest = _highest_pks()
+                _catch_up(self.bloom)
+                self.highest_pks = highest
+
+    def begin_rebuild(self, bloom):
+        """
+        Remember codes added from now on for the filter being built.
+        """
+        with self.lock:
+            self.pending = []
+
+    def install(self, bloom):
+        with self.lock:
+            highest = _highest_pks()
+            _catch_up(bloom)
+            # Saved during the rebuild, possibly not committed yet.
+            for code in self.pending or ():
+                if code not in bloom:
+                    bloom.add(code)
+            self.pending = None
+            self.bloom = bloom
+            self.highest_pks = highest
+            self.last_refresh = time.monotonic()
+
+    def snapshot(self):
+        with self.lock:
+            if self.bloom is None:
+                return None
+            return BloomFilter.from_bytes(self.bloom.to_bytes())
+
+
+class RedisSlugFilter:
+    """
+    Short code filter stored in Redis.
+
+    The bits live in ``key`` and the parameters in the ``meta_key`` hash.
+    A rebuild uploads both under temporary names and swaps them in with one
+    ``MULTI``/``EXEC``, so readers never mix old parameters with new bits.
+
+    ``begin_rebuild`` creates the parameters of the filter being built
+    before the database is scanned; their presence marks a rebuild in
+    progress, and every addition from then on sets bits in both filters.
+    ``install`` merges the scanned bits into those with ``BITOP OR``. A
+    link saved while the scan runs is therefore in the new filter even if
+    its transaction commits after the scan and the final catch-up.
+    """
+
+    key = "urlly:slugs:bloom"
+    meta_key = "urlly:slugs:bloom:meta"
+
+    # Returns -1 when no filter has been built, 1 for "maybe", 0 for "no".
+    CHECK_SCRIPT = """
+    local meta = redis.call('HMGET', KEYS[2], 'num_bits', 'num_hashes')
+    if not meta[1] then return -1 end
+    local m, k = tonumber(meta[1]), tonumber(meta[2])
+    for i = 0, k - 1 do
+        if redis.call('GETBIT', KEYS[1], (ARGV[1] + i * ARGV[2]) % m) == 0 then
+            return 0
+        end
+    end
+    return 1
+    """
+
+    # KEYS are the bits and parameters of the live filter, then those of
+    # the filter being built. Returns the live count, or -1 without one.
+    ADD_SCRIPT = """
+    local count = -1
+    for f = 1, #KEYS, 2 do
+        local meta = redis.call('HMGET', KEYS[f + 1], 'num_bits', 'num_hashes')
+        if meta[1] then
+            local m, k = tonumber(meta[1]), tonumber(meta[2])
+            for i = 0, k - 1 do
+                redis.call('SETBIT', KEYS[f], (ARGV[1] + i * ARGV[2]) % m, 1)
+            end
+            local added = redis.call('HINCRBY', KEYS[f + 1], 'count', 1)
+            if f == 1 then count = added end
+        end
+    end
+    return count
+    """
+
+    def __init__(self, client):
+        self.client = client
+        self._check = client.register_script(self.CHECK_SCRIPT)
+        self._add = client.register_script(self.ADD_SCRIPT)
+        self.building_key = f"{self.key}:building"
+        self.building_meta_key = f"{self.meta_key}:building"
+
+    def lookup(self, code):
+        """
+        Return 1 ("maybe"), 0 ("no") or -1 (filter not built).
+        """
+        return int(self._check(keys=[self.key, self.meta_key], args=hash_pair(code)))
+
+    def __contains__(self, code):
+        return self.lookup(code) != 0
+
+    def add(self, code):
+        self._add(
+            keys=[self.key, self.meta_key, self.building_key, self.building_meta_key],
+            args=hash_pair(code),
+        )
+
+    def _parameters(self, bloom):
+        return {
+            "num_bits": bloom.num_bits,
+            "num_hashes": bloom.num_hashes,
+            "fp_rate": bloom.fp_rate,
+        }
+
+    def begin_rebuild(self, bloom):
+        """
+        Start sending additions to an empty filter sized like ``bloom``.
+        """
+        if bloom.num_bits > 2**32:
+            raise ValueError("Redis strings hold at most 2**32 bits; lower the capacity.")
+        pipe = self.client.pipeline()
+        pipe.delete(self.building_key, self.building_meta_key)
+        pipe.hset(self.building_meta_key, mapping={**self._parameters(bloom), "count": 0})
+        pipe.expire(self.building_meta_key, REBUILD_TIMEOUT)
+        pipe.execute()
+
+    def _is_building(self, bloom):
+        num_bits, num_hashes = self.client.hmget(
+            self.building_meta_key, "num_bits", "num_hashes"
+        )
+        return num_bits is not None and (int(num_bits), int(num_hashes)) == (
+            bloom.num_bits,
+            bloom.num_hashes,
+        )
+
+    def install(self, bloom):
+        if not self._is_building(bloom):
+            # Loaded from a file rather than rebuilt.
+            self.begin_rebuild(bloom)
+        upload_key = f"{self.key}:upload"
+        pipe = self.client.pipeline()
+        pipe.set(upload_key, bytes(bloom.bits))
+        pipe.bitop("OR", self.building_key, self.building_key, upload_key)
+        pipe.delete(upload_key)
+        pipe.hset(self.building_meta_key, mapping=self._parameters(bloom))
+        pipe.hincrby(self.building_meta_key, "count", bloom.count)
+        pipe.rename(self.building_key, self.key)
+        pipe.rename(self.building_meta_key, self.meta_key)
+        pipe.persist(self.meta_key)
+        pipe.execute()
+
+        # Catch up on links created while the filter was being built.
+        for code in _iter_codes(_catch_up_since(bloom)):
+            self.add(code)
+
+    def snapshot(self):
+        pipe = self.client.pipeline(transaction=True)
+        pipe.hgetall(self.meta_key)
+        pipe.get(self.key)
+        meta, bits = pipe.execute()
+        if not meta:
+            return None
+        meta = {k.decode(): v.decode() for k, v in meta.items()}
+        num_bits = int(meta["num_bits"])
+        bits = (bits or b"").ljust(num_bits // 8, b"\0")
+        return BloomFilter(
+            num_bits,
+            int(meta["num_hashes"]),
+            float(meta["fp_rate"]),
+            bits,
+            int(meta["count"]),
+            _current_watermarks(),
+        )
+
+
+class SlugFilter:
+    """
+    Entry point for short code membership checks.
+
+    The backend is chosen from ``BLOOM_FILTER_BACKEND`` ("redis", "local" or
+    "auto"); "auto" uses Redis whenever the default cache is Redis. With
+    ``BLOOM_FILTER_ENABLED`` off every code is reported as possibly
+    existing.
+    """
+
+    def __init__(self):
+        self._backend = None
+        self._lock = threading.Lock()
+
+    @property
+    def backend(self):
+        if self._backend is None:
+            with self._lock:
+                if self._backend is None:
+                    self._backend = self._build_backend()
+        return self._backend
+
+    def _build_backend(self):
+        choice = settings.BLOOM_FILTER_BACKEND
+        client = get_redis_client() if choice in ("auto", "redis") else None
+        if client is not None:
+            return RedisSlugFilter(client)
+        if choice == "redis":
+            raise RuntimeError(
+                "BLOOM_FILTER_BACKEND is 'redis' but the default cache is not Redis."
+            )
+        return LocalSlugFilter(self._initial_filter)
+
+    def _initial_filter(self):
+        path = settings.BLOOM_FILTER_PATH
+        if path and os.path.exists(path):
+            try:
+                bloom = BloomFilter.load(path)
+                _catch_up(bloom)
+                return bloom
+            except (OSError, ValueError, struct.error) as e:
+                logger.warning("Ignoring unreadable slug filter %s: %s", path, e)
+        return build_filter()
+
+    def might_exist(self, code, model=None):
+        """
+        Check whether a short code may belong to a link.
+
+        Args:
+            code: A ``UrlModel.short_url`` or ``ShortUrlAnonymous.short_code``
+            model: Label of the model the code is looked up in, if known
+
+        Returns:
+            bool: False only if no link uses ``code``. Errors and a filter
+            that has not been built yet answer True.
+        """
+        if not settings.BLOOM_FILTER_ENABLED:
+            return True
+        try:
+            backend = self.backend
+            if isinstance(backend, RedisSlugFilter):
+                found = backend.lookup(code)
+                if found == -1:
+                    self._schedule_rebuild()
+                return found != 0
+            return backend.might_exist(code, model)
+        except Exception:
+            logger.exception("Slug filter lookup failed")
+            return True
+
+    def add(self, code):
+        """
+        Record a newly saved short code.
+        """
+        if not settings.BLOOM_FILTER_ENABLED or not code:
+            return
+        try:
+            self.backend.add(code)
+        except Exception:
+            logger.exception("Adding %r to the slug filter failed", code)
+
+    def rebuild(self, capacity=None, fp_rate=None):
+        """
+        Rebuild the filter from the database and swap it in.
+
+        Returns:
+            dict: Stats of the new filter
+        """
+        backend = self.backend
+        bloom = empty_filter(capacity, fp_rate)
+        backend.begin_rebuild(bloom)
+        _fill(bloom)
+        backend.install(bloom)
+        return self.stats()
+
+    def stats(self):
+        """
+        Return the current filter's stats, or None if it is not built.
+        """
+        bloom = self.backend.snapshot()
+        return bloom.stats() if bloom is not None else None
+
+    def save(self, path=None):
+        """
+        Write the current filter to ``path`` (default ``BLOOM_FILTER_PATH``).
+        """
+        bloom = self.backend.snapshot()
+        if bloom is None:
+            raise RuntimeError("The slug filter has not been built yet.")
+        bloom.save(path or settings.BLOOM_FILTER_PATH)
+        return bloom.stats()
+
+    def load(self, path=None):
+        """
+        Replace the current filter with one saved by ``save``.
+        """
+        self.backend.install(BloomFilter.load(path or settings.BLOOM_FILTER_PATH))
+        return self.stats()
+
+    def _schedule_rebuild(self):
+        if cache.add(REBUILD_SCHEDULED_KEY, 1, 600):
+            from .tasks import rebuild_slug_filter
+
+            rebuild_slug_filter.delay()  # type: ignore
+
+
+slug_filter = SlugFilter()
@@ -0,0 +1,436 @@
+"""
+Bulk link shortening from CSV or JSON-lines files.
+
+Campaigns create thousands of links at a time. Submitting them one by one
+through ``make_short_url`` costs two existence queries and an INSERT per
+link; here a whole file is handled in a few statements per chunk:
+
+1. ``parse_rows`` reads the file into ``BulkRow`` objects. CSV files need a
+   header naming the columns (``url``, optional ``alias`` and
+   ``expires_at``); JSON-lines files hold one object per line with the same
+   keys. ``long_url``/``original_url``, ``short_url`` and ``expiry`` are
+   accepted as synonyms.
+2. ``validate_rows`` checks every row in one pass (URL format and
+   blacklist, alias syntax and reserved paths, expiry) and rejects
+   duplicates within the file, comparing URLs by their canonical hash (see
+   ``urlLogic.canonical``). Duplicates of the user's existing links and of
+   taken aliases are found with one ``__in`` query per
+   ``BULK_SHORTEN_CHUNK_SIZE`` values instead of one ``.exists()`` per row.
+3. ``create_links`` reserves primary keys for all rows (see
+   ``urlLogic.ids``), so every generated slug is known up front, and inserts
+   each chunk with a single ``bulk_create``. A chunk that hits a unique
+   constraint (a concurrent request took an alias) is retried row by row
+   so only the conflicting rows fail.
+4. ``write_results`` writes a CSV of every input line with its short URL
+   or the reason it was rejected.
+
+``bulk_create`` sends no ``post_save`` signals, so the work of the signal
+handlers (adding codes to the slug filter, dropping cached misses for the
+new slugs) is done here for the whole batch.
+"""
+
+import csv
+import io
+import json
+import re
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, router, transaction
+from django.urls import reverse
+from django.utils import timezone
+
+from .bloom import slug_filter
+from .canonical import url_hash
+from .ids import allocate_ids, create_link, slugs
+from .linkcache import link_cache_key
+from .middleware import match_redirect
+from .models import UrlModel
+
+COLUMNS = {
+    "url": "url",
+    "long_url": "url",
+    "original_url": "url",
+    "alias": "alias",
+    "short_url": "alias",
+    "expires_at": "expires_at",
+    "expiry": "expires_at",
+}
+ALIAS_RE = re.compile(r"[A-Za-z0-9_-]{1,10}")
+RESULT_FIELDS = ("line", "original_url", "short_url", "status", "error")
+
+
+class BulkInputError(ValueError):
+    """
+    The uploaded file cannot be read as CSV or JSON lines.
+    """
+
+
+class BulkRow:
+    """
+    One line of a bulk file and, once processed, its outcome.
+    """
+
+    __slots__ = (
+        "line", "url", "url_hash", "alias", "expiry", "expires_at", "link", "error"
+    )
+
+    def __init__(self, line, url="", alias="", expiry=""):
+        self.line = line
+        self.url = url
+        self.url_hash = ""
+        self.alias = alias
+        self.expiry = expiry
+        self.expires_at = None
+        self.link = None
+        self.error = ""
+
+    @property
+    def short_url(self):
+        return self.link.short_url if self.link is not None else ""
+
+
+def detect_format(name, head):
+    """
+    Guess the format of a bulk file.
+
+    Args:
+        name: The file name (may be empty)
+        head: The beginning of the file's text
+
+    Returns:
+        str: ``"jsonl"`` or ``"csv"``
+    """
+    if name.lower().endswith((".jsonl", ".ndjson", ".json")):
+        return "jsonl"
+    if name.lower().endswith(".csv"):
+        return "csv"
+    return "jsonl" if head.lstrip().startswith("{") else "csv"
+
+
+def parse_rows(stream, fmt):
+    """
+    Read the rows of a bulk file.
+
+    Args:
+        stream: Text stream of the file
+        fmt: ``"csv"`` or ``"jsonl"``
+
+    Returns:
+        list[BulkRow]: One row per non-empty line, numbered from 1 (the
+        CSV header is line 1)
+
+    Raises:
+        BulkInputError: If the file has no usable URL column or a line is
+        not valid JSON
+    """
+    if fmt == "jsonl":
+        return _parse_jsonl(stream)
+    return _parse_csv(stream)
+
+
+def _row(line, values):
+    fields = {}
+    for key, value in values.items():
+        column = COLUMNS.get(str(key).strip().lower())
+        if column and value is not None and column not in fields:
+            fields[column] = str(value).strip()
+    return BulkRow(
+        line,
+        url=fields.get("url", ""),
+        alias=fields.get("alias", ""),
+        expiry=fields.get("expires_at", ""),
+    )
+
+
+def _parse_csv(stream):
+    reader = csv.DictReader(stream)
+    columns = {COLUMNS.get((name or "").strip().lower()) for name in reader.fieldnames or ()}
+    if "url" not in columns:
+        raise BulkInputError("The CSV header must have a 'url' column.")
+    return [
+        _row(reader.line_num, values)
+        for values in reader
+        if any((value or "").strip() for value in values.values() if isinstance(value, str))
+    ]
+
+
+def _parse_jsonl(stream):
+    rows = []
+    for line, text in enumerate(stream, start=1):
+        if not text.strip():
+            continue
+        try:
+            values = json.loads(text)
+        except ValueError:
+            raise BulkInputError(f"Line {line} is not valid JSON.")
+        if isinstance(values, str):
+            values = {"url": values}
+        if not isinstance(values, dict):
+            raise BulkInputError(f"Line {line} must be a JSON object.")
+        rows.append(_row(line, values))
+    return rows
+
+
+def read_upload(upload, fmt=""):
+    """
+    Parse an uploaded bulk file.
+
+    Args:
+        upload: ``UploadedFile`` (or any binary file object with a ``name``)
+        fmt: ``"csv"``, ``"jsonl"`` or empty to detect it
+
+    Returns:
+        list[BulkRow]
+    """
+    try:
+        content = upload.read().decode("utf-8-sig")
+    except UnicodeDecodeError:
+        raise BulkInputError("The file must be UTF-8 encoded text.")
+    fmt = fmt or detect_format(getattr(upload, "name", "") or "", content[:1024])
+    return parse_rows(io.StringIO(content, newline=""), fmt)
+
+
+def parse_expiry(value):
+    """
+    Parse an ISO 8601 expiry; naive values are in the current time zone.
+
+    Returns:
+        datetime: Aware datetime in UTC
+
+    Raises:
+        ValueError: If ``value`` is not an ISO 8601 date or datetime
+    """
+    expires_at = datetime.fromisoformat(value)
+    if timezone.is_naive(expires_at):
+        expires_at = timezone.make_aware(expires_at, timezone.get_current_timezone())
+    return expires_at.astimezone(dt_timezone.utc)
+
+
+def _chunks(items, size):
+    for start in range(0, len(items), size):
+        yield items[start : start + size]
+
+
+def existing_values(queryset, field, values, chunk_size):
+    """
+    Return which of ``values`` are already stored in ``field``.
+
+    Runs one ``field__in`` query per ``chunk_size`` values.
+    """
+    values = list(values)
+    found = set()
+    for chunk in _chunks(values, chunk_size):
+        found.update(
+            queryset.filter(**{f"{field}__in": chunk}).values_list(field, flat=True)
+        )
+    return found
+
+
+def validate_rows(user, rows, chunk_size=None):
+    """
+    Check every row and set ``error`` on the ones that cannot be created.
+
+    Args:
+        user: Owner of the new links
+        rows: ``BulkRow`` objects from ``parse_rows``
+        chunk_size: Values per duplicate-check query (default
+            ``BULK_SHORTEN_CHUNK_SIZE``)
+
+    Returns:
+        list[BulkRow]: The rows that passed
+    """
+    chunk_size = chunk_size or settings.BULK_SHORTEN_CHUNK_SIZE
+    url_field = UrlModel._meta.get_field("original_url")
+    now = timezone.now()
+    seen_hashes, seen_aliases = set(), set()
+    valid = []
+
+    for row in rows:
+        if not row.url:
+            row.error = "Missing URL."
+            continue
+        if not row.url.startswith(("http://", "https://")):
+            row.url = "http://" + row.url
+        try:
+            row.url = url_field.clean(row.url, None)
+        except ValidationError as e:
+            row.error = " ".join(e.messages)
+            continue
+        if row.alias and not ALIAS_RE.fullmatch(row.alias):
+            row.error = "Aliases are 1-10 letters, digits, '-' or '_'."
+            continue
+        if row.alias and match_redirect(f"/u/{row.alias}/") is None:
+            row.error = "This alias is reserved."
+            continue
+        if row.expiry:
+            try:
+                row.expires_at = parse_expiry(row.expiry)
+            except ValueError:
+                row.error = "Expiry must be an ISO 8601 date or datetime."
+                continue
+            if row.expires_at <= now:
+                row.error = "Expiry is in the past."
+                continue
+        row.url_hash = url_hash(row.url)
+        if row.url_hash in seen_hashes:
+            row.error = "Duplicate URL in this file."
+            continue
+        if row.alias and row.alias in seen_aliases:
+            row.error = "Duplicate alias in this file."
+            continue
+        seen_hashes.add(row.url_hash)
+        if row.alias:
+            seen_aliases.add(row.alias)
+        valid.append(row)
+
+    taken_hashes = existing_values(
+        UrlModel.objects.filter(user=user), "url_hash", seen_hashes, chunk_size
+    )
+    taken_aliases = existing_values(
+        UrlModel.objects.all(), "short_url", seen_aliases, chunk_size
+    )
+    passed = []
+    for row in valid:
+        if row.url_hash in taken_hashes:
+            row.error = "This URL has already been shortened."
+        elif row.alias in taken_aliases:
+            row.error = "This short URL already exists."
+        else:
+            passed.append(row)
+    return passed
+
+
+def _build(user, row, pk=None):
+    return UrlModel(
+        pk=pk,
+        original_url=row.url,
+        url_hash=row.url_hash,
+        short_url=row.alias or slugs.encode_url(pk),
+        expires_at=row.expires_at,
+        user=user,
+    )
+
+
+def create_links(user, rows, chunk_size=None):
+    """
+    Insert validated rows with one ``bulk_create`` per chunk.
+
+    Args:
+        user: Owner of the new links
+        rows: Rows returned by ``validate_rows``
+        chunk_size: Rows per INSERT (default ``BULK_SHORTEN_CHUNK_SIZE``)
+
+    Returns:
+        list[UrlModel]: The created links; rows that failed get ``error``
+    """
+    chunk_size = chunk_size or settings.BULK_SHORTEN_CHUNK_SIZE
+    if not rows:
+        return []
+    # Aliased rows get a key too: bulk_create splits a batch into rows with
+    # and without a primary key, which would double the INSERTs.
+    ids = allocate_ids(UrlModel, len(rows))
+    if ids is None:
+        # No way to reserve keys: fall back to one link at a time.
+        return _create_one_by_one(user, rows)
+
+    using = router.db_for_write(UrlModel)
+    created = []
+    for start in range(0, len(rows), chunk_size):
+        chunk = rows[start : start + chunk_size]
+        links = [
+            _build(user, row, pk)
+            for row, pk in zip(chunk, ids[start : start + chunk_size])
+        ]
+        try:
+            with transaction.atomic(using=using):
+                UrlModel.objects.bulk_create(links)
+        except IntegrityError:
+            links = _create_one_by_one(user, chunk, links)
+        else:
+            for row, link in zip(chunk, links):
+                row.link = link
+        created.extend(links)
+
+    _after_create(created)
+    return created
+
+
+def _create_one_by_one(user, rows, links=None):
+    created = []
+    for index, row in enumerate(rows):
+        try:
+            with transaction.atomic(using=router.db_for_write(UrlModel)):
+                if links is not None:
+                    links[index].save(force_insert=True)
+                    link = links[index]
+                else:
+                    link = create_link(
+                        UrlModel,
+                        "short_url",
+                        slug=row.alias,
+                        original_url=row.url,
+                        user=user,
+                        expires_at=row.expires_at,
+                    )
+        except IntegrityError:
+            row.error = "This short URL already exists."
+            continue
+        row.link = link
+        created.append(link)
+    return created
+
+
+def _after_create(links):
+    """
+    Do the ``post_save`` work that ``bulk_create`` skips.
+    """
+    codes = [link.short_url for link in links]
+    for code in codes:
+        slug_filter.add(code)
+    keys = [link_cache_key(code) for code in codes]
+    if keys:
+        transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def shorten(user, rows, chunk_size=None, max_rows=None):
+    """
+    Validate and create the links of a parsed bulk file.
+
+    Args:
+        user: Owner of the new links
+        rows: ``BulkRow`` objects from ``parse_rows``
+        chunk_size: Rows per query and INSERT
+        max_rows: Reject files with more rows than this (no limit if empty)
+
+    Returns:
+        list[UrlModel]: The created links
+
+    Raises:
+        BulkInputError: If the file has more than ``max_rows`` rows
+    """
+    if max_rows and len(rows) > max_rows:
+        raise BulkInputError(f"At most {max_rows} rows can be shortened at once.")
+    return create_links(user, validate_rows(user, rows, chunk_size), chunk_size)
+
+
+def write_results(stream, rows, base_url):
+    """
+    Write one CSV line per input row with its short URL or error.
+
+    Args:
+        stream: Text stream to write to
+        rows: The processed ``BulkRow`` objects
+        base_url: Scheme and host of short links, e.g. ``https://url.ly``
+    """
+    writer = csv.writer(stream)
+    writer.writerow(RESULT_FIELDS)
+    for row in rows:
+        short_url = ""
+        if row.link is not None:
+            short_url = base_url + reverse("u:redirect_url", args=[row.short_url])
+        writer.writerow(
+            [row.line, row.url, short_url, "error" if row.error else "created", row.error]
+        )
@@ -0,0 +1,93 @@
+"""
+URL canonicalization and fixed-width URL hashes for duplicate detection.
+
+Two submissions of the same page rarely match byte for byte:
+``HTTP://Example.com:80/a?b=2&a=1&utm_source=x`` and
+``http://example.com/a?a=1&b=2`` lead to the same place. Duplicate checks
+therefore compare ``url_hash`` values, a hash of the canonical form,
+instead of the raw ``original_url``:
+
+- the scheme and host are lowercased (userinfo, path and fragment keep
+  their case) and a trailing dot on the host is dropped
+- the scheme's default port (``:80``, ``:443``) is removed
+- an empty path becomes ``/``
+- query parameters are sorted and tracking parameters
+  (``URL_TRACKING_PARAMS``: ``utm_*``, ``fbclid``, ``gclid``...) dropped
+
+The stored ``original_url`` is left as submitted, so redirects still carry
+every parameter. Hashes are 128-bit BLAKE2b digests in hex: short enough
+for a compact ``(user, url_hash)`` index whatever the URL's length, and
+wide enough that two different URLs never share one in practice.
+"""
+
+import hashlib
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from django.conf import settings
+
+DEFAULT_PORTS = {"http": "80", "https": "443"}
+HASH_LENGTH = 32
+
+
+def is_tracking_param(name):
+    """
+    Check whether a query parameter only tracks the visitor.
+
+    ``URL_TRACKING_PARAMS`` entries ending in ``*`` match by prefix.
+    """
+    name = name.lower()
+    for pattern in settings.URL_TRACKING_PARAMS:
+        if pattern.endswith("*"):
+            if name.startswith(pattern[:-1]):
+                return True
+        elif name == pattern:
+            return True
+    return False
+
+
+def canonicalize_url(url):
+    """
+    Return the canonical form of a URL used for duplicate detection.
+
+    Args:
+        url: Absolute URL as submitted
+
+    Returns:
+        str: The URL with its scheme and host lowercased, the default port
+        removed, tracking parameters dropped and the query sorted
+    """
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+
+    userinfo, at, hostport = parts.netloc.rpartition("@")
+    hostport = hostport.lower()
+    host, colon, port = hostport.rpartition(":")
+    if not colon or "]" in port:
+        # No port (a colon inside an IPv6 literal is not a separator).
+        host, port = hostport, ""
+    if port == DEFAULT_PORTS.get(scheme):
+        port = ""
+    host = host.rstrip(".")
+    netloc = f"{userinfo}{at}{host}{':' + port if port else ''}"
+
+    query = sorted(
+        (name, value)
+        for name, value in parse_qsl(parts.query, keep_blank_values=True)
+        if not is_tracking_param(name)
+    )
+    return urlunsplit(
+        (scheme, netloc, parts.path or "/", urlencode(query), parts.fragment)
+    )
+
+
+def url_hash(url):
+    """
+    Hash the canonical form of ``url``.
+
+    Returns:
+        str: ``HASH_LENGTH`` hex characters
+    """
+    digest = hashlib.blake2b(
+        canonicalize_url(url).encode("utf-8"), digest_size=HASH_LENGTH // 2
+    )
+    return digest.hexdigest()
@@ -0,0 +1,201 @@
+"""
+Sharded click counters for short links.
+
+Counting a click used to mean loading the whole ``UrlModel`` row,
+incrementing ``click_count`` in Python and saving every column back. That
+row-locks the hottest links and loses increments when two clicks race.
+
+Clicks are now absorbed into sharded counters and periodically flushed to
+the database with one ``UPDATE ... SET click_count = click_count + delta``
+per link, taking the row write off the redirect path entirely.
+
+Two backends are available:
+
+- ``RedisClickBackend``: shards are Redis hashes (``HINCRBY``). Every web
+  process and Celery worker shares them, and ``flush_click_counts`` (run by
+  Celery beat) applies the deltas. Used whenever the default cache is Redis.
+- ``LocalClickBackend``: shards are in-process dicts guarded by their own
+  lock. Suitable for development and tests; since no other process can see
+  these counts, the process flushes its own deltas once they are older
+  than ``CLICK_FLUSH_INTERVAL``.
+"""
+
+import logging
+import random
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+
+from .utils import get_redis_client
+
+logger = logging.getLogger("urlLogic")
+
+FLUSH_LOCK_KEY = "urlly:clicks:flush-lock"
+
+
+class RedisClickBackend:
+    """
+    Click shards stored as Redis hashes mapping ``url_id -> pending clicks``.
+
+    Each click lands in a random shard so concurrent clicks on one hot link
+    spread over several keys. Draining a shard first renames it out of the
+    way (atomically, so no increment is lost) and only deletes the renamed
+    copy once the caller has written the deltas to the database.
+    """
+
+    def __init__(self, client, shards):
+        self.client = client
+        self.shards = shards
+
+    def shard_key(self, shard):
+        return f"urlly:clicks:{shard}"
+
+    def incr(self, url_id, amount=1):
+        shard = random.randrange(self.shards)
+        self.client.hincrby(self.shard_key(shard), url_id, amount)
+
+    def drain(self, apply):
+        for shard in range(self.shards):
+            key = self.shard_key(shard)
+            flushing = f"{key}:flushing"
+            # A leftover ``flushing`` hash means a previous flush died before
+            # committing; apply it before taking a new snapshot.
+            if not self.client.exists(flushing):
+                if not self.client.exists(key):
+                    continue
+                self.client.renamenx(key, flushing)
+
+            pending = self.client.hgetall(flushing)
+            apply(Counter({int(k): int(v) for k, v in pending.items()}))
+            self.client.delete(flushing)
+
+
+class LocalClickBackend:
+    """
+    In-process click shards, one dict and one lock per shard.
+
+    Threads are spread over the shards by thread id so that concurrent
+    requests in a threaded server rarely wait on the same lock.
+    """
+
+    def __init__(self, shards):
+        self.shards = [Counter() for _ in range(shards)]
+        self.locks = [threading.Lock() for _ in range(shards)]
+        self.last_flush = time.monotonic()
+
+    def incr(self, url_id, amount=1):
+        shard = threading.get_ident() % len(self.shards)
+        with self.locks[shard]:
+            self.shards[shard][url_id] += amount
+
+    def drain(self, apply):
+        pending = Counter()
+        for shard, lock in enumerate(self.locks):
+            with lock:
+                pending.update(self.shards[shard])
+                self.shards[shard] = Counter()
+        self.last_flush = time.monotonic()
+        if not pending:
+            return
+        try:
+            apply(pending)
+        except Exception:
+            # Put the deltas back so the next flush retries them.
+            for url_id, amount in pending.items():
+                self.incr(url_id, amount)
+            raise
+
+    def flush_due(self):
+        return time.monotonic() - self.last_flush >= settings.CLICK_FLUSH_INTERVAL
+
+
+def apply_click_deltas(deltas):
+    """
+    Add pending click deltas to ``UrlModel.click_count``.
+
+    Args:
+        deltas: Mapping of UrlModel id to number of clicks to add
+
+    Issues one ``UPDATE ... SET click_count = click_count + delta`` per link,
+    in id order so concurrent flushes never deadlock. Links deleted since
+    the clicks were counted simply match no rows.
+    """
+    from .models import UrlModel
+
+    with transaction.atomic():
+        for url_id in sorted(deltas):
+            if deltas[url_id]:
+                UrlModel.objects.filter(id=url_id).update(
+                    click_count=F("click_count") + deltas[url_id]
+                )
+
+
+class ClickCounter:
+    """
+    Entry point for recording and flushing link clicks.
+
+    The backend is chosen from ``CLICK_COUNTER_BACKEND`` ("redis", "local"
+    or "auto"); "auto" uses Redis whenever the default cache is Redis.
+    """
+
+    def __init__(self):
+        self._backend = None
+        self._lock = threading.Lock()
+
+    @property
+    def backend(self):
+        if self._backend is None:
+            with self._lock:
+                if self._backend is None:
+                    self._backend = self._build_backend()
+        return self._backend
+
+    def _build_backend(self):
+        choice = settings.CLICK_COUNTER_BACKEND
+        shards = settings.CLICK_COUNTER_SHARDS
+        client = get_redis_client() if choice in ("auto", "redis") else None
+        if client is not None:
+            return RedisClickBackend(client, shards)
+        if choice == "redis":
+            raise RuntimeError(
+                "CLICK_COUNTER_BACKEND is 'redis' but the default cache is not Redis."
+            )
+        return LocalClickBackend(shards)
+
+    def incr(self, url_id, amount=1):
+        """
+        Record ``amount`` clicks for a link without touching the database.
+        """
+        self.backend.incr(url_id, amount)
+        if isinstance(self.backend, LocalClickBackend) and self.backend.flush_due():
+            try:
+                self.flush()
+            except Exception:
+                # Already logged; the deltas stay queued for the next flush.
+                pass
+
+    def flush(self):
+        """
+        Write all pending clicks to the database.
+
+        Returns:
+            bool: False if another flush currently holds the lock
+        """
+        if not cache.add(FLUSH_LOCK_KEY, 1, settings.CLICK_FLUSH_INTERVAL * 6):
+            return False
+        try:
+            self.backend.drain(apply_click_deltas)
+        except Exception:
+            logger.exception("Flushing click counters failed")
+            raise
+        finally:
+            cache.delete(FLUSH_LOCK_KEY)
+        return True
+
+
+click_counter = ClickCounter()
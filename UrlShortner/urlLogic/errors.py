@@ -1,5 +1,10 @@
-from django.shortcuts import render, redirect
+from functools import lru_cache
+
+from django.conf import settings
 from django.contrib import messages
+from django.http import HttpResponse
+from django.shortcuts import render, redirect
+from django.template.loader import render_to_string
 
 
 def F404_page(request, exception):
@@ -52,3 +57,33 @@ def custom_403_view(request, exception=None):
     message = "You are sending requests too quickly. Please wait a few moments before trying again."
     messages.error(request, message)
     return redirect("index")
+
+
+@lru_cache(maxsize=None)
+def _prerender(template_name, debug):
+    return render_to_string(template_name, {"debug": debug})
+
+
+def prerendered_page(request, template_name, status=200):
+    """
+    Serve a static error page from a body rendered once per process.
+
+    Args:
+        request: The HTTP request object
+        template_name: Template that depends on the request only through
+            ``debug``
+        status: HTTP status code of the response
+
+    Returns:
+        HttpResponse: Response carrying the pre-rendered body
+
+    Used by the redirect views, where unknown and expired links are hit by
+    scanners and bots at high rates; a miss then costs neither SQL nor
+    template rendering. ``debug`` is worked out from the request the way
+    the debug context processor does it, and a body is kept for each value,
+    so the page matches what ``render`` would give. Other context
+    processors (user, messages, csrf) do not run, so the template must not
+    rely on them.
+    """
+    debug = settings.DEBUG and request.META.get("REMOTE_ADDR") in settings.INTERNAL_IPS
+    return HttpResponse(_prerender(template_name, debug), status=status)
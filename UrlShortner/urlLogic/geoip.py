@@ -0,0 +1,135 @@
+"""
+Lazy GeoIP lookups with a per-process result cache.
+
+The GeoLite2 database used to be opened at import time of ``utils`` with a
+path relative to the current directory. Every process importing the module
+paid for it (including management commands and Celery workers that never
+geolocate) and imports failed outright when the file was missing.
+
+``GeoIPService`` opens the database on first lookup instead, using the
+configured path and open mode:
+
+- ``GEOIP_PATH``: location of ``GeoLite2-City.mmdb``
+- ``GEOIP_MODE``: "mmap" (pages shared between workers, default), "memory"
+  (whole file read into RAM, fastest lookups) or "auto"
+- ``GEOIP_CACHE_SIZE``: number of lookup results kept per process
+- ``GEOIP_CACHE_GRANULARITY``: "ip" caches per address; "24" caches IPv4
+  results per /24 network, which city-level data rarely distinguishes
+
+When the database file is absent the service logs a single warning and
+returns empty locations, so visits are still recorded.
+"""
+
+import ipaddress
+import logging
+import threading
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+from .lru import LRUCache
+
+logger = logging.getLogger("urlLogic")
+
+EMPTY_LOCATION = {"country": None, "region": None, "city": None}
+
+
+class GeoIPService:
+    """
+    Resolve IP addresses to country, region and city.
+
+    Attributes:
+        cache: LRUCache of lookup results (exposes hit/miss/eviction stats)
+        available: False once opening the database has failed
+    """
+
+    def __init__(self, path=None, mode=None, cache_size=None, granularity=None):
+        self.path = path or settings.GEOIP_PATH
+        self.mode = mode or settings.GEOIP_MODE
+        self.granularity = granularity or settings.GEOIP_CACHE_GRANULARITY
+        self.cache = LRUCache(maxsize=cache_size or settings.GEOIP_CACHE_SIZE)
+        self.available = True
+        self._reader = None
+        self._lock = threading.Lock()
+
+    @property
+    def reader(self):
+        """
+        The opened ``geoip2.database.Reader``, or None if unavailable.
+        """
+        if self._reader is None and self.available:
+            with self._lock:
+                if self._reader is None and self.available:
+                    self._reader = self._open()
+        return self._reader
+
+    def _open(self):
+        import geoip2.database
+        import maxminddb
+
+        modes = {
+            "auto": maxminddb.MODE_AUTO,
+            "mmap": maxminddb.MODE_MMAP,
+            "memory": maxminddb.MODE_MEMORY,
+        }
+        if self.mode not in modes:
+            raise ImproperlyConfigured(
+                f"GEOIP_MODE must be one of {sorted(modes)}, not {self.mode!r}."
+            )
+        try:
+            return geoip2.database.Reader(str(self.path), mode=modes[self.mode])
+        except (OSError, ValueError) as e:
+            self.available = False
+            logger.warning("GeoIP lookups disabled, cannot open %s: %s", self.path, e)
+            return None
+
+    def cache_key(self, ip_address):
+        """
+        Key under which the lookup result for ``ip_address`` is cached.
+        """
+        if self.granularity == "24":
+            address = ipaddress.ip_address(ip_address)
+            if address.version == 4:
+                return str(ipaddress.ip_network(f"{address}/24", strict=False))
+        return ip_address
+
+    def locate(self, ip_address):
+        """
+        Look up the location of an IP address.
+
+        Args:
+            ip_address: IPv4 or IPv6 address
+
+        Returns:
+            dict: ``country``, ``region`` and ``city`` (None when unknown)
+        """
+        if not self.available:
+            return dict(EMPTY_LOCATION)
+        try:
+            key = self.cache_key(ip_address)
+        except ValueError:
+            return dict(EMPTY_LOCATION)
+        return dict(self.cache.get_or_set(key, lambda _: self._lookup(ip_address)))
+
+    def _lookup(self, ip_address):
+        reader = self.reader
+        if reader is None:
+            return EMPTY_LOCATION
+        try:
+            geo = reader.city(ip_address)
+        except Exception:
+            return EMPTY_LOCATION
+        return {
+            "country": geo.country.name,
+            "region": geo.subdivisions.most_specific.name,
+            "city": geo.city.name,
+        }
+
+    def close(self):
+        with self._lock:
+            if self._reader is not None:
+                self._reader.close()
+            self._reader = None
+
+
+geoip = GeoIPService()
@@ -0,0 +1,252 @@
+"""
+Streaming detection of the hottest short links.
+
+Finding the links that are hot right now used to mean aggregating
+``UrlVisit``. Instead every redirect feeds the link id into a per-process
+Space-Saving summary: a fixed number of counters (``HOT_LINKS_CAPACITY``)
+that always holds every link receiving more than ``1 / capacity`` of the
+traffic, with a known upper bound on each count's overestimate.
+
+Every ``HOT_LINKS_PUBLISH_INTERVAL`` seconds a process merges its summary
+into a shared one stored in the cache backend and starts a fresh local
+summary. Shared counts decay with a half-life of ``HOT_LINKS_HALF_LIFE``
+seconds, so links that cool down drop out of the ranking.
+
+The shared ranking is shown in the admin (``UrlModel`` > Hot links), served
+as JSON for monitoring and used by the ``warm_hot_links`` task to keep the
+hottest links pinned in the link cache (see ``pin_hot_links``).
+"""
+
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+SUMMARY_KEY = "urlly:hot:summary"
+MERGE_LOCK_KEY = "urlly:hot:merge-lock"
+# Slug of every link pinned by the last ``pin_hot_links`` run, by id.
+PINNED_KEY = "urlly:hot:pinned"
+
+
+class SpaceSaving:
+    """
+    Space-Saving top-k summary (Metwally et al.).
+
+    Holds at most ``capacity`` items. An unseen item arriving when the
+    summary is full replaces the item with the smallest count and inherits
+    that count as its error, so ``count - error`` is a guaranteed lower
+    bound and ``count`` an upper bound on its true frequency.
+    """
+
+    def __init__(self, capacity, counts=None):
+        self.capacity = capacity
+        # item -> [count, error]
+        self.counts = {item: list(value) for item, value in (counts or {}).items()}
+
+    def __len__(self):
+        return len(self.counts)
+
+    def offer(self, item, amount=1):
+        entry = self.counts.get(item)
+        if entry is not None:
+            entry[0] += amount
+        elif len(self.counts) < self.capacity:
+            self.counts[item] = [amount, 0]
+        else:
+            victim = min(self.counts, key=lambda key: self.counts[key][0])
+            floor = self.counts.pop(victim)[0]
+            self.counts[item] = [floor + amount, floor]
+
+    def merge(self, other):
+        """
+        Add another summary's counts into this one, keeping the top items.
+        """
+        for item, (count, error) in other.counts.items():
+            entry = self.counts.setdefault(item, [0, 0])
+            entry[0] += count
+            entry[1] += error
+        self._truncate()
+
+    def decay(self, factor):
+        for entry in self.counts.values():
+            entry[0] *= factor
+            entry[1] *= factor
+
+    def _truncate(self):
+        if len(self.counts) > self.capacity:
+            kept = sorted(self.counts.items(), key=lambda kv: kv[1][0], reverse=True)
+            self.counts = dict(kept[: self.capacity])
+
+    def top(self, n=None):
+        """
+        Return ``[(item, count, error), ...]`` ordered by count, highest first.
+        """
+        ranked = sorted(self.counts.items(), key=lambda kv: kv[1][0], reverse=True)
+        return [(item, count, error) for item, (count, error) in ranked[:n]]
+
+
+class HotLinkTracker:
+    """
+    Per-process Space-Saving summary of clicked link ids, merged through the
+    cache backend.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.local = None
+        self.last_publish = time.monotonic()
+
+    def record(self, url_id):
+        """
+        Count a click on ``url_id``; publishes the local summary when due.
+        """
+        with self.lock:
+            if self.local is None:
+                self.local = SpaceSaving(settings.HOT_LINKS_CAPACITY)
+            self.local.offer(url_id)
+            due = (
+                time.monotonic() - self.last_publish
+                >= settings.HOT_LINKS_PUBLISH_INTERVAL
+            )
+        if due:
+            self.publish()
+
+    def publish(self):
+        """
+        Merge the local summary into the shared one and reset it.
+
+        Returns:
+            bool: False if another process is merging; the local counts are
+            kept and published next time.
+        """
+        with self.lock:
+            self.last_publish = time.monotonic()
+            local, self.local = self.local, None
+        if not local:
+            return True
+        if not cache.add(MERGE_LOCK_KEY, 1, 30):
+            with self.lock:
+                if self.local is not None:
+                    local.merge(self.local)
+                self.local = local
+            return False
+        try:
+            shared = load_summary()
+            shared.merge(local)
+            cache.set(
+                SUMMARY_KEY,
+                {"counts": shared.counts, "updated": time.time()},
+                timeout=None,
+            )
+        finally:
+            cache.delete(MERGE_LOCK_KEY)
+        return True
+
+
+def load_summary():
+    """
+    Return the shared summary, decayed to the current time.
+    """
+    data = cache.get(SUMMARY_KEY)
+    summary = SpaceSaving(settings.HOT_LINKS_CAPACITY, data and data["counts"])
+    if data:
+        elapsed = max(0.0, time.time() - data["updated"])
+        summary.decay(0.5 ** (elapsed / settings.HOT_LINKS_HALF_LIFE))
+    return summary
+
+
+def hot_links(limit=20):
+    """
+    Rank the hottest links across all processes.
+
+    Args:
+        limit: Number of links to return
+
+    Returns:
+        list: Dicts with ``id``, ``short_url``, ``original_url``, decayed
+        click ``score`` and its maximum overestimate ``error``, hottest
+        first. Links deleted since they were counted are left out.
+    """
+    from .models import UrlModel
+
+    ranked = load_summary().top(limit)
+    links = UrlModel.objects.in_bulk(
+        [url_id for url_id, _, _ in ranked], field_name="id"
+    )
+    return [
+        {
+            "id": url_id,
+            "short_url": links[url_id].short_url,
+            "original_url": links[url_id].original_url,
+            "score": round(count, 2),
+            "error": round(error, 2),
+        }
+        for url_id, count, error in ranked
+        if url_id in links
+    ]
+
+
+def _pinnable_rows(url_ids):
+    """
+    Return ``{id: (slug, cache entry)}`` of the links with these ids.
+    """
+    from .linkcache import LINK_FIELDS
+    from .models import UrlModel
+
+    rows = UrlModel.objects.filter(id__in=url_ids).values("short_url", *LINK_FIELDS)
+    return {row["id"]: (row.pop("short_url"), row) for row in rows}
+
+
+def pin_hot_links(count=None, timeout=None):
+    """
+    Write the hottest links into the link cache with a long timeout.
+
+    Args:
+        count: Number of links to pin (default ``HOT_LINKS_PIN_COUNT``)
+        timeout: Cache lifetime (default ``HOT_LINKS_PIN_TIMEOUT``)
+
+    Returns:
+        int: Number of links pinned
+
+    Run periodically (the ``warm_hot_links`` task), so a hot link's entry
+    is refreshed before it can expire and is never resolved from the
+    database while it stays hot. Saving or deleting a link still drops
+    its entry immediately (see ``urlLogic.signals``).
+
+    A save or delete that commits between the read and the write has
+    already dropped the entry, so the rows are read again after the write
+    and entries that no longer match are deleted; a change committed after
+    that second read drops the entry itself. Entries pinned by an earlier
+    run for links that have since been deleted or given a new slug are
+    deleted too (``PINNED_KEY`` remembers their slugs).
+    """
+    from .linkcache import link_cache_key
+
+    count = settings.HOT_LINKS_PIN_COUNT if count is None else count
+    timeout = timeout or settings.HOT_LINKS_PIN_TIMEOUT
+    ranked = [url_id for url_id, _, _ in load_summary().top(count)]
+    previous = cache.get(PINNED_KEY) or {}
+    url_ids = set(ranked) | set(previous)
+
+    rows = _pinnable_rows(url_ids)
+    written = {url_id: rows[url_id] for url_id in ranked if url_id in rows and rows[url_id][0]}
+    cache.set_many({link_cache_key(slug): entry for slug, entry in written.values()}, timeout)
+
+    current = _pinnable_rows(url_ids)
+    stale = {
+        slug for url_id, (slug, entry) in written.items() if current.get(url_id) != (slug, entry)
+    }
+    stale.update(
+        slug
+        for url_id, slug in previous.items()
+        if url_id not in current or current[url_id][0] != slug
+    )
+    cache.delete_many([link_cache_key(slug) for slug in stale])
+
+    pinned = {url_id: slug for url_id, (slug, _) in written.items() if slug not in stale}
+    cache.set(PINNED_KEY, pinned, timeout)
+    return len(pinned)
+
+
+hot_link_tracker = HotLinkTracker()
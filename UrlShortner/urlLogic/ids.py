@@ -0,0 +1,191 @@
+"""
+Primary key allocation ahead of the INSERT.
+
+Generated slugs are Hashids of the row's primary key, so creating a link
+used to take two writes: insert the row to learn its ``pk``, then update
+it with the slug (a second index update and, for ``UrlModel``, a full-row
+UPDATE). ``IdAllocator`` hands out primary keys before the row exists, so
+the slug is known up front and ``create_link`` writes the row with a
+single INSERT.
+
+Keys come from the table's own sequence, so rows inserted elsewhere (the
+admin, fixtures) keep getting unique keys from the database:
+
+- PostgreSQL: ``ID_BLOCK_SIZE`` values are fetched at once with
+  ``nextval()`` over ``generate_series`` and served from memory until the
+  block is used up. ``nextval`` is never rolled back, so a block survives
+  failed transactions.
+- SQLite: the table's ``sqlite_sequence`` counter is advanced by a block
+  (hi/lo). Outside a transaction the block is committed and served from
+  memory; inside one the counter is advanced by one key at a time,
+  because rolling the transaction back would also give the block back
+  while this process still held it. ``create_link`` is a single statement,
+  so callers need no transaction around it.
+
+Other databases get no key in advance; ``create_link`` then falls back to
+inserting first and setting the slug afterwards.
+
+With ``SLUG_GENERATOR = "snowflake"`` keys are Snowflake ids instead
+(``urlLogic.snowflake``), made up by each process without any database
+round trip, on every database. Rows inserted without an explicit key
+still take the sequence's next value, which stays far below the Snowflake
+range on PostgreSQL. SQLite moves its counter past the largest key used,
+so there keep to one scheme per database.
+
+Keys served from a block are unique but not ordered across processes, and
+keys a process never used leave gaps. Neither matters for links: they are
+ordered by ``created_at``, slugs only need to be unique and the slug filter
+catches up on new rows by ``created_at`` too (see ``urlLogic.bloom``).
+"""
+
+import threading
+
+from django.conf import settings
+from django.db import connections, router, transaction
+
+from .utils import SlugGenerator
+
+slugs = SlugGenerator()
+
+
+class IdAllocator:
+    """
+    Per-process source of primary keys for one model.
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self.lock = threading.Lock()
+        self.block = []
+        self.sequence = None
+
+    @property
+    def connection(self):
+        return connections[router.db_for_write(self.model)]
+
+    def supported(self):
+        return self.connection.vendor in ("postgresql", "sqlite")
+
+    def allocate(self, count=1):
+        """
+        Reserve ``count`` primary keys.
+
+        Returns:
+            list | None: The keys, or None if the database offers no way
+            to reserve them
+        """
+        connection = self.connection
+        if connection.vendor == "sqlite" and connection.in_atomic_block:
+            return self._reserve_sqlite(count)
+        if not self.supported():
+            return None
+        with self.lock:
+            if len(self.block) < count:
+                size = max(count - len(self.block), settings.ID_BLOCK_SIZE)
+                self.block.extend(self._reserve(size))
+            taken, self.block = self.block[:count], self.block[count:]
+            return taken
+
+    def reset(self):
+        """
+        Forget the keys held in memory (they are never handed out).
+        """
+        with self.lock:
+            self.block = []
+
+    def _reserve(self, size):
+        if self.connection.vendor == "postgresql":
+            return self._reserve_postgresql(size)
+        return self._reserve_sqlite(size)
+
+    def _reserve_postgresql(self, size):
+        connection = self.connection
+        table = self.model._meta.db_table
+        column = self.model._meta.pk.column
+        with connection.cursor() as cursor:
+            if self.sequence is None:
+                cursor.execute(
+                    "SELECT pg_get_serial_sequence(%s, %s)",
+                    [connection.ops.quote_name(table), column],
+                )
+                self.sequence = cursor.fetchone()[0]
+            cursor.execute(
+                "SELECT nextval(%s) FROM generate_series(1, %s)",
+                [self.sequence, size],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+    def _reserve_sqlite(self, size):
+        connection = self.connection
+        table = self.model._meta.db_table
+        pk = connection.ops.quote_name(self.model._meta.pk.column)
+        with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+            cursor.execute(
+                "UPDATE sqlite_sequence SET seq = seq + %s WHERE name = %s",
+                [size, table],
+            )
+            if cursor.rowcount == 0:
+                # No row has been inserted yet, so there is no counter row.
+                cursor.execute(
+                    f"INSERT INTO sqlite_sequence (name, seq) "
+                    f"SELECT %s, COALESCE(MAX({pk}), 0) + %s "
+                    f"FROM {connection.ops.quote_name(table)}",
+                    [table, size],
+                )
+            cursor.execute("SELECT seq FROM sqlite_sequence WHERE name = %s", [table])
+            high = cursor.fetchone()[0]
+        return list(range(high - size + 1, high + 1))
+
+
+_allocators = {}
+_allocators_lock = threading.Lock()
+
+
+def allocator_for(model):
+    """
+    Return the process-wide ``IdAllocator`` of ``model``.
+    """
+    with _allocators_lock:
+        allocator = _allocators.get(model._meta.label)
+        if allocator is None:
+            allocator = _allocators[model._meta.label] = IdAllocator(model)
+        return allocator
+
+
+def allocate_ids(model, count):
+    """
+    Reserve ``count`` primary keys of ``model``, or return None if the
+    database cannot reserve them.
+
+    With ``SLUG_GENERATOR = "snowflake"`` the keys are Snowflake ids made up
+    in-process and the database is not involved.
+    """
+    if slugs.coordination_free:
+        return [slugs.new_id() for _ in range(count)]
+    return allocator_for(model).allocate(count)
+
+
+def create_link(model, slug_field, slug=None, **fields):
+    """
+    Create a link whose slug is either ``slug`` or generated from its key.
+
+    Args:
+        model: ``UrlModel`` or ``ShortUrlAnonymous``
+        slug_field: Name of the model's slug field
+        slug: Custom slug; generated from the primary key when empty
+        **fields: Other field values
+
+    Returns:
+        The created instance, written with a single INSERT (two writes on
+        databases where keys cannot be reserved)
+    """
+    if slug:
+        return model.objects.create(**{slug_field: slug}, **fields)
+    ids = allocate_ids(model, 1)
+    if ids is None:
+        with transaction.atomic(using=router.db_for_write(model)):
+            instance = model.objects.create(**fields)
+            setattr(instance, slug_field, slugs.encode_url(instance.pk))
+            instance.save(update_fields=[slug_field])
+        return instance
+    return model.objects.create(pk=ids[0], **{slug_field: slugs.encode_url(ids[0])}, **fields)
@@ -0,0 +1,250 @@
+"""
+Read-through cache for short link resolution.
+
+The redirect views only need a few facts about a link: its primary key,
+its destination, its expiry and its redirect policy. This module keeps exactly those fields in
+the configured Django cache backend, keyed by slug, so that a hot link is
+resolved without touching the database. Anonymous links
+(``ShortUrlAnonymous``) are cached the same way, keyed by short code.
+
+Every lookup has an ``a``-prefixed async twin using the async cache and
+ORM APIs, for the ASGI redirect views.
+
+Entries are stored under a versioned key. Bump ``LINK_CACHE_VERSION`` when
+the cached payload changes shape so that stale entries written by older
+code are simply ignored instead of being misread.
+
+Slugs that match nothing are cached too, as a ``False`` marker kept for
+only ``NEGATIVE_LINK_CACHE_TIMEOUT`` seconds, so typo'd, scanned and
+bot-probed slugs stop costing a query each.
+
+Before querying for an uncached slug, the Bloom filter of existing short
+codes (``urlLogic.bloom``) is consulted; slugs it has never seen are
+answered as missing without a query.
+
+Generated slugs encode the row's primary key (as Hashids or, with
+``SLUG_GENERATOR = "snowflake"``, in base62), so they are decoded
+and fetched by primary key instead of through the ``short_url`` index. A
+slug that does not decode is a custom alias or a code from the slug pool
+(``urlLogic.slugpool``) and is looked up by ``short_url``. Anonymous codes
+are generated or pooled, so they are always letters and digits; other
+codes are rejected before any query.
+
+Lookups are reported to the request metrics (``urlLogic.metrics``) as
+hits or misses of the "link" cache; a negative entry counts as a hit.
+
+Invalidation is driven from the write path (see ``urlLogic.signals``): any
+save or delete of a ``UrlModel`` or ``ShortUrlAnonymous`` drops the cached
+entry (positive or negative) once the surrounding transaction commits, so
+creating a link immediately clears a cached miss for its slug.
+"""
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+
+from .bloom import slug_filter
+from .metrics import note_cache
+from .utils import SlugGenerator
+
+LINK_CACHE_VERSION = 3
+# Cached in place of the payload for slugs that match no link.
+MISSING = False
+LINK_FIELDS = ("id", "original_url", "expires_at", "redirect_type", "cache_max_age")
+ANONYMOUS_LINK_FIELDS = ("original_url",)
+
+slugs = SlugGenerator()
+
+
+def link_cache_key(slug):
+    """
+    Build the cache key for a short link slug.
+
+    Args:
+        slug: The short URL slug
+
+    Returns:
+        str: Versioned cache key for the slug
+    """
+    return f"urlly:link:v{LINK_CACHE_VERSION}:{slug}"
+
+
+def anonymous_link_cache_key(short_code):
+    """
+    Build the cache key for an anonymous short code.
+    """
+    return f"urlly:anonlink:v{LINK_CACHE_VERSION}:{short_code}"
+
+
+def _store(key, link):
+    if link is None:
+        cache.set(key, MISSING, settings.NEGATIVE_LINK_CACHE_TIMEOUT)
+    else:
+        cache.set(key, link, settings.LINK_CACHE_TIMEOUT)
+
+
+async def _astore(key, link):
+    if link is None:
+        await cache.aset(key, MISSING, settings.NEGATIVE_LINK_CACHE_TIMEOUT)
+    else:
+        await cache.aset(key, link, settings.LINK_CACHE_TIMEOUT)
+
+
+# The filter may query the database (first build, refresh) or Redis, so it
+# runs on the same thread as the async ORM calls.
+_amight_exist = sync_to_async(slug_filter.might_exist)
+
+
+def _fetch_link(slug):
+    from .models import UrlModel
+
+    pk = slugs.decode_pk(slug)
+    if pk is not None:
+        # The row must still carry this slug: a decodable custom alias may
+        # point at a different row than the one its number names.
+        link = UrlModel.objects.filter(pk=pk, short_url=slug).values(*LINK_FIELDS).first()
+        if link is not None:
+            return link
+    return UrlModel.objects.filter(short_url=slug).values(*LINK_FIELDS).first()
+
+
+async def _afetch_link(slug):
+    from .models import UrlModel
+
+    pk = slugs.decode_pk(slug)
+    if pk is not None:
+        link = await (
+            UrlModel.objects.filter(pk=pk, short_url=slug).values(*LINK_FIELDS).afirst()
+        )
+        if link is not None:
+            return link
+    return await UrlModel.objects.filter(short_url=slug).values(*LINK_FIELDS).afirst()
+
+
+def get_link(slug):
+    """
+    Resolve a slug to the fields needed for a redirect.
+
+    Args:
+        slug: The short URL slug
+
+    Returns:
+        dict | None: The ``LINK_FIELDS`` of the link, or None if no link
+        uses this slug.
+
+    Served from the cache when possible; slugs the Bloom filter rules out
+    return None directly. Otherwise the row is read with a narrow
+    ``values()`` query, by primary key for generated slugs, and written
+    back to the cache (including the fact that it does not exist).
+    """
+    key = link_cache_key(slug)
+    link = cache.get(key)
+    note_cache("link", link is not None)
+    if link is not None:
+        return link or None
+    if not slug_filter.might_exist(slug, "urlLogic.UrlModel"):
+        return None
+
+    link = _fetch_link(slug)
+    _store(key, link)
+    return link
+
+
+async def aget_link(slug):
+    """
+    Async version of ``get_link``.
+    """
+    key = link_cache_key(slug)
+    link = await cache.aget(key)
+    note_cache("link", link is not None)
+    if link is not None:
+        return link or None
+    if not await _amight_exist(slug, "urlLogic.UrlModel"):
+        return None
+
+    link = await _afetch_link(slug)
+    await _astore(key, link)
+    return link
+
+
+def _fetch_anonymous_link(short_code):
+    from .models import ShortUrlAnonymous
+
+    links = ShortUrlAnonymous.objects.values(*ANONYMOUS_LINK_FIELDS)
+    pk = slugs.decode_pk(short_code)
+    if pk is not None:
+        link = links.filter(pk=pk, short_code=short_code).first()
+        if link is not None:
+            return link
+    return links.filter(short_code=short_code).first()
+
+
+async def _afetch_anonymous_link(short_code):
+    from .models import ShortUrlAnonymous
+
+    links = ShortUrlAnonymous.objects.values(*ANONYMOUS_LINK_FIELDS)
+    pk = slugs.decode_pk(short_code)
+    if pk is not None:
+        link = await links.filter(pk=pk, short_code=short_code).afirst()
+        if link is not None:
+            return link
+    return await links.filter(short_code=short_code).afirst()
+
+
+def get_anonymous_link(short_code):
+    """
+    Resolve an anonymous short code to ``{"original_url"}``, or None.
+    """
+    if not (short_code.isascii() and short_code.isalnum()):
+        return None
+
+    key = anonymous_link_cache_key(short_code)
+    link = cache.get(key)
+    note_cache("link", link is not None)
+    if link is not None:
+        return link or None
+    if not slug_filter.might_exist(short_code, "urlLogic.ShortUrlAnonymous"):
+        return None
+
+    link = _fetch_anonymous_link(short_code)
+    _store(key, link)
+    return link
+
+
+async def aget_anonymous_link(short_code):
+    """
+    Async version of ``get_anonymous_link``.
+    """
+    if not (short_code.isascii() and short_code.isalnum()):
+        return None
+
+    key = anonymous_link_cache_key(short_code)
+    link = await cache.aget(key)
+    note_cache("link", link is not None)
+    if link is not None:
+        return link or None
+    if not await _amight_exist(short_code, "urlLogic.ShortUrlAnonymous"):
+        return None
+
+    link = await _afetch_anonymous_link(short_code)
+    await _astore(key, link)
+    return link
+
+
+def invalidate_link(slug):
+    """
+    Drop the cached entry for a slug.
+
+    Args:
+        slug: The short URL slug; empty values are ignored
+    """
+    if slug:
+        cache.delete(link_cache_key(slug))
+
+
+def invalidate_anonymous_link(short_code):
+    """
+    Drop the cached entry for an anonymous short code.
+    """
+    if short_code:
+        cache.delete(anonymous_link_cache_key(short_code))
@@ -0,0 +1,85 @@
+"""
+Thread-safe, size-bounded LRU cache with hit/miss/eviction counters.
+
+Used to memoize expensive, highly repetitive lookups (user agent parsing,
+GeoIP) inside a single process. Each web process and Celery worker keeps
+its own instance; nothing here is shared between processes.
+"""
+
+import threading
+from collections import OrderedDict
+
+_MISSING = object()
+
+
+class LRUCache:
+    """
+    Least-recently-used cache holding at most ``maxsize`` entries.
+
+    Attributes:
+        maxsize: Maximum number of entries kept
+        hits: Lookups answered from the cache
+        misses: Lookups that had to compute the value
+        evictions: Entries dropped to stay within ``maxsize``
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None):
+        with self._lock:
+            value = self._data.get(key, _MISSING)
+            if value is _MISSING:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def get_or_set(self, key, compute):
+        """
+        Return the cached value for ``key``, computing and storing it on a miss.
+
+        ``compute`` runs outside the lock, so two threads missing on the same
+        key at once may both compute it; the result is identical either way.
+        """
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            value = compute(key)
+            self.set(key, value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    def stats(self):
+        """
+        Return the current counters as a dict.
+        """
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
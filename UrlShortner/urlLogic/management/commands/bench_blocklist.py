@@ -0,0 +1,134 @@
+"""
+Benchmark URL validation against domain blocklists of growing size.
+
+For each ``--sizes`` entry a list of random domains is generated and
+loaded into a ``SuffixSet``; ``validate_url_format_and_blacklist`` is then
+timed on a mix of allowed URLs and URLs on blocked subdomains, along with
+the blocklist lookup alone. The old substring loop (``blocked in domain``
+for every entry) is timed too, on up to 1,000 hosts and lists of up to
+``--legacy-max`` entries, for comparison. Build time and the memory held
+by the set are reported for each size.
+
+Usage:
+    python manage.py bench_blocklist --sizes 1000 10000 100000 1000000
+"""
+
+import random
+import string
+import time
+import tracemalloc
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+
+from urlLogic.benchmarks import Stopwatch, throughput, write_results
+from urlLogic.blocklist import SuffixSet, domain_blocklist
+from urlLogic.models import validate_url_format_and_blacklist
+
+TLDS = ("com", "net", "org", "io", "xyz", "top", "co.uk", "info")
+
+
+def random_domain(rng):
+    labels = rng.randint(1, 3)
+    name = ".".join(
+        "".join(rng.choices(string.ascii_lowercase + string.digits, k=rng.randint(4, 12)))
+        for _ in range(labels)
+    )
+    return f"{name}.{rng.choice(TLDS)}"
+
+
+class Command(BaseCommand):
+    help = "Measure URL validation cost as the domain blocklist grows."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--sizes", type=int, nargs="+", default=[1000, 10000, 100000, 1000000]
+        )
+        parser.add_argument("--urls", type=int, default=20000, help="URLs validated per size")
+        parser.add_argument(
+            "--blocked-ratio", type=float, default=0.1, help="Share of URLs on the list"
+        )
+        parser.add_argument(
+            "--legacy-max",
+            type=int,
+            default=10000,
+            help="Largest list also timed with the old substring loop",
+        )
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--output", help="Write results as JSON to this path")
+
+    def handle(self, *args, **options):
+        results = [self.run(size, options) for size in options["sizes"]]
+        for result in results:
+            legacy = result.get("legacy_us_per_url")
+            self.stdout.write(
+                f"{result['entries']:>9,} entries: {result['us_per_url']:.2f} us/url "
+                f"({result['urls_per_sec']:,.0f} urls/s, lookup {result['lookup_us']:.2f} us), "
+                f"build {result['build_seconds']:.2f}s, "
+                f"{result['memory_mb']:.1f} MB"
+                + (f", substring loop {legacy:.1f} us/url" if legacy is not None else "")
+            )
+        if options["output"]:
+            write_results(options["output"], {"parameters": options, "results": results})
+
+    def run(self, size, options):
+        rng = random.Random(options["seed"])
+        domains = [random_domain(rng) for _ in range(size)]
+
+        with Stopwatch() as build:
+            entries = SuffixSet(domains)
+        tracemalloc.start()
+        copy = SuffixSet(domains)
+        memory = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        del copy
+
+        urls = []
+        for _ in range(options["urls"]):
+            if rng.random() < options["blocked_ratio"]:
+                host = f"www.{rng.choice(domains)}"
+            else:
+                host = f"www.{random_domain(rng)}"
+            urls.append(f"https://{host}/path?q=1")
+
+        # Install the generated list as if it had been loaded from a file.
+        with override_settings(BLOCKLIST_RELOAD_INTERVAL=10**9):
+            domain_blocklist.entries, domain_blocklist.last_check = entries, time.monotonic()
+            try:
+                blocked, elapsed = self.validate(urls)
+            finally:
+                domain_blocklist.entries = None
+
+        hosts = [url.split("/")[2] for url in urls]
+        with Stopwatch() as lookups:
+            for host in hosts:
+                entries.match(host)
+
+        result = {
+            "entries": len(entries),
+            "build_seconds": build.elapsed,
+            "memory_mb": memory / 2**20,
+            "urls": len(urls),
+            "blocked": blocked,
+            "us_per_url": elapsed / len(urls) * 1e6,
+            "urls_per_sec": throughput(len(urls), elapsed),
+            "lookup_us": lookups.elapsed / len(hosts) * 1e6,
+        }
+        if size <= options["legacy_max"]:
+            sample = hosts[:1000]
+            with Stopwatch() as legacy:
+                for host in sample:
+                    any(entry in host for entry in domains)
+            result["legacy_us_per_url"] = legacy.elapsed / len(sample) * 1e6
+        return result
+
+    def validate(self, urls):
+        blocked = 0
+        with Stopwatch() as timer:
+            for url in urls:
+                try:
+                    validate_url_format_and_blacklist(url)
+                except ValidationError:
+                    blocked += 1
+        return blocked, timer.elapsed
@@ -0,0 +1,85 @@
+"""
+Benchmark the redirect fast path against the full middleware stack.
+
+Requests ``/u/<slug>/`` through the Django test client, once with the
+project's ``MIDDLEWARE`` and once with ``RedirectFastPathMiddleware``
+removed, for both anonymous and logged-in visitors. The link is cached and
+click/visit flushing is deferred, so the difference is the per-request
+cost of the middleware that the fast path skips.
+
+Usage:
+    python manage.py bench_redirect_middleware --requests 5000
+"""
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.test import Client, override_settings
+
+from urlLogic.benchmarks import benchmark_database, measure, write_results
+
+FAST_PATH = "urlLogic.middleware.RedirectFastPathMiddleware"
+
+
+class Command(BaseCommand):
+    help = "Measure per-request overhead removed by the redirect fast path."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=2000)
+        parser.add_argument("--output", help="Write results as JSON to this path")
+
+    def handle(self, *args, **options):
+        with benchmark_database(), override_settings(
+            ALLOWED_HOSTS=["testserver"],
+            CLICK_FLUSH_INTERVAL=3600,
+            VISIT_MAX_LATENCY=3600,
+            BLOOM_FILTER_ENABLED=False,
+        ):
+            results = self.run(options["requests"])
+
+        for name, result in results.items():
+            self.stdout.write(
+                f"{name:>22}: p50 {result['p50_ms']:.3f} ms, "
+                f"p99 {result['p99_ms']:.3f} ms, "
+                f"{result['requests_per_sec']:,.0f} req/s, "
+                f"{result['queries_per_request']:.1f} queries/request"
+            )
+        for visitor in ("anonymous", "logged_in"):
+            saved = (
+                results[f"{visitor}_full_stack"]["mean_ms"]
+                - results[f"{visitor}_fast_path"]["mean_ms"]
+            )
+            self.stdout.write(f"{visitor:>10} overhead removed: {saved * 1000:.0f} us/request")
+
+        if options["output"]:
+            write_results(options["output"], results)
+
+    def run(self, requests):
+        from urlLogic.linkcache import get_link
+        from urlLogic.models import UrlModel
+
+        user = get_user_model().objects.create_user(
+            email="bench@example.com", username="bench", password="bench", is_active=True
+        )
+        UrlModel.objects.create(
+            original_url="https://example.com/", short_url="bench1", user=user
+        )
+        get_link("bench1")
+
+        full_stack = [m for m in settings.MIDDLEWARE if m != FAST_PATH]
+        results = {}
+        for visitor in ("anonymous", "logged_in"):
+            for mode, middleware in (
+                ("full_stack", full_stack),
+                ("fast_path", [*full_stack[:1], FAST_PATH, *full_stack[1:]]),
+            ):
+                with override_settings(MIDDLEWARE=middleware):
+                    client = Client()
+                    if visitor == "logged_in":
+                        client.force_login(user)
+                    results[f"{visitor}_{mode}"] = self.measure(client, requests)
+        return results
+
+    def measure(self, client, requests):
+        client.get("/u/bench1/")  # Build the middleware chain.
+        return measure(lambda _: client.get("/u/bench1/"), requests)
@@ -0,0 +1,74 @@
+"""
+Benchmark the two slug schemes: Hashids and Snowflake/base62.
+
+For each scheme ``--count`` ids are generated (Hashids: consecutive keys
+starting at ``--start``, as the sequence hands them out; Snowflake: ids
+from a generator, which is itself timed), encoded to slugs and decoded
+back with ``SlugGenerator.decode_pk``, the call every redirect makes.
+Reported per scheme: encode and decode throughput, id generation rate and
+the shortest and longest slug.
+
+Usage:
+    python manage.py bench_slugs
+    python manage.py bench_slugs --count 500000 --start 10000000 --output slugs.json
+"""
+
+from django.core.management.base import BaseCommand
+
+from urlLogic.benchmarks import Stopwatch, throughput, write_results
+from urlLogic.snowflake import Snowflake, epoch_ms
+from urlLogic.utils import SlugGenerator
+
+
+class Command(BaseCommand):
+    help = "Measure slug encode/decode throughput of Hashids and Snowflake ids."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--count", type=int, default=200000, help="Slugs per scheme")
+        parser.add_argument(
+            "--start", type=int, default=1, help="First Hashids key (slug length grows with it)"
+        )
+        parser.add_argument("--output", help="Write results as JSON to this path")
+
+    def handle(self, *args, **options):
+        count = options["count"]
+        results = {}
+
+        generator = Snowflake(0, epoch_ms("2025-01-01"))
+        with Stopwatch() as generate:
+            snowflake_ids = [generator.next_id() for _ in range(count)]
+        results["snowflake"] = self.run(SlugGenerator("snowflake"), snowflake_ids)
+        results["snowflake"]["ids_per_sec"] = throughput(count, generate.elapsed)
+
+        start = options["start"]
+        results["hashids"] = self.run(SlugGenerator("hashids"), range(start, start + count))
+
+        for scheme, result in results.items():
+            self.stdout.write(
+                f"{scheme:>9}: encode {result['encode_per_sec']:,.0f}/s, "
+                f"decode {result['decode_per_sec']:,.0f}/s, "
+                f"length {result['min_length']}-{result['max_length']}"
+                + (
+                    f", ids {result['ids_per_sec']:,.0f}/s"
+                    if "ids_per_sec" in result
+                    else ""
+                )
+            )
+        if options["output"]:
+            write_results(options["output"], {"parameters": options, "results": results})
+
+    def run(self, slugs, ids):
+        with Stopwatch() as encode:
+            encoded = [slugs.encode_url(pk) for pk in ids]
+        with Stopwatch() as decode:
+            decoded = [slugs.decode_pk(slug) for slug in encoded]
+        if decoded != list(ids):
+            self.stderr.write(f"{slugs.scheme}: some slugs did not decode to their id")
+        lengths = list(map(len, encoded))
+        return {
+            "count": len(encoded),
+            "encode_per_sec": throughput(len(encoded), encode.elapsed),
+            "decode_per_sec": throughput(len(encoded), decode.elapsed),
+            "min_length": min(lengths),
+            "max_length": max(lengths),
+        }
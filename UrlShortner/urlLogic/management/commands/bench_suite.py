@@ -0,0 +1,182 @@
+"""
+Reproducible benchmark of the main request paths.
+
+Seeds a throwaway database with ``--links`` links (plus as many anonymous
+links) and ``--visits`` visits, then drives these views through the Django
+test client:
+
+- ``redirect_url``: ``/u/<slug>/`` with Zipf-like popularity, every link
+  requested once beforehand so the link cache is warm
+- ``redirect_url_cold``: the same with the cache cleared before each request
+- ``redirect_to_original``: ``/s/<code>/`` for anonymous links, warm cache
+- ``make_short_url``: logged-in POST creating a new link
+- ``analytics_dashboard``: logged-in dashboard of a seeded link; the
+  ``cache_page`` entry is cleared before each request
+
+Each scenario reports p50/p95/p99 latency, throughput and SQL queries per
+request. Runs only need the local database (SQLite or Postgres) and the
+cache configured in settings; Celery tasks run eagerly and e-mail goes to
+memory. Data and request order are generated from ``--seed``, so results
+written with ``--output`` can be compared between runs.
+
+Usage:
+    python manage.py bench_suite --links 1000 --visits 20000 --output bench.json
+    python manage.py bench_suite --scenarios redirect_url analytics_dashboard
+"""
+
+import platform
+import random
+import time
+from collections import Counter
+
+import django
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from urlLogic.benchmarks import (
+    benchmark_database,
+    measure,
+    seed_anonymous_links,
+    seed_links,
+    seed_visits,
+    write_results,
+)
+
+SCENARIOS = (
+    "redirect_url",
+    "redirect_url_cold",
+    "redirect_to_original",
+    "make_short_url",
+    "analytics_dashboard",
+)
+
+
+class Command(BaseCommand):
+    help = "Benchmark redirect, creation and analytics views on seeded data."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--links", type=int, default=1000)
+        parser.add_argument("--visits", type=int, default=20000)
+        parser.add_argument(
+            "--requests", type=int, default=500, help="Requests per scenario"
+        )
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument(
+            "--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS)
+        )
+        parser.add_argument("--output", help="Write results as JSON to this path")
+
+    def handle(self, *args, **options):
+        if options["links"] < 1:
+            raise CommandError("--links must be at least 1.")
+
+        with benchmark_database(), override_settings(ALLOWED_HOSTS=["testserver"]):
+            cache.clear()
+            started = time.perf_counter()
+            self.seed(options["links"], options["visits"], options["seed"])
+            seed_seconds = time.perf_counter() - started
+            self.stdout.write(
+                f"Seeded {options['links']} links and {options['visits']} visits "
+                f"in {seed_seconds:.1f}s ({connection.vendor})"
+            )
+            scenarios = {
+                name: self.run_scenario(name, options["requests"], options["seed"])
+                for name in options["scenarios"]
+            }
+
+        for name, result in scenarios.items():
+            self.stdout.write(
+                f"{name:>21}: p50 {result['p50_ms']:.3f} ms, "
+                f"p95 {result['p95_ms']:.3f} ms, p99 {result['p99_ms']:.3f} ms, "
+                f"{result['requests_per_sec']:,.0f} req/s, "
+                f"{result['queries_per_request']:.2f} queries/request"
+            )
+
+        if options["output"]:
+            write_results(
+                options["output"],
+                {
+                    "parameters": {
+                        key: options[key]
+                        for key in ("links", "visits", "requests", "seed")
+                    },
+                    "environment": {
+                        "database": connection.vendor,
+                        "django": django.get_version(),
+                        "python": platform.python_version(),
+                        "platform": platform.platform(),
+                    },
+                    "seed_seconds": round(seed_seconds, 3),
+                    "scenarios": scenarios,
+                },
+            )
+
+    def seed(self, links, visits, seed):
+        self.user = get_user_model().objects.create_user(
+            email="bench@example.com", username="bench", password="bench", is_active=True
+        )
+        self.links = seed_links(self.user, links, seed=seed)
+        self.anonymous = seed_anonymous_links(links, seed=seed)
+        seed_visits([link.pk for link in self.links], visits, seed=seed)
+
+    def popular(self, items, requests, seed):
+        """
+        Pick ``requests`` items with 1/rank popularity, like real traffic.
+        """
+        rng = random.Random(seed)
+        weights = [1 / rank for rank in range(1, len(items) + 1)]
+        return rng.choices(items, weights=weights, k=requests)
+
+    def run_scenario(self, name, requests, seed):
+        client = Client()
+        statuses = Counter()
+        before = None
+
+        def get(path):
+            statuses[client.get(path).status_code] += 1
+
+        if name in ("redirect_url", "redirect_url_cold"):
+            paths = [
+                reverse("u:redirect_url", args=[link.short_url])
+                for link in self.popular(self.links, requests, seed)
+            ]
+            send = lambda i: get(paths[i])  # noqa: E731
+            if name == "redirect_url_cold":
+                before = lambda i: cache.clear()  # noqa: E731
+        elif name == "redirect_to_original":
+            paths = [
+                reverse("redirect", args=[link.short_code])
+                for link in self.popular(self.anonymous, requests, seed)
+            ]
+            send = lambda i: get(paths[i])  # noqa: E731
+        elif name == "make_short_url":
+            client.force_login(self.user)
+            path = reverse("u:make_short_url")
+
+            def send(i):
+                response = client.post(
+                    path, {"long_url": f"https://bench.example.com/new/{seed}/{i}"}
+                )
+                statuses[response.status_code] += 1
+
+        else:
+            client.force_login(self.user)
+            paths = [
+                reverse("u:analytics_dashboard", args=[link.pk])
+                for link in self.popular(self.links, requests, seed)
+            ]
+            send = lambda i: get(paths[i])  # noqa: E731
+            before = lambda i: cache.clear()  # noqa: E731
+
+        send(-1)  # Build the middleware chain and warm per-process caches.
+        if name in ("redirect_url", "redirect_to_original"):
+            for path in set(paths):
+                get(path)
+        statuses.clear()
+        result = measure(send, requests, before)
+        result["status_codes"] = {str(code): n for code, n in sorted(statuses.items())}
+        return result
@@ -0,0 +1,70 @@
+"""
+Benchmark user agent parsing with and without the LRU memo cache.
+
+Replays a skewed user agent distribution (a few popular agents plus a long
+tail of rare builds) through ``utils.parse_user_agent``.
+
+Usage:
+    python manage.py bench_ua_cache --requests 50000 --cache-size 4096
+"""
+
+from django.core.management.base import BaseCommand
+
+from urlLogic.benchmarks import (
+    Stopwatch,
+    generate_user_agents,
+    throughput,
+    write_results,
+)
+from urlLogic.lru import LRUCache
+from urlLogic import utils
+
+
+class Command(BaseCommand):
+    help = "Compare uncached and memoized user agent parsing throughput."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=20000)
+        parser.add_argument("--cache-size", type=int, default=4096)
+        parser.add_argument("--tail-ratio", type=float, default=0.05)
+        parser.add_argument("--output", help="Write results as JSON to this path")
+
+    def handle(self, *args, **options):
+        agents = generate_user_agents(options["requests"], options["tail_ratio"])
+
+        with Stopwatch() as uncached:
+            for ua in agents:
+                utils._parse_user_agent(ua)
+
+        cache = LRUCache(maxsize=options["cache_size"])
+        with Stopwatch() as cached:
+            for ua in agents:
+                cache.get_or_set(ua, utils._parse_user_agent)
+
+        results = {
+            "requests": len(agents),
+            "distinct_agents": len(set(agents)),
+            "uncached": {
+                "seconds": uncached.elapsed,
+                "parses_per_sec": throughput(len(agents), uncached.elapsed),
+            },
+            "cached": {
+                "seconds": cached.elapsed,
+                "parses_per_sec": throughput(len(agents), cached.elapsed),
+                **cache.stats(),
+            },
+            "speedup": uncached.elapsed / cached.elapsed,
+        }
+
+        self.stdout.write(
+            f"uncached: {results['uncached']['parses_per_sec']:,.0f} parses/sec"
+        )
+        self.stdout.write(
+            f"  cached: {results['cached']['parses_per_sec']:,.0f} parses/sec "
+            f"(hit ratio {results['cached']['hit_ratio']:.1%}, "
+            f"{results['cached']['evictions']} evictions)"
+        )
+        self.stdout.write(f" speedup: {results['speedup']:.1f}x")
+
+        if options["output"]:
+            write_results(options["output"], results)
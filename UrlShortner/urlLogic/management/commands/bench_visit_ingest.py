@@ -0,0 +1,101 @@
+"""
+Benchmark visit ingestion: one insert per click vs. micro-batched bulk inserts.
+
+Usage:
+    python manage.py bench_visit_ingest --visits 20000 --batch-size 500
+"""
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from urlLogic.benchmarks import (
+    Stopwatch,
+    benchmark_database,
+    generate_visits,
+    throughput,
+    write_results,
+)
+
+
+class Command(BaseCommand):
+    help = "Compare per-click and batched UrlVisit ingestion throughput."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--visits", type=int, default=5000)
+        parser.add_argument("--links", type=int, default=50)
+        parser.add_argument("--batch-size", type=int, default=500)
+        parser.add_argument("--output", help="Write results as JSON to this path")
+
+    def handle(self, *args, **options):
+        with benchmark_database():
+            results = self.run(options)
+
+        for name in ("per_click", "batched"):
+            self.stdout.write(
+                f"{name:>10}: {results[name]['visits_per_sec']:,.0f} visits/sec "
+                f"({results[name]['seconds']:.2f}s)"
+            )
+        self.stdout.write(f"   speedup: {results['speedup']:.1f}x")
+
+        if options["output"]:
+            write_results(options["output"], results)
+
+    def run(self, options):
+        from django.test import override_settings
+
+        from urlLogic.models import UrlModel, UrlVisit
+        from urlLogic.visits import LocalVisitBuffer, write_visits
+
+        user = get_user_model().objects.create_user(
+            email="bench@example.com", username="bench", password="bench"
+        )
+        url_ids = [
+            UrlModel.objects.create(
+                original_url=f"https://example.com/{i}", short_url=f"b{i}", user=user
+            ).pk
+            for i in range(options["links"])
+        ]
+        visits = generate_visits(url_ids, options["visits"])
+        now = timezone.now().isoformat()
+        for visit in visits:
+            visit["timestamp"] = now
+
+        # Before: what each save_url_visit_data message used to do.
+        with Stopwatch() as before:
+            for visit in visits:
+                url = UrlModel.objects.get(id=visit["url_id"])
+                UrlVisit.objects.create(
+                    url=url,
+                    ip_address=visit["ip_address"],
+                    browser=visit["browser"],
+                    os=visit["os"],
+                    device=visit["device"],
+                    is_bot=visit["is_bot"],
+                    referrer=visit["referrer"],
+                )
+        UrlVisit.objects.all().delete()
+
+        # After: buffer every visit, then drain in VISIT_BATCH_SIZE chunks.
+        buffer = LocalVisitBuffer()
+        with override_settings(VISIT_BATCH_SIZE=options["batch_size"]):
+            with Stopwatch() as after:
+                for visit in visits:
+                    buffer.push(visit)
+                buffer.drain(write_visits, options["batch_size"])
+        assert UrlVisit.objects.count() == len(visits)
+
+        return {
+            "visits": len(visits),
+            "links": len(url_ids),
+            "batch_size": options["batch_size"],
+            "per_click": {
+                "seconds": before.elapsed,
+                "visits_per_sec": throughput(len(visits), before.elapsed),
+            },
+            "batched": {
+                "seconds": after.elapsed,
+                "visits_per_sec": throughput(len(visits), after.elapsed),
+            },
+            "speedup": before.elapsed / after.elapsed,
+        }
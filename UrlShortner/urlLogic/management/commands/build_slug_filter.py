@@ -0,0 +1,73 @@
+"""
+Build, save or load the Bloom filter of existing short codes.
+
+By default the filter is rebuilt from the database and swapped in. Its
+size, hash count and expected false-positive rate are printed, along with
+the rate measured by probing random codes that no link uses.
+
+Usage:
+    python manage.py build_slug_filter --fp-rate 0.001 --save
+    python manage.py build_slug_filter --load /var/lib/urlly/shortcodes.bloom
+    python manage.py build_slug_filter --stats-only
+"""
+
+import random
+import string
+
+from django.core.management.base import BaseCommand, CommandError
+
+from urlLogic.bloom import slug_filter
+
+ALPHABET = string.ascii_letters + string.digits
+
+
+class Command(BaseCommand):
+    help = "Rebuild the short code Bloom filter and report its error rate."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--capacity", type=int, help="Minimum capacity")
+        parser.add_argument("--fp-rate", type=float, help="Target false-positive rate")
+        parser.add_argument(
+            "--save",
+            nargs="?",
+            const="",
+            help="Save the filter to this path (default BLOOM_FILTER_PATH)",
+        )
+        parser.add_argument("--load", help="Install a filter saved with --save")
+        parser.add_argument("--stats-only", action="store_true")
+        parser.add_argument(
+            "--probes", type=int, default=100000, help="Random codes to probe"
+        )
+
+    def handle(self, *args, **options):
+        if options["load"]:
+            stats = slug_filter.load(options["load"])
+        elif options["stats_only"]:
+            stats = slug_filter.stats()
+        else:
+            stats = slug_filter.rebuild(options["capacity"], options["fp_rate"])
+        if stats is None:
+            raise CommandError("The slug filter has not been built yet.")
+
+        if options["save"] is not None:
+            slug_filter.save(options["save"] or None)
+
+        for name, value in stats.items():
+            self.stdout.write(f"{name:>18}: {value}")
+        if options["probes"]:
+            measured = self.measure_fp_rate(options["probes"])
+            self.stdout.write(f"{'measured_fp_rate':>18}: {measured:.6f}")
+
+    def measure_fp_rate(self, probes):
+        """
+        Fraction of random 8-character codes the filter reports as present.
+
+        Random codes are almost never in use, so nearly every hit is a
+        false positive.
+        """
+        bloom = slug_filter.backend.snapshot()
+        rng = random.Random(0)
+        hits = sum(
+            "".join(rng.choices(ALPHABET, k=8)) in bloom for _ in range(probes)
+        )
+        return hits / probes
@@ -0,0 +1,64 @@
+"""
+Shorten every URL of a CSV or JSON-lines file for one user.
+
+The file is read and validated like an upload to ``/u/bulk/`` (see
+``urlLogic.bulk``), without the ``BULK_SHORTEN_MAX_ROWS`` limit. One CSV
+line per input row, with its short URL or the reason it was rejected, is
+written to ``--output`` (standard output by default).
+
+Usage:
+    python manage.py bulk_shorten campaign.csv --user marketing --output links.csv
+    python manage.py bulk_shorten links.jsonl --user marketing --base-url https://url.ly
+"""
+
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from urlLogic import bulk
+
+
+class Command(BaseCommand):
+    help = "Create short links for every URL of a CSV or JSON-lines file."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="CSV or JSON-lines file")
+        parser.add_argument("--user", required=True, help="Username of the owner")
+        parser.add_argument("--format", choices=("csv", "jsonl"), help="Default: detect")
+        parser.add_argument("--output", help="Write the results CSV to this path")
+        parser.add_argument(
+            "--chunk-size", type=int, help="Rows per query and INSERT"
+        )
+        parser.add_argument(
+            "--base-url",
+            help="Scheme and host of short links (default PROTOCOL://SITE_DOMAIN)",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            user = get_user_model().objects.get(username=options["user"])
+        except get_user_model().DoesNotExist:
+            raise CommandError(f"No user named {options['user']!r}.")
+
+        started = time.perf_counter()
+        try:
+            with open(options["path"], "rb") as upload:
+                rows = bulk.read_upload(upload, options["format"] or "")
+            links = bulk.shorten(user, rows, options["chunk_size"])
+        except (OSError, bulk.BulkInputError) as e:
+            raise CommandError(str(e))
+        seconds = time.perf_counter() - started
+
+        base_url = options["base_url"] or f"{settings.PROTOCOL}://{settings.SITE_DOMAIN}"
+        if options["output"]:
+            with open(options["output"], "w", newline="", encoding="utf-8") as stream:
+                bulk.write_results(stream, rows, base_url.rstrip("/"))
+        else:
+            bulk.write_results(self.stdout, rows, base_url.rstrip("/"))
+
+        self.stderr.write(
+            f"Created {len(links)} of {len(rows)} links in {seconds:.2f}s "
+            f"({len(rows) - len(links)} rejected)"
+        )
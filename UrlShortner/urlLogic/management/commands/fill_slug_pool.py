@@ -0,0 +1,39 @@
+"""
+Fill the pools of pre-generated short codes and report their depth.
+
+Run once before setting ``SLUG_POOL_ENABLED`` so the first links do not
+find the pools empty; afterwards link creation and Celery beat keep them
+filled (see ``urlLogic.slugpool``).
+
+Usage:
+    python manage.py fill_slug_pool
+    python manage.py fill_slug_pool --lengths 6 --target 50000
+"""
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from urlLogic.benchmarks import Stopwatch
+from urlLogic.slugpool import slug_pool
+
+
+class Command(BaseCommand):
+    help = "Fill the short code pools up to SLUG_POOL_TARGET codes."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--lengths", type=int, nargs="+", help="Default SLUG_POOL_LENGTHS"
+        )
+        parser.add_argument("--target", type=int, help="Default SLUG_POOL_TARGET")
+
+    def handle(self, *args, **options):
+        for length in options["lengths"] or settings.SLUG_POOL_LENGTHS:
+            with Stopwatch() as timer:
+                added = slug_pool.refill(length, options["target"])
+            if added is None:
+                self.stdout.write(f"{length} characters: another refill is running")
+                continue
+            self.stdout.write(
+                f"{length} characters: added {added:,} codes in {timer.elapsed:.2f}s, "
+                f"{slug_pool.backend.depth(length):,} in the pool"
+            )
@@ -0,0 +1,79 @@
+"""
+Load-test a redirect endpoint of a running server.
+
+Fires ``--requests`` GETs at ``--url`` with ``--concurrency`` in-flight
+requests (redirects are not followed) and reports throughput and latency
+percentiles. Run it once against each deployment style to compare them:
+
+    # WSGI, sync views
+    gunicorn UrlShortner.wsgi:application --workers 4 --bind 127.0.0.1:8001
+    # ASGI, async views
+    ASYNC_REDIRECTS=True uvicorn UrlShortner.asgi:application --workers 4 --port 8002
+
+    python manage.py loadtest_redirect --url http://127.0.0.1:8001/u/<slug>/
+    python manage.py loadtest_redirect --url http://127.0.0.1:8002/u/<slug>/
+"""
+
+import asyncio
+import time
+
+from django.core.management.base import BaseCommand
+
+from urlLogic.benchmarks import percentiles, throughput, write_results
+
+
+class Command(BaseCommand):
+    help = "Measure redirect throughput and latency of a running server."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--url", required=True)
+        parser.add_argument("--requests", type=int, default=5000)
+        parser.add_argument("--concurrency", type=int, default=50)
+        parser.add_argument("--output", help="Write results as JSON to this path")
+
+    def handle(self, *args, **options):
+        results = asyncio.run(self.run(options))
+        latency = results["latency"]
+        self.stdout.write(
+            f"{results['requests_per_sec']:,.0f} req/s, "
+            f"p50 {latency['p50_ms']:.1f}ms, p95 {latency['p95_ms']:.1f}ms, "
+            f"p99 {latency['p99_ms']:.1f}ms, {results['errors']} errors"
+        )
+        if options["output"]:
+            write_results(options["output"], results)
+
+    async def run(self, options):
+        import aiohttp
+
+        samples = []
+        statuses = {}
+        remaining = options["requests"]
+
+        async def worker(session):
+            nonlocal remaining
+            while remaining > 0:
+                remaining -= 1
+                start = time.perf_counter()
+                async with session.get(options["url"], allow_redirects=False) as resp:
+                    await resp.read()
+                samples.append(time.perf_counter() - start)
+                statuses[resp.status] = statuses.get(resp.status, 0) + 1
+
+        connector = aiohttp.TCPConnector(limit=options["concurrency"])
+        async with aiohttp.ClientSession(connector=connector) as session:
+            started = time.perf_counter()
+            await asyncio.gather(
+                *(worker(session) for _ in range(options["concurrency"]))
+            )
+            elapsed = time.perf_counter() - started
+
+        return {
+            "url": options["url"],
+            "concurrency": options["concurrency"],
+            "requests": len(samples),
+            "seconds": elapsed,
+            "requests_per_sec": throughput(len(samples), elapsed),
+            "statuses": statuses,
+            "errors": sum(n for code, n in statuses.items() if code >= 400),
+            "latency": percentiles(samples),
+        }
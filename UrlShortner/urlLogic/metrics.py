@@ -0,0 +1,447 @@
+"""
+Per-view request metrics: latency, SQL, cache and Celery enqueue cost.
+
+``RequestMetricsMiddleware`` (see ``urlLogic.middleware``) opens a
+``RequestTrace`` for every request and makes it the current trace for the
+request's context. While it is open:
+
+- every SQL query run on any connection is timed by ``trace_query``, an
+  execute wrapper installed on each connection when it is created (see
+  ``urlLogic.signals``);
+- ``note_cache`` counts hits and misses of the link cache (and any other
+  cache that reports to it);
+- Celery's publish signals time how long enqueueing tasks takes.
+
+When the response is ready the trace is folded into ``request_metrics``,
+keyed by the resolved view name (``u:redirect_url``, ``blog:blog_list``,
+...; ``unresolved`` for 404s). Latencies, DB time and query counts go into
+fixed-bucket histograms, so memory stays constant no matter how much
+traffic a process serves and histograms from several processes can simply
+be added up.
+
+Recording is cheap enough to leave on in production: a few
+``perf_counter`` calls per request and one context variable lookup per
+query. Query text is only normalized into fingerprints for requests
+slower than ``REQUEST_SLOW_MS``, which are logged with their most
+expensive fingerprints.
+
+Other components add plain counters with ``request_metrics.increment``
+(e.g. failed Celery enqueues). Everything is exported in the Prometheus
+text format by ``urlLogic.prometheus``, which also merges the metrics of
+all worker processes.
+"""
+
+import hashlib
+import hmac
+import re
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+from contextvars import ContextVar
+
+from django.conf import settings
+
+# Upper bounds of the histogram buckets; one overflow bucket follows.
+LATENCY_BUCKETS_MS = (1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+# Queries kept per trace for fingerprinting; later ones are only counted.
+MAX_TRACED_QUERIES = 500
+
+_current_trace = ContextVar("urlly_request_trace", default=None)
+
+
+class Histogram:
+    """
+    Fixed-bucket histogram.
+
+    ``counts[i]`` is the number of observations ``<= bounds[i]`` (and
+    greater than the previous bound); ``counts[-1]`` counts the rest.
+    """
+
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def merge(self, other):
+        for i, count in enumerate(other.counts):
+            self.counts[i] += count
+        self.sum += other.sum
+        self.count += other.count
+
+    def quantile(self, q):
+        """
+        Estimate the ``q`` quantile by interpolating inside its bucket.
+
+        Values in the overflow bucket are reported as the largest bound.
+        """
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                if i == len(self.bounds):
+                    return float(self.bounds[-1])
+                lower = self.bounds[i - 1] if i else 0
+                return lower + (self.bounds[i] - lower) * (rank - seen) / count
+            seen += count
+        return float(self.bounds[-1])
+
+    def as_dict(self):
+        return {
+            "bounds": list(self.bounds),
+            "counts": list(self.counts),
+            "sum": self.sum,
+            "count": self.count,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        histogram = cls(tuple(data["bounds"]))
+        histogram.counts = list(data["counts"])
+        histogram.sum = data["sum"]
+        histogram.count = data["count"]
+        return histogram
+
+
+class ViewMetrics:
+    """
+    Aggregated metrics of one view.
+    """
+
+    def __init__(self):
+        self.wall_ms = Histogram(LATENCY_BUCKETS_MS)
+        self.db_ms = Histogram(LATENCY_BUCKETS_MS)
+        self.queries = Histogram(QUERY_COUNT_BUCKETS)
+        self.statuses = Counter()
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.celery_tasks = 0
+        self.celery_ms = 0.0
+
+    def as_dict(self):
+        return {
+            "wall_ms": self.wall_ms.as_dict(),
+            "db_ms": self.db_ms.as_dict(),
+            "queries": self.queries.as_dict(),
+            "statuses": {str(status): n for status, n in self.statuses.items()},
+            "cache_hits": self.cache_hits,
+            "cache_misses": self.cache_misses,
+            "celery_tasks": self.celery_tasks,
+            "celery_ms": self.celery_ms,
+        }
+
+
+class RequestTrace:
+    """
+    Measurements of a single request.
+    """
+
+    __slots__ = (
+        "started",
+        "db_ms",
+        "query_count",
+        "queries",
+        "cache_hits",
+        "cache_misses",
+        "celery_tasks",
+        "celery_ms",
+        "publish_started",
+    )
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.db_ms = 0.0
+        self.query_count = 0
+        # (sql, milliseconds) of the first MAX_TRACED_QUERIES queries
+        self.queries = []
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.celery_tasks = 0
+        self.celery_ms = 0.0
+        self.publish_started = None
+
+    def elapsed_ms(self):
+        return (time.perf_counter() - self.started) * 1000
+
+    def server_timing(self, wall_ms):
+        """
+        Format the trace as a ``Server-Timing`` header value.
+        """
+        parts = [
+            f"total;dur={wall_ms:.1f}",
+            f'db;dur={self.db_ms:.1f};desc="{self.query_count} queries"',
+            f'cache;desc="{self.cache_hits} hits, {self.cache_misses} misses"',
+        ]
+        if self.celery_tasks:
+            parts.append(
+                f'celery;dur={self.celery_ms:.1f};desc="{self.celery_tasks} tasks"'
+            )
+        return ", ".join(parts)
+
+
+def start_trace():
+    """
+    Open a trace for the current context.
+
+    Returns:
+        tuple: The trace and the token to pass to ``end_trace``
+    """
+    trace = RequestTrace()
+    return trace, _current_trace.set(trace)
+
+
+def end_trace(token):
+    _current_trace.reset(token)
+
+
+def trace_query(execute, sql, params, many, context):
+    """
+    Connection execute wrapper timing queries of the current trace.
+    """
+    trace = _current_trace.get()
+    if trace is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        duration = (time.perf_counter() - started) * 1000
+        trace.db_ms += duration
+        trace.query_count += 1
+        if len(trace.queries) < MAX_TRACED_QUERIES:
+            trace.queries.append((sql, duration))
+
+
+def install_query_tracer(connection):
+    """
+    Add ``trace_query`` to a database connection's execute wrappers.
+    """
+    if trace_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(trace_query)
+
+
+def note_cache(name, hit):
+    """
+    Count a cache lookup, globally and on the current trace.
+
+    Args:
+        name: Cache name, e.g. "link"
+        hit: Whether the lookup was answered from the cache
+    """
+    request_metrics.count_cache(name, hit)
+    trace = _current_trace.get()
+    if trace is not None:
+        if hit:
+            trace.cache_hits += 1
+        else:
+            trace.cache_misses += 1
+
+
+def task_publish_started():
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.publish_started = time.perf_counter()
+
+
+def task_publish_finished():
+    trace = _current_trace.get()
+    if trace is not None and trace.publish_started is not None:
+        trace.celery_ms += (time.perf_counter() - trace.publish_started) * 1000
+        trace.celery_tasks += 1
+        trace.publish_started = None
+
+
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b|%s")
+_IN_LISTS = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+_SPACES = re.compile(r"\s+")
+
+
+def fingerprint(sql):
+    """
+    Normalize SQL so that queries differing only in literals group together.
+
+    Returns:
+        str: The SQL with literals and placeholders replaced by ``?``,
+        value lists collapsed to ``(...)`` and whitespace collapsed
+    """
+    normalized = _LITERALS.sub("?", sql)
+    normalized = _IN_LISTS.sub("(...)", normalized)
+    return _SPACES.sub(" ", normalized).strip()
+
+
+def top_fingerprints(queries, limit=5):
+    """
+    Group traced queries by fingerprint, most total time first.
+
+    Returns:
+        list: ``(fingerprint_id, count, total_ms, fingerprint)`` tuples,
+        where ``fingerprint_id`` is a short stable hash for grepping logs
+    """
+    groups = {}
+    for sql, duration in queries:
+        key = fingerprint(sql)
+        entry = groups.setdefault(key, [0, 0.0])
+        entry[0] += 1
+        entry[1] += duration
+    ranked = sorted(groups.items(), key=lambda kv: kv[1][1], reverse=True)
+    return [
+        (hashlib.md5(key.encode()).hexdigest()[:8], count, total, key)
+        for key, (count, total) in ranked[:limit]
+    ]
+
+
+class RequestMetrics:
+    """
+    Per-process registry of ``ViewMetrics``, cache lookups and counters.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.views = {}
+        # (cache name, "hit" or "miss") -> lookups
+        self.cache = Counter()
+        # (counter name, sorted label items) -> value
+        self.counters = Counter()
+
+    def record(self, view_name, status, wall_ms, trace):
+        with self.lock:
+            view = self.views.get(view_name)
+            if view is None:
+                view = self.views[view_name] = ViewMetrics()
+            view.wall_ms.observe(wall_ms)
+            view.db_ms.observe(trace.db_ms)
+            view.queries.observe(trace.query_count)
+            view.statuses[status] += 1
+            view.cache_hits += trace.cache_hits
+            view.cache_misses += trace.cache_misses
+            view.celery_tasks += trace.celery_tasks
+            view.celery_ms += trace.celery_ms
+            if trace.query_count:
+                # Compared with db_connections_opened to see connection reuse.
+                self.counters["db_requests", ()] += 1
+
+    def count_cache(self, name, hit):
+        with self.lock:
+            self.cache[name, "hit" if hit else "miss"] += 1
+
+    def increment(self, name, amount=1, **labels):
+        """
+        Add ``amount`` to the counter ``name`` with the given labels.
+        """
+        with self.lock:
+            self.counters[name, tuple(sorted(labels.items()))] += amount
+
+    def snapshot(self):
+        """
+        Return the metrics as plain (JSON serializable) data.
+
+        Returns:
+            dict: ``views`` maps view names to ``ViewMetrics.as_dict()``;
+            ``cache`` maps cache names to hit and miss counts; ``counters``
+            is a list of ``[name, labels, value]``
+        """
+        with self.lock:
+            cache = {}
+            for (name, outcome), count in self.cache.items():
+                cache.setdefault(name, {"hit": 0, "miss": 0})[outcome] = count
+            return {
+                "views": {name: view.as_dict() for name, view in self.views.items()},
+                "cache": cache,
+                "counters": [
+                    [name, dict(labels), value]
+                    for (name, labels), value in self.counters.items()
+                ],
+            }
+
+    def reset(self):
+        with self.lock:
+            self.views = {}
+            self.cache = Counter()
+            self.counters = Counter()
+
+
+def merge_snapshots(snapshots):
+    """
+    Add up ``RequestMetrics.snapshot()`` results, e.g. from several processes.
+
+    Returns:
+        dict: A snapshot of the same shape
+    """
+    views = {}
+    cache = {}
+    counters = Counter()
+    for snapshot in snapshots:
+        for name, data in snapshot.get("views", {}).items():
+            merged = views.get(name)
+            if merged is None:
+                views[name] = {
+                    **data,
+                    "wall_ms": dict(data["wall_ms"]),
+                    "db_ms": dict(data["db_ms"]),
+                    "queries": dict(data["queries"]),
+                    "statuses": dict(data["statuses"]),
+                }
+                continue
+            for key in ("wall_ms", "db_ms", "queries"):
+                histogram = Histogram.from_dict(merged[key])
+                histogram.merge(Histogram.from_dict(data[key]))
+                merged[key] = histogram.as_dict()
+            for status, count in data["statuses"].items():
+                merged["statuses"][status] = merged["statuses"].get(status, 0) + count
+            for key in ("cache_hits", "cache_misses", "celery_tasks", "celery_ms"):
+                merged[key] += data[key]
+        for name, outcomes in snapshot.get("cache", {}).items():
+            merged = cache.setdefault(name, {"hit": 0, "miss": 0})
+            for outcome, count in outcomes.items():
+                merged[outcome] += count
+        for name, labels, value in snapshot.get("counters", []):
+            counters[name, tuple(sorted(labels.items()))] += value
+    return {
+        "views": views,
+        "cache": cache,
+        "counters": [
+            [name, dict(labels), value] for (name, labels), value in counters.items()
+        ],
+    }
+
+
+def slow_request_message(request, view_name, status, wall_ms, trace):
+    lines = [
+        f"Slow request {request.method} {request.path} ({view_name}, {status}): "
+        f"{wall_ms:.1f} ms, {trace.query_count} queries in {trace.db_ms:.1f} ms"
+    ]
+    for fingerprint_id, count, total, sql in top_fingerprints(trace.queries):
+        lines.append(f"  [{fingerprint_id}] {count}x {total:.1f} ms {sql[:300]}")
+    return "\n".join(lines)
+
+
+def wants_server_timing(request):
+    """
+    Whether the response should carry a ``Server-Timing`` header.
+
+    Clients ask for it with an ``X-Server-Timing`` request header. With
+    ``DEBUG`` any value works; otherwise it must equal
+    ``SERVER_TIMING_TOKEN`` (and an empty token disables the header).
+    """
+    value = request.headers.get("X-Server-Timing")
+    if value is None:
+        return False
+    if settings.DEBUG:
+        return True
+    token = settings.SERVER_TIMING_TOKEN
+    # Compared as bytes: compare_digest rejects non-ASCII str values.
+    return bool(token) and hmac.compare_digest(value.encode(), token.encode())
+
+
+request_metrics = RequestMetrics()
@@ -0,0 +1,179 @@
+"""
+Request middleware: the short link redirect fast path and per-view metrics.
+
+Fast path for public short link redirects
+-----------------------------------------
+
+``/u/<slug>/`` and ``/s/<code>/`` are by far the most requested URLs, yet
+they need none of the per-request state the rest of the site is built on:
+no session, no user, no CSRF token, no messages. Running them through the
+full ``MIDDLEWARE`` stack still costs a session cookie parse, a session
+lookup for logged-in visitors and a user query.
+
+``RedirectFastPathMiddleware`` sits near the top of the stack (right after
+``SecurityMiddleware``, so HTTPS redirects and HSTS still apply). For
+requests whose path resolves to one of the redirect views it calls the
+view directly and returns its response, skipping every middleware below
+it (the Host header is still validated against ``ALLOWED_HOSTS``, as
+``CommonMiddleware`` would). Everything else passes through untouched. Paths are matched with the
+project URLconf, so ``/u/shortenurl/`` and friends still reach their own
+views, and the sync or async redirect view is called natively depending
+on how the server runs the middleware.
+
+Request metrics
+---------------
+
+``RequestMetricsMiddleware`` sits at the very top of the stack so its
+timing covers every other middleware, including the fast path. It traces
+each request (see ``urlLogic.metrics``), records the trace under the
+resolved view name, adds a ``Server-Timing`` header when the client asks
+for one and logs requests slower than ``REQUEST_SLOW_MS`` with their query
+fingerprints. It is removed from the stack when ``REQUEST_METRICS_ENABLED``
+is off. With ``METRICS_DIR`` set it also shares the process's metrics with
+the other workers (see ``urlLogic.prometheus``).
+"""
+
+import asyncio
+import logging
+
+from asgiref.sync import (
+    async_to_sync,
+    iscoroutinefunction,
+    markcoroutinefunction,
+    sync_to_async,
+)
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.urls import Resolver404, resolve
+
+from .metrics import (
+    end_trace,
+    install_query_tracer,
+    request_metrics,
+    slow_request_message,
+    start_trace,
+    wants_server_timing,
+)
+from .prometheus import metrics_store
+
+logger = logging.getLogger("urlLogic")
+
+FAST_PATH_PREFIXES = ("/u/", "/s/")
+FAST_PATH_URL_NAMES = {"u:redirect_url", "redirect"}
+
+
+def match_redirect(path):
+    """
+    Return the ``ResolverMatch`` for a redirect URL, or None.
+
+    Args:
+        path: The request's ``path_info``
+
+    Only paths of the form ``/u/<one segment>/`` and ``/s/<one segment>/``
+    are resolved; everything else is rejected without touching the
+    URLconf.
+    """
+    if not path.startswith(FAST_PATH_PREFIXES) or path.count("/") != 3:
+        return None
+    if not path.endswith("/") or len(path) == 4:
+        return None
+    try:
+        match = resolve(path)
+    except Resolver404:
+        return None
+    return match if match.view_name in FAST_PATH_URL_NAMES else None
+
+
+class RedirectFastPathMiddleware:
+    """
+    Serve short link redirects without the session/auth/messages stack.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        match = match_redirect(request.path_info)
+        if match is None:
+            return self.get_response(request)
+        request.get_host()
+        request.resolver_match = match
+        view = match.func
+        if asyncio.iscoroutinefunction(view):
+            view = async_to_sync(view)
+        return view(request, *match.args, **match.kwargs)
+
+    async def __acall__(self, request):
+        match = match_redirect(request.path_info)
+        if match is None:
+            return await self.get_response(request)
+        request.get_host()
+        request.resolver_match = match
+        view = match.func
+        if not asyncio.iscoroutinefunction(view):
+            view = sync_to_async(view)
+        return await view(request, *match.args, **match.kwargs)
+
+
+class RequestMetricsMiddleware:
+    """
+    Record wall time, SQL, cache and Celery cost per resolved view.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.REQUEST_METRICS_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+        # Connections opened later get the tracer from urlLogic.signals.
+        for connection in connections.all():
+            install_query_tracer(connection)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        trace, token = start_trace()
+        try:
+            response = self.get_response(request)
+        finally:
+            end_trace(token)
+        return self.finish(request, response, trace)
+
+    async def __acall__(self, request):
+        trace, token = start_trace()
+        try:
+            response = await self.get_response(request)
+        finally:
+            end_trace(token)
+        return self.finish(request, response, trace)
+
+    def finish(self, request, response, trace):
+        wall_ms = trace.elapsed_ms()
+        match = request.resolver_match
+        view_name = match.view_name if match is not None else "unresolved"
+        request_metrics.record(view_name, response.status_code, wall_ms, trace)
+
+        if wants_server_timing(request):
+            response["Server-Timing"] = trace.server_timing(wall_ms)
+        if wall_ms >= settings.REQUEST_SLOW_MS:
+            logger.warning(
+                slow_request_message(
+                    request, view_name, response.status_code, wall_ms, trace
+                )
+            )
+        metrics_store.publish_if_due()
+        return response
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.1 on 2026-10-16 22:49
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('urlLogic', '0007_alter_urlmodel_options'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='urlvisit',
+            name='timestamp',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.1 on 2026-10-16 23:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('urlLogic', '0008_alter_urlvisit_timestamp'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='urlmodel',
+            name='cache_max_age',
+            field=models.PositiveIntegerField(blank=True, help_text='Seconds a permanent redirect may be cached (default REDIRECT_MAX_AGE, capped by expires_at).', null=True),
+        ),
+        migrations.AddField(
+            model_name='urlmodel',
+            name='redirect_type',
+            field=models.PositiveSmallIntegerField(choices=[(302, '302 Found (every click tracked)'), (307, '307 Temporary Redirect (every click tracked, keeps method)'), (301, '301 Moved Permanently (cached by browsers and CDNs)')], default=302),
+        ),
+    ]
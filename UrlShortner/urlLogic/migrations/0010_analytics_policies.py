@@ -0,0 +1,23 @@
+# Generated by Django 5.2.1 on 2026-10-16 23:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('urlLogic', '0009_urlmodel_redirect_policy'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='urlmodel',
+            name='bot_click_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='urlvisit',
+            name='weight',
+            field=models.PositiveIntegerField(default=1),
+        ),
+    ]
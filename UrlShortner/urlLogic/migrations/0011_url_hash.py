@@ -0,0 +1,47 @@
+# Generated by Django 5.2.1 on 2026-10-16 23:40
+
+import urlLogic.models
+from django.conf import settings
+from django.db import migrations, models
+
+from urlLogic.canonical import url_hash
+
+
+def fill_url_hashes(apps, schema_editor):
+    UrlModel = apps.get_model("urlLogic", "UrlModel")
+    links = UrlModel.objects.filter(url_hash="").only("id", "original_url").order_by("id")
+    last_id = 0
+    while True:
+        batch = list(links.filter(id__gt=last_id)[:2000])
+        if not batch:
+            break
+        for link in batch:
+            link.url_hash = url_hash(link.original_url)
+        UrlModel.objects.bulk_update(batch, ["url_hash"])
+        last_id = batch[-1].id
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('urlLogic', '0010_analytics_policies'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='urlmodel',
+            name='url_hash',
+            field=models.CharField(default='', editable=False, max_length=32),
+        ),
+        migrations.RunPython(fill_url_hashes, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='urlmodel',
+            name='original_url',
+            field=models.URLField(validators=[urlLogic.models.validate_url_format_and_blacklist]),
+        ),
+        migrations.AddIndex(
+            model_name='urlmodel',
+            index=models.Index(fields=['user', 'url_hash'], name='urlmodel_user_url_hash'),
+        ),
+    ]
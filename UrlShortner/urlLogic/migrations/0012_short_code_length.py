@@ -0,0 +1,18 @@
+# Generated by Django 5.2.1 on 2026-10-16 23:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('urlLogic', '0011_url_hash'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='shorturlanonymous',
+            name='short_code',
+            field=models.CharField(blank=True, max_length=10, unique=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.1 on 2026-10-17 00:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('urlLogic', '0012_short_code_length'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='urlvisit',
+            name='ip_address',
+            field=models.GenericIPAddressField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.1 on 2026-10-17 00:08
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('urlLogic', '0013_urlvisit_ip_address_null'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='shorturlanonymous',
+            index=models.Index(fields=['created_at'], name='anonymous_created_at'),
+        ),
+        migrations.AddIndex(
+            model_name='urlmodel',
+            index=models.Index(fields=['created_at'], name='urlmodel_created_at'),
+        ),
+    ]
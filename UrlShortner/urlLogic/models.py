@@ -1,8 +1,13 @@
 from django.db import models
+from django.utils import timezone
 from django.contrib.auth import get_user_model
 from django.core.exceptions import ValidationError
 from urllib.parse import urlparse
 from cloudinary_storage.storage import MediaCloudinaryStorage
+
+from .blocklist import domain_blocklist
+from .canonical import HASH_LENGTH, url_hash
+from .threats import threat_screen
 # from Brandlink.models import Domain
 
 User = get_user_model()
@@ -11,10 +16,16 @@ User = get_user_model()
 # ------------------------------------------------------------------------------
 class ShortUrlAnonymous(models.Model):
     original_url = models.URLField()
-    short_code = models.CharField(max_length=6, unique=True, blank=True)
+    short_code = models.CharField(max_length=10, unique=True, blank=True)
     ip_address = models.GenericIPAddressField()
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # Slug filter catch-up scans recent rows (urlLogic.bloom).
+            models.Index(fields=["created_at"], name="anonymous_created_at"),
+        ]
+
     def __str__(self):
         return f"{self.short_code} -> {self.original_url}"
 
@@ -22,32 +33,45 @@ class ShortUrlAnonymous(models.Model):
 # ------------------------------------------------------------------------------
 """all the logic for logged in users"""
 
-BLACKLISTED_DOMAINS = [
-    "url-ly.onrender.com",
-    "localhost",
-    "127.0.0.1",
-]
-
 
 def validate_url_format_and_blacklist(value):
+    """
+    Reject URLs without a scheme and host, hosts on the blocklist (see
+    ``urlLogic.blocklist``) and URLs in the threat feed (see
+    ``urlLogic.threats``).
+    """
     parsed_url = urlparse(value)
-    print(parsed_url)
 
     if not parsed_url.scheme or not parsed_url.netloc:
         raise ValidationError("Invalid URL format.")
 
-    domain = parsed_url.netloc.lower()
+    if domain_blocklist.match(parsed_url.hostname or ""):
+        raise ValidationError("This domain is not allowed.")
+
+    if threat_screen.match(value):
+        raise ValidationError("This URL has been reported as malicious.")
+
+
+class RedirectType(models.IntegerChoices):
+    """
+    HTTP status used when redirecting a short link.
 
-    for blocked in BLACKLISTED_DOMAINS:
-        if blocked in domain:
-            raise ValidationError("This domain is not allowed.")
+    Temporary redirects are sent with ``Cache-Control: no-store`` so every
+    click reaches the server and is counted. Permanent redirects are
+    cacheable, which moves repeat clicks off the origin (and out of the
+    analytics).
+    """
+
+    FOUND = 302, "302 Found (every click tracked)"
+    TEMPORARY = 307, "307 Temporary Redirect (every click tracked, keeps method)"
+    PERMANENT = 301, "301 Moved Permanently (cached by browsers and CDNs)"
 
 
 class UrlModel(models.Model):
     # domain = models.ForeignKey(Domain, on_delete=models.CASCADE, null=True, blank=True)
-    original_url = models.URLField(
-        unique=True, validators=[validate_url_format_and_blacklist]
-    )
+    original_url = models.URLField(validators=[validate_url_format_and_blacklist])
+    # Hash of the canonical URL (urlLogic.canonical), kept in sync by save().
+    url_hash = models.CharField(max_length=HASH_LENGTH, editable=False, default="")
     short_url = models.CharField(max_length=10, unique=True, null=True, blank=True)
     qrcode = models.ImageField(
         upload_to="qr_code/", null=True, blank=True, storage=MediaCloudinaryStorage()
@@ -55,21 +79,47 @@ class UrlModel(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     expires_at = models.DateTimeField(null=True, blank=True, default=None)
     click_count = models.PositiveIntegerField(default=0)
+    # Bot visits counted without storing rows (ANALYTICS_BOT_POLICY="aggregate").
+    bot_click_count = models.PositiveIntegerField(default=0)
     user = models.ForeignKey(User, on_delete=models.CASCADE)
+    redirect_type = models.PositiveSmallIntegerField(
+        choices=RedirectType.choices, default=RedirectType.FOUND
+    )
+    cache_max_age = models.PositiveIntegerField(
+        null=True,
+        blank=True,
+        help_text="Seconds a permanent redirect may be cached "
+        "(default REDIRECT_MAX_AGE, capped by expires_at).",
+    )
 
     class Meta:
         ordering = ["-created_at"]
+        indexes = [
+            # Duplicate checks: is this (canonical) URL already one of the user's links?
+            models.Index(fields=["user", "url_hash"], name="urlmodel_user_url_hash"),
+            # Slug filter catch-up scans recent rows (urlLogic.bloom).
+            models.Index(fields=["created_at"], name="urlmodel_created_at"),
+        ]
 
     #     unique_together = ("domain", "short_url")
 
     def __str__(self):
         return f"{self.short_url}"
 
+    def save(self, *args, **kwargs):
+        self.url_hash = url_hash(self.original_url)
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and "original_url" in update_fields:
+            kwargs["update_fields"] = {*update_fields, "url_hash"}
+        super().save(*args, **kwargs)
+
 
 class UrlVisit(models.Model):
     url = models.ForeignKey("UrlModel", on_delete=models.CASCADE, related_name="visits")
-    timestamp = models.DateTimeField(auto_now_add=True)
-    ip_address = models.GenericIPAddressField()
+    # Set from the click time; visits are inserted in batches after the fact.
+    timestamp = models.DateTimeField(default=timezone.now)
+    # None when the client sent no valid address (see utils.clean_ip).
+    ip_address = models.GenericIPAddressField(null=True, blank=True)
     country = models.CharField(max_length=100, null=True, blank=True)
     region = models.CharField(max_length=100, null=True, blank=True)
     city = models.CharField(max_length=100, null=True, blank=True)
@@ -78,6 +128,8 @@ class UrlVisit(models.Model):
     device = models.CharField(max_length=50, null=True, blank=True)
     referrer = models.URLField(null=True, blank=True)
     is_bot = models.BooleanField(default=False)
+    # Number of clicks this row stands for; above 1 when visits are sampled.
+    weight = models.PositiveIntegerField(default=1)
 
     class Meta:
         ordering = ["-timestamp"]
@@ -0,0 +1,438 @@
+"""
+Prometheus exposition of the application metrics.
+
+``/metrics`` (next to ``/health/``) serves, in the Prometheus text format:
+
+- per-view request latency, DB time and query count histograms and
+  request counts by status (``urlLogic.metrics``);
+- link cache hits and misses, i.e. redirects served without the database;
+- Celery enqueue time per view and failed enqueues per task;
+- visit ingestion lag: buffered visits and the age of the oldest one;
+- short code pool depth per code length (``urlLogic.slugpool``);
+- hit, miss and eviction counts of the user agent and GeoIP caches;
+- database connections opened against requests that used the database,
+  whose ratio shows how well connections are reused (``CONN_MAX_AGE``).
+
+Multi-process servers
+---------------------
+
+Under gunicorn every pre-forked worker keeps its own metrics, and a scrape
+reaches a single worker. With ``METRICS_DIR`` set, each process writes its
+snapshot to ``<METRICS_DIR>/metrics-<pid>.json`` at most every
+``METRICS_PUBLISH_INTERVAL`` seconds (after a request, or after a visit
+drain in Celery workers), and the scraped process adds up every file in
+the directory, using its own live numbers for itself. Series from other
+processes can therefore lag by up to the publish interval.
+
+When a worker exits, ``archive_process`` (called from the gunicorn
+``child_exit`` hook, see ``gunicorn.conf.py``) folds its counters into
+``archive.json`` so totals never go backwards and the directory does not
+grow with worker restarts. The directory is emptied when gunicorn starts.
+Without ``METRICS_DIR`` only the scraped process is reported.
+"""
+
+import fcntl
+import json
+import os
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from django.conf import settings
+
+from .metrics import merge_snapshots, request_metrics
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+ARCHIVE_FILE = "archive.json"
+LOCK_FILE = ".lock"
+
+
+def lru_caches():
+    """
+    The in-process LRU caches to report, by name.
+    """
+    from .geoip import geoip
+    from .utils import ua_cache
+
+    return {"user_agent": ua_cache, "geoip": geoip.cache}
+
+
+def process_snapshot():
+    """
+    Snapshot of this process: request metrics plus LRU cache statistics.
+    """
+    snapshot = request_metrics.snapshot()
+    snapshot["lru"] = {
+        name: {
+            "hits": lru.hits,
+            "misses": lru.misses,
+            "evictions": lru.evictions,
+            "entries": len(lru),
+        }
+        for name, lru in lru_caches().items()
+    }
+    return snapshot
+
+
+def merge_process_snapshots(snapshots):
+    merged = merge_snapshots(snapshots)
+    lru = {}
+    for snapshot in snapshots:
+        for name, stats in snapshot.get("lru", {}).items():
+            totals = lru.setdefault(name, dict.fromkeys(stats, 0))
+            for key, value in stats.items():
+                totals[key] = totals.get(key, 0) + value
+    merged["lru"] = lru
+    return merged
+
+
+def _write_json(path, data):
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def _read_json(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+class _DirectoryLock:
+    def __init__(self, directory):
+        self.path = Path(directory) / LOCK_FILE
+
+    def __enter__(self):
+        self.file = open(self.path, "a")
+        fcntl.flock(self.file, fcntl.LOCK_EX)
+
+    def __exit__(self, *exc_info):
+        fcntl.flock(self.file, fcntl.LOCK_UN)
+        self.file.close()
+
+
+class MetricsStore:
+    """
+    Shares this process's snapshot with the other processes on the host.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.last_publish = 0.0
+
+    @property
+    def directory(self):
+        return Path(settings.METRICS_DIR) if settings.METRICS_DIR else None
+
+    def path(self, pid=None):
+        return self.directory / f"metrics-{pid or os.getpid()}.json"
+
+    def publish_if_due(self):
+        """
+        Write this process's snapshot when ``METRICS_PUBLISH_INTERVAL`` has
+        passed since the last write. Does nothing without ``METRICS_DIR``.
+        """
+        if self.directory is None:
+            return
+        now = time.monotonic()
+        if now - self.last_publish < settings.METRICS_PUBLISH_INTERVAL:
+            return
+        with self.lock:
+            if now - self.last_publish < settings.METRICS_PUBLISH_INTERVAL:
+                return
+            self.last_publish = now
+        self.publish()
+
+    def publish(self):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        _write_json(self.path(), process_snapshot())
+
+    def collect(self):
+        """
+        Snapshot of every process on the host.
+
+        Returns:
+            tuple: The merged snapshot and the number of live processes in it
+        """
+        snapshots = [process_snapshot()]
+        if self.directory is None:
+            return merge_process_snapshots(snapshots), 1
+        own = self.path().name
+        for path in self.directory.glob("metrics-*.json"):
+            if path.name != own:
+                snapshot = _read_json(path)
+                if snapshot is not None:
+                    snapshots.append(snapshot)
+        processes = len(snapshots)
+        archive = _read_json(self.directory / ARCHIVE_FILE)
+        if archive is not None:
+            snapshots.append(archive)
+        return merge_process_snapshots(snapshots), processes
+
+
+def archive_process(directory, pid):
+    """
+    Fold an exited process's counters into the archive and remove its file.
+
+    Args:
+        directory: The ``METRICS_DIR``
+        pid: Process ID of the exited worker
+    """
+    directory = Path(directory)
+    path = directory / f"metrics-{pid}.json"
+    with _DirectoryLock(directory):
+        snapshot = _read_json(path)
+        if snapshot is None:
+            return
+        # LRU entry counts describe a live process; only counters carry over.
+        for stats in snapshot.get("lru", {}).values():
+            stats["entries"] = 0
+        archive = _read_json(directory / ARCHIVE_FILE) or {}
+        _write_json(
+            directory / ARCHIVE_FILE, merge_process_snapshots([archive, snapshot])
+        )
+        path.unlink()
+
+
+def clear_directory(directory):
+    """
+    Remove the files of a previous server run.
+    """
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    for path in directory.glob("*.json"):
+        path.unlink()
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels) + "}"
+
+
+def _number(value):
+    if isinstance(value, float):
+        return repr(round(value, 6))
+    return str(value)
+
+
+class _Exposition:
+    def __init__(self):
+        self.lines = []
+
+    def family(self, name, kind, help_text):
+        self.lines.append(f"# HELP {name} {help_text}")
+        self.lines.append(f"# TYPE {name} {kind}")
+
+    def sample(self, name, value, labels=()):
+        self.lines.append(f"{name}{_labels(labels)} {_number(value)}")
+
+    def histogram(self, name, data, labels, scale=1):
+        cumulative = 0
+        for bound, count in zip(data["bounds"], data["counts"]):
+            cumulative += count
+            le = _number(bound * scale)
+            self.sample(f"{name}_bucket", cumulative, (*labels, ("le", le)))
+        self.sample(f"{name}_bucket", data["count"], (*labels, ("le", "+Inf")))
+        self.sample(f"{name}_sum", data["sum"] * scale, labels)
+        self.sample(f"{name}_count", data["count"], labels)
+
+    def text(self):
+        return "\n".join(self.lines) + "\n"
+
+
+# Counter name in RequestMetrics -> (metric name, help text)
+COUNTERS = {
+    "celery_enqueue_failures": (
+        "urlly_celery_enqueue_failures_total",
+        "Celery tasks that could not be enqueued.",
+    ),
+    "db_connections_opened": (
+        "urlly_db_connections_opened_total",
+        "Database connections opened.",
+    ),
+    "db_requests": (
+        "urlly_db_requests_total",
+        "Requests that ran at least one query.",
+    ),
+    "slug_pool_empty": (
+        "urlly_slug_pool_empty_total",
+        "Links created with a generated slug because their code pool was empty.",
+    ),
+}
+
+
+def render(snapshot, processes, visit_lag=None, slug_pools=None):
+    """
+    Format a merged snapshot in the Prometheus text format.
+
+    Args:
+        snapshot: Result of ``merge_process_snapshots``
+        processes: Number of live processes merged into it
+        visit_lag: ``(buffered visits, oldest visit age)`` or None
+        slug_pools: Codes left in each short code pool, by length, or None
+
+    Returns:
+        str: The exposition text
+    """
+    out = _Exposition()
+    views = sorted(snapshot["views"].items())
+
+    out.family(
+        "urlly_request_duration_seconds", "histogram", "Request wall time by view."
+    )
+    for name, view in views:
+        out.histogram(
+            "urlly_request_duration_seconds", view["wall_ms"], (("view", name),), 0.001
+        )
+    out.family(
+        "urlly_request_db_duration_seconds",
+        "histogram",
+        "Time spent in SQL queries per request, by view.",
+    )
+    for name, view in views:
+        out.histogram(
+            "urlly_request_db_duration_seconds", view["db_ms"], (("view", name),), 0.001
+        )
+    out.family("urlly_request_queries", "histogram", "SQL queries per request by view.")
+    for name, view in views:
+        out.histogram("urlly_request_queries", view["queries"], (("view", name),))
+    out.family("urlly_requests_total", "counter", "Requests by view and status.")
+    for name, view in views:
+        for status, count in sorted(view["statuses"].items()):
+            out.sample(
+                "urlly_requests_total", count, (("view", name), ("status", status))
+            )
+    out.family(
+        "urlly_celery_enqueue_seconds_total",
+        "counter",
+        "Time spent enqueueing Celery tasks during requests, by view.",
+    )
+    for name, view in views:
+        out.sample(
+            "urlly_celery_enqueue_seconds_total",
+            view["celery_ms"] / 1000,
+            (("view", name),),
+        )
+    out.family(
+        "urlly_celery_enqueued_total", "counter", "Celery tasks enqueued by view."
+    )
+    for name, view in views:
+        out.sample("urlly_celery_enqueued_total", view["celery_tasks"], (("view", name),))
+
+    out.family(
+        "urlly_cache_lookups_total",
+        "counter",
+        'Cache lookups by result; cache="link" hits are redirects resolved '
+        "without the database.",
+    )
+    for name, outcomes in sorted(snapshot["cache"].items()):
+        for outcome, count in sorted(outcomes.items()):
+            out.sample(
+                "urlly_cache_lookups_total", count, (("cache", name), ("result", outcome))
+            )
+
+    out.family(
+        "urlly_lru_cache_lookups_total",
+        "counter",
+        "Lookups of the in-process user agent and GeoIP caches by result.",
+    )
+    for name, stats in sorted(snapshot["lru"].items()):
+        for outcome, key in (("hit", "hits"), ("miss", "misses")):
+            out.sample(
+                "urlly_lru_cache_lookups_total",
+                stats[key],
+                (("cache", name), ("result", outcome)),
+            )
+    out.family(
+        "urlly_lru_cache_evictions_total", "counter", "Entries evicted from LRU caches."
+    )
+    for name, stats in sorted(snapshot["lru"].items()):
+        out.sample("urlly_lru_cache_evictions_total", stats["evictions"], (("cache", name),))
+    out.family("urlly_lru_cache_entries", "gauge", "Entries held in LRU caches.")
+    for name, stats in sorted(snapshot["lru"].items()):
+        out.sample("urlly_lru_cache_entries", stats["entries"], (("cache", name),))
+
+    counters = {}
+    for name, labels, value in snapshot["counters"]:
+        counters.setdefault(name, []).append((sorted(labels.items()), value))
+    for name, (metric, help_text) in COUNTERS.items():
+        out.family(metric, "counter", help_text)
+        samples = counters.get(name) or [((), 0)]
+        for labels, value in sorted(samples):
+            out.sample(metric, value, labels)
+
+    if visit_lag is not None:
+        depth, age = visit_lag
+        out.family("urlly_visit_buffer_depth", "gauge", "Visits waiting to be stored.")
+        out.sample("urlly_visit_buffer_depth", depth)
+        out.family(
+            "urlly_visit_ingestion_lag_seconds",
+            "gauge",
+            "Age of the oldest visit waiting to be stored.",
+        )
+        out.sample("urlly_visit_ingestion_lag_seconds", age)
+
+    if slug_pools is not None:
+        out.family(
+            "urlly_slug_pool_depth", "gauge", "Unused short codes left in each pool."
+        )
+        for length, depth in sorted(slug_pools.items()):
+            out.sample("urlly_slug_pool_depth", depth, (("length", length),))
+
+    out.family("urlly_metrics_processes", "gauge", "Processes merged into this scrape.")
+    out.sample("urlly_metrics_processes", processes)
+    return out.text()
+
+
+def visit_lag():
+    """
+    The visit buffer's lag, or None when it cannot be read.
+
+    A local buffer only covers the scraped process; the Redis buffer is
+    shared by all of them.
+    """
+    from .visits import visit_ingestor
+
+    try:
+        return visit_ingestor.lag()
+    except Exception:
+        return None
+
+
+def slug_pool_depths():
+    """
+    The depth of every short code pool, or None when the pools are
+    disabled or cannot be read.
+    """
+    from .slugpool import slug_pool
+
+    if not settings.SLUG_POOL_ENABLED:
+        return None
+    try:
+        return slug_pool.depths()
+    except Exception:
+        return None
+
+
+def exposition():
+    """
+    Render the metrics of every process on the host.
+    """
+    snapshot, processes = metrics_store.collect()
+    return render(snapshot, processes, visit_lag(), slug_pool_depths())
+
+
+metrics_store = MetricsStore()
@@ -0,0 +1,78 @@
+"""
+Analytics policies that bound visit storage for bots and viral links.
+
+Every click used to become one ``UrlVisit`` row, so a link going viral (or
+a crawler hammering one) produced write load and storage in proportion to
+its traffic. Two policies keep that bounded:
+
+- Bot visits (``ANALYTICS_BOT_POLICY``): "store" keeps them as rows like
+  any other visit, "aggregate" only adds them to ``UrlModel.bot_click_count``
+  and "drop" discards them. Bots are recognised when visits are enriched,
+  so this is applied by the visit writer (see ``visits.write_visits``).
+- Sampling (``ANALYTICS_SAMPLE_THRESHOLD``): once a link is clicked more
+  than this many times per second in a process, only about ``threshold``
+  visits per second are kept. Each kept visit carries a ``weight`` equal to
+  the number of clicks it stands for, and ``analytics_dashboard`` sums the
+  weights, so totals stay unbiased estimates. 0 disables sampling.
+
+Click counts (``UrlModel.click_count``) are never sampled.
+"""
+
+import math
+import random
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+
+
+class VisitSampler:
+    """
+    Per-process click rate meter deciding which visits to keep.
+
+    Clicks are counted in one-second windows per link; a link's rate is the
+    larger of the current and the previous window. Above the threshold a
+    visit is kept with probability ``1 / weight`` where ``weight`` is
+    ``ceil(rate / threshold)``.
+    """
+
+    def __init__(self, rng=None):
+        self.rng = rng or random.Random()
+        self.lock = threading.Lock()
+        self.window = int(time.monotonic())
+        self.current = Counter()
+        self.previous = Counter()
+
+    def rate(self, url_id):
+        return max(self.current[url_id], self.previous[url_id])
+
+    def weight(self, url_id):
+        """
+        Record a click and decide whether its visit is stored.
+
+        Args:
+            url_id: ID of the clicked UrlModel
+
+        Returns:
+            int: Weight to store the visit with, or 0 to skip it
+        """
+        threshold = settings.ANALYTICS_SAMPLE_THRESHOLD
+        if threshold <= 0:
+            return 1
+        with self.lock:
+            now = int(time.monotonic())
+            if now != self.window:
+                self.previous = self.current if now == self.window + 1 else Counter()
+                self.current = Counter()
+                self.window = now
+            self.current[url_id] += 1
+            rate = self.rate(url_id)
+
+        if rate <= threshold:
+            return 1
+        weight = math.ceil(rate / threshold)
+        return weight if self.rng.random() < 1 / weight else 0
+
+
+visit_sampler = VisitSampler()
@@ -1,15 +1,28 @@
 """
 Signal handlers for URL model cleanup operations.
 
-This module handles automatic cleanup tasks when URL entries are deleted,
-specifically managing associated files like QR codes to prevent orphaned
-files in the storage system.
+This module handles automatic cleanup tasks when URL entries are saved or
+deleted, managing associated files like QR codes to prevent orphaned files
+in the storage system and keeping the redirect cache consistent with the
+database. It also hooks request metrics into database connections and
+Celery task publishing.
 """
 
-from django.db.models.signals import post_delete
+from celery.signals import after_task_publish, before_task_publish
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 
-from .models import UrlModel
+from .bloom import slug_filter
+from .linkcache import invalidate_anonymous_link, invalidate_link
+from .metrics import (
+    install_query_tracer,
+    request_metrics,
+    task_publish_finished,
+    task_publish_started,
+)
+from .models import ShortUrlAnonymous, UrlModel
 
 
 @receiver(post_delete, sender=UrlModel)
@@ -28,3 +41,72 @@ def delete_qr_file(sender, instance, **kwargs):
     """
     if instance.qrcode:
         instance.qrcode.delete(save=False)
+
+
+@receiver(post_save, sender=UrlModel)
+@receiver(post_delete, sender=UrlModel)
+def invalidate_cached_link(sender, instance, **kwargs):
+    """
+    Drop the cached redirect entry for a URL after it changes.
+
+    Args:
+        sender: The model class (UrlModel)
+        instance: The URL instance that was saved or deleted
+        **kwargs: Additional signal arguments
+
+    The invalidation runs once the surrounding transaction commits, so a
+    concurrent redirect cannot re-populate the cache with the old row
+    between the delete and the commit.
+    """
+    slug = instance.short_url
+    transaction.on_commit(lambda: invalidate_link(slug))
+
+
+@receiver(post_save, sender=ShortUrlAnonymous)
+@receiver(post_delete, sender=ShortUrlAnonymous)
+def invalidate_cached_anonymous_link(sender, instance, **kwargs):
+    """
+    Drop the cached redirect entry for an anonymous URL after it changes.
+
+    Runs when the short code is assigned (clearing any cached miss for it)
+    and when the URL is deleted from the admin.
+    """
+    short_code = instance.short_code
+    transaction.on_commit(lambda: invalidate_anonymous_link(short_code))
+
+
+@receiver(post_save, sender=UrlModel)
+@receiver(post_save, sender=ShortUrlAnonymous)
+def add_code_to_slug_filter(sender, instance, **kwargs):
+    """
+    Add a saved link's short code to the Bloom filter of existing codes.
+
+    Added immediately rather than on commit: a code from a rolled back
+    transaction only costs a false positive, while a late addition could
+    briefly 404 a link that has just been created. While the filter is
+    being rebuilt the code also goes to the new filter (see
+    ``urlLogic.bloom.RedisSlugFilter``).
+    """
+    if sender is UrlModel:
+        slug_filter.add(instance.short_url)
+    else:
+        slug_filter.add(instance.short_code)
+
+
+@receiver(connection_created)
+def trace_connection_queries(sender, connection, **kwargs):
+    """
+    Time the queries of new database connections for request metrics.
+    """
+    install_query_tracer(connection)
+    request_metrics.increment("db_connections_opened")
+
+
+@before_task_publish.connect
+def start_task_publish_timer(**kwargs):
+    task_publish_started()
+
+
+@after_task_publish.connect
+def stop_task_publish_timer(**kwargs):
+    task_publish_finished()
@@ -0,0 +1,325 @@
+"""
+Pool of pre-generated random short codes (a key-generation service).
+
+With ``SLUG_POOL_ENABLED`` new anonymous links (``anonymousShorturl``) and
+user links without a custom alias (``make_short_url``) take their code
+from a pool of random, unused codes instead of encoding their primary key.
+Creating the link is then a single INSERT of a code known to be free: no
+lookup for collisions beforehand and no key to reserve.
+
+There is one pool per code length in ``SLUG_POOL_LENGTHS`` (e.g. 5, 6 and
+7 characters). Links get ``SLUG_POOL_LENGTH`` characters unless the form
+asks for another pooled length (``code_length``). Codes are drawn from the
+62 letters and digits; at 5 characters that is 916 million codes, at 7
+over 3.5 trillion.
+
+Each pool is refilled to ``SLUG_POOL_TARGET`` codes once taking a code
+leaves it below ``SLUG_POOL_LOW_WATER``. A refill runs under a lock, so
+only one process fills a pool at a time, and leaves out codes already
+used by a link. Pools are sets, so a code is never pooled twice.
+
+Two backends mirror ``urlLogic.visits``:
+
+- ``RedisSlugPool``: one Redis set per length shared by all processes;
+  ``SPOP`` hands each code to exactly one caller. Refills run in the
+  ``refill_slug_pool`` task, and beat tops the pools up every
+  ``SLUG_POOL_REFILL_INTERVAL`` seconds in case a refill was missed.
+- ``LocalSlugPool``: in-process sets for development and tests, refilled
+  inline.
+
+A code can still be taken by someone else between the refill and its use
+(a custom alias chosen in the meantime, or a link created by the other
+slug scheme). The unique index rejects that INSERT and ``create_link``
+retries once with a generated slug. When a pool is empty, links get a
+generated slug.
+
+``depths`` reports the size of every pool; ``/metrics`` exposes it as
+``urlly_slug_pool_depth`` (see ``urlLogic.prometheus``), next to a count
+of links that found their pool empty.
+"""
+
+import logging
+import secrets
+import threading
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, router, transaction
+
+from .metrics import request_metrics
+from .snowflake import ALPHABET
+from .utils import get_redis_client
+
+logger = logging.getLogger("urlLogic")
+
+REFILL_LOCK_KEY = "urlly:slugpool:refill-lock:{length}"
+REFILL_SCHEDULED_KEY = "urlly:slugpool:refill-scheduled:{length}"
+# Candidates checked against existing links per query.
+CHECK_CHUNK_SIZE = 1000
+
+
+def random_codes(length, count):
+    """
+    Return ``count`` random codes of ``length`` letters and digits.
+    """
+    choice = secrets.choice
+    return {"".join(choice(ALPHABET) for _ in range(length)) for _ in range(count)}
+
+
+def used_codes(codes):
+    """
+    Return which of ``codes`` are already the slug or code of a link.
+    """
+    from .bulk import existing_values
+    from .models import ShortUrlAnonymous, UrlModel
+
+    return existing_values(
+        UrlModel.objects.all(), "short_url", codes, CHECK_CHUNK_SIZE
+    ) | existing_values(
+        ShortUrlAnonymous.objects.all(), "short_code", codes, CHECK_CHUNK_SIZE
+    )
+
+
+class RedisSlugPool:
+    """
+    Pools stored as Redis sets, one per code length.
+    """
+
+    def __init__(self, client):
+        self.client = client
+
+    def key(self, length):
+        return f"urlly:slugpool:{length}"
+
+    def pop(self, length):
+        """
+        Take a code.
+
+        Returns:
+            tuple: The code (None if the pool is empty) and the codes left
+        """
+        pipe = self.client.pipeline(transaction=True)
+        pipe.spop(self.key(length))
+        pipe.scard(self.key(length))
+        code, depth = pipe.execute()
+        return (code.decode() if code is not None else None), depth
+
+    def depth(self, length):
+        return self.client.scard(self.key(length))
+
+    def add(self, length, codes):
+        if not codes:
+            return 0
+        return self.client.sadd(self.key(length), *codes)
+
+    def contains(self, length, codes):
+        codes = list(codes)
+        if not codes:
+            return set()
+        flags = self.client.smismember(self.key(length), codes)
+        return {code for code, flag in zip(codes, flags) if flag}
+
+    def clear(self, length):
+        self.client.delete(self.key(length))
+
+
+class LocalSlugPool:
+    """
+    In-process pools backed by Python sets.
+    """
+
+    def __init__(self):
+        self.pools = {}
+        self.lock = threading.Lock()
+
+    def pop(self, length):
+        with self.lock:
+            pool = self.pools.get(length)
+            code = pool.pop() if pool else None
+            return code, len(pool or ())
+
+    def depth(self, length):
+        return len(self.pools.get(length, ()))
+
+    def add(self, length, codes):
+        with self.lock:
+            pool = self.pools.setdefault(length, set())
+            before = len(pool)
+            pool.update(codes)
+            return len(pool) - before
+
+    def contains(self, length, codes):
+        return set(codes) & self.pools.get(length, set())
+
+    def clear(self, length):
+        with self.lock:
+            self.pools.pop(length, None)
+
+
+class SlugPool:
+    """
+    Entry point for taking pooled codes and refilling the pools.
+
+    The backend is chosen from ``SLUG_POOL_BACKEND`` ("redis", "local" or
+    "auto"); "auto" uses Redis whenever the default cache is Redis.
+    """
+
+    def __init__(self):
+        self._backend = None
+        self._lock = threading.Lock()
+
+    @property
+    def backend(self):
+        if self._backend is None:
+            with self._lock:
+                if self._backend is None:
+                    self._backend = self._build_backend()
+        return self._backend
+
+    def _build_backend(self):
+        choice = settings.SLUG_POOL_BACKEND
+        client = get_redis_client() if choice in ("auto", "redis") else None
+        if client is not None:
+            return RedisSlugPool(client)
+        if choice == "redis":
+            raise RuntimeError("SLUG_POOL_BACKEND is 'redis' but the default cache is not Redis.")
+        return LocalSlugPool()
+
+    def length_for(self, requested=None):
+        """
+        Return the pooled code length to use.
+
+        Args:
+            requested: Length asked for by the user, as submitted
+
+        Returns:
+            int | None: ``requested`` if it is a pooled length, else
+            ``SLUG_POOL_LENGTH``; None when the pool is disabled
+        """
+        if not settings.SLUG_POOL_ENABLED:
+            return None
+        try:
+            length = int(requested)
+        except (TypeError, ValueError):
+            length = None
+        return length if length in settings.SLUG_POOL_LENGTHS else settings.SLUG_POOL_LENGTH
+
+    def take(self, length):
+        """
+        Take an unused code of ``length`` characters.
+
+        Returns:
+            str | None: The code, or None if the pool is empty
+
+        Schedules a refill when the pool falls below ``SLUG_POOL_LOW_WATER``.
+        """
+        try:
+            code, depth = self.backend.pop(length)
+            if depth < settings.SLUG_POOL_LOW_WATER:
+                self.schedule_refill(length)
+                if code is None and isinstance(self.backend, LocalSlugPool):
+                    # Refilled inline: try again.
+                    code, depth = self.backend.pop(length)
+        except Exception:
+            logger.exception("Cannot take a code from the slug pool")
+            return None
+        if code is None:
+            request_metrics.increment("slug_pool_empty", length=str(length))
+        return code
+
+    def schedule_refill(self, length):
+        if isinstance(self.backend, LocalSlugPool):
+            self.refill(length)
+        elif cache.add(
+            REFILL_SCHEDULED_KEY.format(length=length), 1, settings.SLUG_POOL_REFILL_INTERVAL
+        ):
+            from .tasks import refill_slug_pool
+
+            try:
+                refill_slug_pool.delay(length)  # type: ignore
+            except Exception:
+                # The link is created regardless; beat retries the refill.
+                logger.exception("Cannot schedule a slug pool refill")
+                cache.delete(REFILL_SCHEDULED_KEY.format(length=length))
+
+    def refill(self, length, target=None):
+        """
+        Top the pool of ``length``-character codes up to ``target``.
+
+        Args:
+            length: Code length
+            target: Pool size to reach (default ``SLUG_POOL_TARGET``)
+
+        Returns:
+            int | None: Codes added, or None if another refill of this
+            pool holds the lock
+        """
+        target = target or settings.SLUG_POOL_TARGET
+        lock_key = REFILL_LOCK_KEY.format(length=length)
+        if not cache.add(lock_key, 1, 300):
+            return None
+        try:
+            added = 0
+            # Few candidates are rejected, but stop rather than loop forever
+            # if nearly every code of this length is in use.
+            for _ in range(10):
+                missing = target - self.backend.depth(length)
+                if missing <= 0:
+                    break
+                candidates = random_codes(length, missing)
+                candidates -= self.backend.contains(length, candidates)
+                candidates -= used_codes(candidates)
+                added += self.backend.add(length, candidates)
+            logger.info("Added %d codes to the %d-character slug pool", added, length)
+            return added
+        finally:
+            cache.delete(lock_key)
+            cache.delete(REFILL_SCHEDULED_KEY.format(length=length))
+
+    def refill_all(self):
+        """
+        Refill every pool that is below its low-water mark.
+
+        Returns:
+            dict: Codes added per length
+        """
+        return {
+            length: self.refill(length) or 0
+            for length in settings.SLUG_POOL_LENGTHS
+            if self.backend.depth(length) < settings.SLUG_POOL_LOW_WATER
+        }
+
+    def depths(self):
+        """
+        Return the number of codes in every pool, by length.
+        """
+        return {length: self.backend.depth(length) for length in settings.SLUG_POOL_LENGTHS}
+
+    def create_link(self, model, slug_field, length, **fields):
+        """
+        Create a link with a pooled code of ``length`` characters.
+
+        Args:
+            model: ``UrlModel`` or ``ShortUrlAnonymous``
+            slug_field: Name of the model's slug field
+            length: Code length (see ``length_for``)
+            **fields: Other field values
+
+        Returns:
+            The created instance. Without a pooled code, or if the code was
+            taken since it was pooled, the slug is generated instead (see
+            ``urlLogic.ids.create_link``).
+        """
+        from .ids import create_link
+
+        code = self.take(length)
+        if code is not None:
+            try:
+                with transaction.atomic(using=router.db_for_write(model)):
+                    return model.objects.create(**{slug_field: code}, **fields)
+            except IntegrityError:
+                logger.warning("Pooled code %s was already in use", code)
+        return create_link(model, slug_field, **fields)
+
+
+slug_pool = SlugPool()
@@ -0,0 +1,175 @@
+"""
+Coordination-free 64-bit ids and their fixed-width base62 slugs.
+
+Hashids slugs encode the row's primary key, so every new link needs a key
+from the database sequence first (see ``urlLogic.ids``). Snowflake ids are
+made up locally from the clock, a node id and a per-millisecond counter,
+so any number of processes on any number of hosts can create links at once
+without talking to each other or to the database:
+
+    | 40 bits: ms since SNOWFLAKE_EPOCH | 8 bits: node | 11 bits: sequence |
+
+That is 59 bits, which always fits in 10 base62 characters, the size of
+``UrlModel.short_url``. Slugs are padded to exactly ``SLUG_LENGTH``
+characters. 40 bits of milliseconds last about 34 years from the epoch;
+each node can issue 2,048 ids per millisecond.
+
+Ids are unique as long as no two live processes share a node id. A node id
+is ``SNOWFLAKE_NODE_ID`` plus the ``SNOWFLAKE_WORKER_ID`` environment
+variable, which ``gunicorn.conf.py`` sets to a slot number per worker;
+give each host a ``SNOWFLAKE_NODE_ID`` range as wide as its worker count.
+Processes outside gunicorn (Celery, management commands) without the
+variable fall back to their pid, so give them their own range as well or
+accept the small chance of a clash, which the unique slug index turns
+into a failed insert rather than a wrong link.
+
+If the clock steps backwards the generator keeps counting from the last
+millisecond it used instead of reusing ids; when a millisecond's 2,048
+ids are spent it moves on to the next millisecond without waiting.
+
+Ids are only roughly time-ordered across nodes: a node whose clock is
+behind issues lower ids than the others, and rows commit in any order.
+Nothing relies on id order; the slug filter (``urlLogic.bloom``) catches up
+on new rows by ``created_at`` with an overlap window.
+"""
+
+import os
+import string
+import threading
+import time
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+
+ALPHABET = string.digits + string.ascii_uppercase + string.ascii_lowercase
+BASE = len(ALPHABET)
+_DIGITS = {char: value for value, char in enumerate(ALPHABET)}
+
+TIMESTAMP_BITS = 40
+NODE_BITS = 8
+SEQUENCE_BITS = 11
+ID_BITS = TIMESTAMP_BITS + NODE_BITS + SEQUENCE_BITS
+MAX_NODE = (1 << NODE_BITS) - 1
+MAX_SEQUENCE = (1 << SEQUENCE_BITS) - 1
+# Characters needed for the largest id: 10 for 59 bits.
+SLUG_LENGTH = next(width for width in range(1, 20) if BASE**width >= 1 << ID_BITS)
+
+
+def base62_encode(number, width=0):
+    """
+    Encode a non-negative integer in base62, left-padded with "0" to ``width``.
+    """
+    if number < 0:
+        raise ValueError("Only non-negative numbers can be encoded.")
+    chars = []
+    while number:
+        number, digit = divmod(number, BASE)
+        chars.append(ALPHABET[digit])
+    return "".join(reversed(chars)).rjust(width, "0") or "0"
+
+
+def base62_decode(text):
+    """
+    Decode a base62 string.
+
+    Raises:
+        ValueError: If ``text`` is empty or has characters outside the alphabet
+    """
+    if not text:
+        raise ValueError("Empty base62 string.")
+    number = 0
+    try:
+        for char in text:
+            number = number * BASE + _DIGITS[char]
+    except KeyError:
+        raise ValueError(f"Not a base62 string: {text!r}")
+    return number
+
+
+def epoch_ms(value):
+    """
+    Milliseconds since the Unix epoch of an ISO 8601 date (UTC if naive).
+    """
+    epoch = datetime.fromisoformat(value)
+    if epoch.tzinfo is None:
+        epoch = epoch.replace(tzinfo=dt_timezone.utc)
+    return int(epoch.timestamp() * 1000)
+
+
+class Snowflake:
+    """
+    Generator of time-ordered unique ids for one node.
+    """
+
+    def __init__(self, node_id, epoch=0, clock=None):
+        if not 0 <= node_id <= MAX_NODE:
+            raise ValueError(f"node_id must be between 0 and {MAX_NODE}.")
+        self.node_id = node_id
+        self.epoch = epoch
+        self.clock = clock or (lambda: time.time_ns() // 1_000_000)
+        self.lock = threading.Lock()
+        self.last_ms = -1
+        self.sequence = 0
+
+    def next_id(self):
+        """
+        Return a new id, greater than every id this generator returned before.
+        """
+        with self.lock:
+            now = self.clock() - self.epoch
+            if now > self.last_ms:
+                self.last_ms, self.sequence = now, 0
+            elif self.sequence < MAX_SEQUENCE:
+                self.sequence += 1
+            else:
+                self.last_ms, self.sequence = self.last_ms + 1, 0
+            if self.last_ms >> TIMESTAMP_BITS:
+                raise OverflowError("Snowflake timestamp bits exhausted; move SNOWFLAKE_EPOCH.")
+            return (
+                self.last_ms << (NODE_BITS + SEQUENCE_BITS)
+                | self.node_id << SEQUENCE_BITS
+                | self.sequence
+            )
+
+    def parse(self, snowflake_id):
+        """
+        Split an id into its parts.
+
+        Returns:
+            dict: ``timestamp_ms`` (Unix time), ``node_id`` and ``sequence``
+        """
+        return {
+            "timestamp_ms": (snowflake_id >> (NODE_BITS + SEQUENCE_BITS)) + self.epoch,
+            "node_id": (snowflake_id >> SEQUENCE_BITS) & MAX_NODE,
+            "sequence": snowflake_id & MAX_SEQUENCE,
+        }
+
+
+def node_id():
+    """
+    Node id of this process: ``SNOWFLAKE_NODE_ID`` plus the worker slot
+    (``SNOWFLAKE_WORKER_ID``, set by gunicorn) or, without one, the pid.
+    """
+    worker = os.environ.get("SNOWFLAKE_WORKER_ID")
+    offset = int(worker) if worker is not None else os.getpid()
+    return (settings.SNOWFLAKE_NODE_ID + offset) & MAX_NODE
+
+
+_generator = None
+_generator_pid = None
+_generator_lock = threading.Lock()
+
+
+def generator():
+    """
+    Return this process's ``Snowflake``, created again after a fork so
+    that forked workers never share a node id or sequence with the parent.
+    """
+    global _generator, _generator_pid
+    pid = os.getpid()
+    if _generator_pid != pid:
+        with _generator_lock:
+            if _generator_pid != pid:
+                _generator = Snowflake(node_id(), epoch_ms(settings.SNOWFLAKE_EPOCH))
+                _generator_pid = pid
+    return _generator
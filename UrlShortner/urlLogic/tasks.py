@@ -1,13 +1,17 @@
 """
-Asynchronous Celery tasks for URL-related email notifications.
-
-This module handles background tasks for sending QR code emails to users.
-Emails are sent asynchronously to avoid blocking the main application flow
-and include both HTML and plain text versions with file attachments.
+Asynchronous Celery tasks for URL-related background work.
+
+This module handles background tasks for sending QR code emails to users,
+recording visit analytics, flushing buffered click counts, rebuilding
+the short code Bloom filter, pinning hot links in the cache and refilling the
+short code pools. Emails are sent asynchronously to avoid
+blocking the main application flow and include both HTML and plain text
+versions with file attachments.
 """
 
 from celery import shared_task
 from django.conf import settings
+from django.core.cache import cache
 from django.core.mail import EmailMultiAlternatives
 from django.template.loader import render_to_string
 
@@ -67,7 +71,7 @@ def send_qr_email(user_id, filename, filebytes):
 @shared_task
 def save_url_visit_data(url_id, url_visit_data):
     """
-    Save URL visit data asynchronously.
+    Save a single URL visit asynchronously.
 
     Args:
         url_id: ID of the UrlModel instance
@@ -75,24 +79,98 @@ def save_url_visit_data(url_id, url_visit_data):
                         ip_address, browser, os, device, is_bot,
                         country, region, city, referrer
 
-    This task creates a UrlVisit record in the database with the
-    provided visit data.
+    Kept for messages queued before visits were buffered; new visits go
+    through ``urlLogic.visits.visit_ingestor`` and ``drain_visit_buffer``.
     """
-    from .models import UrlModel, UrlVisit
     from django.utils.timezone import now
 
-    url = UrlModel.objects.get(id=url_id)
-
-    UrlVisit.objects.create(
-        url=url,
-        timestamp=now(),
-        ip_address=url_visit_data.get("ip_address"),
-        browser=url_visit_data.get("browser"),
-        os=url_visit_data.get("os"),
-        device=url_visit_data.get("device"),
-        is_bot=url_visit_data.get("is_bot"),
-        country=url_visit_data.get("country"),
-        region=url_visit_data.get("region"),
-        city=url_visit_data.get("city"),
-        referrer=url_visit_data.get("referrer"),
-    )
+    from .visits import write_visits
+
+    visit = dict(url_visit_data)
+    visit["url_id"] = url_id
+    visit["timestamp"] = now().isoformat()
+    write_visits([visit])
+
+
+@shared_task
+def drain_visit_buffer():
+    """
+    Bulk insert buffered visits into ``UrlVisit``.
+
+    Scheduled by Celery beat every ``VISIT_MAX_LATENCY`` seconds and also
+    triggered early whenever the buffer reaches ``VISIT_BATCH_SIZE``.
+    Drains are where visits are enriched, so the worker then shares its
+    user agent and GeoIP cache statistics (see ``urlLogic.prometheus``).
+    """
+    from .prometheus import metrics_store
+    from .visits import visit_ingestor
+
+    visit_ingestor.drain()
+    metrics_store.publish_if_due()
+
+
+@shared_task
+def flush_click_counts():
+    """
+    Apply buffered click counts to ``UrlModel.click_count``.
+
+    Scheduled by Celery beat every ``CLICK_FLUSH_INTERVAL`` seconds (see
+    ``CELERY_BEAT_SCHEDULE``). Each link with pending clicks gets a single
+    ``UPDATE ... SET click_count = click_count + delta``.
+    """
+    from .counters import click_counter
+
+    click_counter.flush()
+
+
+@shared_task
+def rebuild_slug_filter():
+    """
+    Rebuild the Bloom filter of existing short codes from the database.
+
+    Queued by the first lookup that finds no filter in Redis; can also be
+    scheduled periodically to drop codes of deleted links.
+    """
+    from .bloom import REBUILD_SCHEDULED_KEY, slug_filter
+
+    try:
+        slug_filter.rebuild()
+    finally:
+        cache.delete(REBUILD_SCHEDULED_KEY)
+
+
+@shared_task
+def warm_hot_links():
+    """
+    Pin the hottest links in the link cache.
+
+    Scheduled by Celery beat every ``HOT_LINKS_WARM_INTERVAL`` seconds.
+    """
+    from .hotlinks import pin_hot_links
+
+    return pin_hot_links()
+
+
+@shared_task
+def refill_slug_pool(length):
+    """
+    Refill the pool of ``length``-character short codes.
+
+    Queued by link creation when the pool drops below ``SLUG_POOL_LOW_WATER``.
+    """
+    from .slugpool import slug_pool
+
+    return slug_pool.refill(length)
+
+
+@shared_task
+def refill_slug_pools():
+    """
+    Refill every short code pool below its low-water mark.
+
+    Scheduled by Celery beat every ``SLUG_POOL_REFILL_INTERVAL`` seconds
+    when ``SLUG_POOL_ENABLED``.
+    """
+    from .slugpool import slug_pool
+
+    return slug_pool.refill_all()
@@ -0,0 +1,80 @@
+"""
+Test helpers shared by the apps' test suites.
+
+``QueryBudgetMixin`` gives test cases ``assertWithinBudget`` to cap the
+SQL queries of a request, which fails the same way on every machine.
+Latency budgets are only checked with ``LATENCY_BUDGETS=1`` in the
+environment: wall-clock limits fail at random on loaded CI runners and
+under coverage or a debugger. The ``bench_*`` management commands are the
+place to measure latency (see ``urlLogic.benchmarks``).
+"""
+
+import os
+import time
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+
+def latency_budgets_enabled():
+    """
+    True if ``LATENCY_BUDGETS`` is set to a true value in the environment.
+    """
+    return os.environ.get("LATENCY_BUDGETS", "").lower() in ("1", "true", "yes", "on")
+
+
+class QueryBudgetMixin:
+    """
+    ``TestCase`` mixin asserting query and, optionally, latency budgets of
+    a request.
+    """
+
+    def assertWithinBudget(self, send, max_queries, max_ms=None, runs=3):
+        """
+        Call ``send()`` and fail if it runs too many queries or, with
+        ``LATENCY_BUDGETS`` set, is too slow.
+
+        Args:
+            send: Callable making the request; returns the response
+            max_queries: Upper bound of SQL queries for one call
+            max_ms: Upper bound of the fastest of ``runs`` calls, in
+                milliseconds; only checked with ``LATENCY_BUDGETS`` set
+
+        Returns:
+            The response of the first call
+
+        The message of a failed query budget lists every query and the
+        fingerprints that repeat, which is where an N+1 shows up.
+        """
+        from .metrics import top_fingerprints
+
+        with CaptureQueriesContext(connection) as queries:
+            response = send()
+        if len(queries) > max_queries:
+            traced = [(query["sql"], float(query["time"])) for query in queries]
+            repeated = [
+                f"  {count}x [{fingerprint_id}] {sql}"
+                for fingerprint_id, count, _, sql in top_fingerprints(traced, limit=10)
+                if count > 1
+            ]
+            listing = [f"  {i}. {query['sql']}" for i, query in enumerate(queries, 1)]
+            self.fail(
+                f"{len(queries)} queries, budget is {max_queries}.\n"
+                + ("Repeated queries:\n" + "\n".join(repeated) + "\n" if repeated else "")
+                + "All queries:\n"
+                + "\n".join(listing)
+            )
+
+        if max_ms is None or not latency_budgets_enabled():
+            return response
+        fastest = float("inf")
+        for _ in range(runs):
+            start = time.perf_counter()
+            send()
+            fastest = min(fastest, time.perf_counter() - start)
+        self.assertLessEqual(
+            fastest * 1000,
+            max_ms,
+            f"Fastest of {runs} runs took {fastest * 1000:.1f} ms, budget is {max_ms} ms.",
+        )
+        return response
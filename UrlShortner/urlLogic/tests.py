@@ -1,11 +1,71 @@
+import asyncio
+import csv
+import io
+import os
+import random
+import tempfile
+import threading
+import time
 from datetime import timedelta
+from unittest import mock
 
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.test import Client, TestCase
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import DataError, connection
+from django.test import (
+    AsyncRequestFactory,
+    Client,
+    TestCase,
+    TransactionTestCase,
+    override_settings,
+)
+from django.template.loader import render_to_string
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.utils import timezone
 
-from .models import UrlModel, UrlVisit
+from .benchmarks import (
+    seed_anonymous_links,
+    seed_links,
+    seed_visits,
+)
+from .blocklist import SuffixSet, domain_blocklist, normalize_domain
+from .canonical import canonicalize_url, url_hash
+from .bloom import BloomFilter, SlugFilter, optimal_parameters, slug_filter
+from .counters import LocalClickBackend, apply_click_deltas, click_counter
+from .geoip import GeoIPService
+from .ids import allocate_ids, allocator_for, create_link
+from .hotlinks import HotLinkTracker, SpaceSaving, hot_links, pin_hot_links
+from .linkcache import get_link, link_cache_key
+from .lru import LRUCache
+from .metrics import Histogram, fingerprint, request_metrics
+from .prometheus import archive_process, metrics_store
+from .middleware import RedirectFastPathMiddleware, match_redirect
+from .models import (
+    RedirectType,
+    ShortUrlAnonymous,
+    UrlModel,
+    UrlVisit,
+    validate_url_format_and_blacklist,
+)
+from .sampling import VisitSampler
+from .slugpool import slug_pool
+from .testing import QueryBudgetMixin
+from .threats import ThreatFilter, compile_feed, threat_screen, write_filter
+from . import bulk, snowflake, tracking, utils
+from .views import link_redirect, redirect_to_original_async, redirect_url_async
+from .visits import visit_ingestor, write_visits
+
+LOCMEM_CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "urlly-tests",
+    }
+}
 
 User = get_user_model()
 
@@ -30,12 +90,59 @@ class UrlModelTestCase(TestCase):
         if self.url.expires_at is not None:
             self.assertTrue(self.url.expires_at > timezone.now())
 
-    def test_url_unique(self):
-        with self.assertRaises(Exception):
-            UrlModel.objects.create(
-                original_url="https://www.example.com",
-                user=self.user,
-            )
+    def test_url_hash_follows_original_url(self):
+        self.assertEqual(self.url.url_hash, url_hash("https://www.example.com"))
+        self.url.original_url = "https://www.example.com/other"
+        self.url.save(update_fields=["original_url"])
+        self.url.refresh_from_db()
+        self.assertEqual(self.url.url_hash, url_hash("https://www.example.com/other"))
+
+    def test_same_url_for_another_user(self):
+        other = User.objects.create_user(
+            username="other", email="other@example.com", password="testpass"
+        )
+        UrlModel.objects.create(original_url="https://www.example.com", user=other)
+        self.assertEqual(UrlModel.objects.filter(url_hash=self.url.url_hash).count(), 2)
+
+
+class CanonicalUrlTestCase(TestCase):
+    def test_equivalent_urls_share_a_hash(self):
+        self.assertEqual(
+            canonicalize_url("HTTP://Example.COM:80?b=2&utm_source=mail&a=1&fbclid=x#Top"),
+            "http://example.com/?a=1&b=2#Top",
+        )
+        self.assertEqual(
+            url_hash("https://example.com./Path?x=1&x=0"),
+            url_hash("https://EXAMPLE.com:443/Path?x=0&x=1"),
+        )
+
+    def test_meaningful_differences_are_kept(self):
+        self.assertNotEqual(url_hash("https://example.com/a"), url_hash("https://example.com/A"))
+        self.assertNotEqual(url_hash("https://example.com/"), url_hash("http://example.com/"))
+        self.assertNotEqual(url_hash("https://example.com/"), url_hash("https://example.com:8443/"))
+        self.assertEqual(canonicalize_url("https://[::1]:443/"), "https://[::1]/")
+        self.assertEqual(len(url_hash("https://example.com/" + "x" * 5000)), 32)
+
+    @override_settings(URL_TRACKING_PARAMS=["ref"])
+    def test_tracking_params_are_configurable(self):
+        self.assertEqual(
+            canonicalize_url("https://example.com/?ref=a&utm_source=b"),
+            "https://example.com/?utm_source=b",
+        )
+
+    def test_make_short_url_rejects_canonical_duplicates(self):
+        user = User.objects.create_user(
+            username="dup", email="dup@example.com", password="x", is_active=True
+        )
+        self.client.force_login(user)
+        path = reverse("u:make_short_url")
+        self.client.post(path, {"long_url": "https://dup.example.com/?a=1&b=2"})
+        with CaptureQueriesContext(connection) as queries:
+            self.client.post(path, {"long_url": "https://DUP.example.com/?b=2&a=1&utm_medium=x"})
+        link_queries = [q["sql"] for q in queries if '"urlLogic_urlmodel"' in q["sql"]]
+        self.assertEqual(len(link_queries), 1)
+        self.assertIn('"url_hash" =', link_queries[0])
+        self.assertEqual(UrlModel.objects.filter(user=user).count(), 1)
 
 
 class UrlVisitTestCase(TestCase):
@@ -64,9 +171,12 @@ class UrlLogicViewsTestCase(TestCase):
     def setUp(self):
         self.client = Client()
         self.user = User.objects.create_user(
-            username="viewuser", email="viewuser@example.com", password="viewpass"
+            username="viewuser",
+            email="viewuser@example.com",
+            password="viewpass",
+            is_active=True,
         )
-        self.client.login(username="viewuser", password="viewpass")
+        self.client.force_login(self.user)
         self.url = UrlModel.objects.create(
             original_url="https://www.logic.com",
             user=self.user,
@@ -77,7 +187,7 @@ class UrlLogicViewsTestCase(TestCase):
 
     def test_make_short_url(self):
         response = self.client.post(
-            reverse("url:make_short_url"),
+            reverse("u:make_short_url"),
             {
                 "long_url": "https://www.newsite.com",
             },
@@ -86,21 +196,21 @@ class UrlLogicViewsTestCase(TestCase):
 
     def test_redirect_url(self):
         response = self.client.get(
-            reverse("url:redirect_url", args=[self.url.short_url])
+            reverse("u:redirect_url", args=[self.url.short_url])
         )
         # Should redirect to original_url or show expired/404
         self.assertIn(response.status_code, [302, 200])
 
     def test_delete_url(self):
         response = self.client.post(
-            reverse("url:delete_url", args=[self.url.pk]), follow=True
+            reverse("u:delete_url", args=[self.url.pk]), follow=True
         )
         self.assertEqual(response.status_code, 200)
         self.assertFalse(UrlModel.objects.filter(pk=self.url.pk).exists())
 
     def test_update_url(self):
         response = self.client.post(
-            reverse("url:edit_url", args=[self.url.pk]),
+            reverse("u:edit_url", args=[self.url.pk]),
             {
                 "long_url": "https://www.updated.com",
             },
@@ -109,3 +219,1626 @@ class UrlLogicViewsTestCase(TestCase):
         self.assertEqual(response.status_code, 200)
         self.url.refresh_from_db()
         self.assertEqual(self.url.original_url, "https://www.updated.com")
+
+
+@override_settings(
+    CACHES=LOCMEM_CACHES,
+    BLOOM_FILTER_ENABLED=False,
+    CLICK_FLUSH_INTERVAL=3600,
+    VISIT_MAX_LATENCY=3600,
+)
+class LinkCacheTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            username="cacheuser", email="cacheuser@example.com", password="testpass"
+        )
+        self.url = UrlModel.objects.create(
+            original_url="https://www.cached.com",
+            short_url="cached1",
+            user=self.user,
+        )
+
+    def test_get_link_is_read_through(self):
+        with self.assertNumQueries(1):
+            link = get_link("cached1")
+        self.assertEqual(
+            link,
+            {
+                "id": self.url.pk,
+                "original_url": "https://www.cached.com",
+                "expires_at": None,
+                "redirect_type": RedirectType.FOUND,
+                "cache_max_age": None,
+            },
+        )
+        with self.assertNumQueries(0):
+            self.assertEqual(get_link("cached1"), link)
+
+    def test_unknown_slug_is_negatively_cached(self):
+        self.assertIsNone(get_link("missing"))
+        with self.assertNumQueries(0):
+            self.assertIsNone(get_link("missing"))
+
+    def test_creating_link_clears_negative_entry(self):
+        self.assertIsNone(get_link("fresh1"))
+        with self.captureOnCommitCallbacks(execute=True):
+            UrlModel.objects.create(
+                original_url="https://www.fresh.com", short_url="fresh1", user=self.user
+            )
+        self.assertEqual(get_link("fresh1")["original_url"], "https://www.fresh.com")
+
+    def test_repeated_miss_costs_no_query(self):
+        url = reverse("u:redirect_url", args=["missing"])
+        self.assertEqual(self.client.get(url).status_code, 404)
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+        self.assertContains(response, "Page not found", status_code=404)
+
+    def test_prerendered_page_matches_the_live_render(self):
+        url = reverse("u:redirect_url", args=["missing"])
+        for debug, internal_ips in [(False, []), (True, []), (True, ["127.0.0.1"])]:
+            with self.subTest(debug=debug, internal_ips=internal_ips), self.settings(
+                DEBUG=debug, INTERNAL_IPS=internal_ips
+            ):
+                response = self.client.get(url)
+                live = render_to_string("404_notF.html", request=response.wsgi_request)
+                self.assertEqual(response.content.decode(), live)
+
+    def test_anonymous_miss_is_cached_until_code_is_created(self):
+        anon = ShortUrlAnonymous.objects.create(
+            original_url="https://www.anon9.com", ip_address="10.0.0.9"
+        )
+        code = utils.SlugGenerator().encode_url(anon.pk)
+        url = reverse("redirect", args=[code])
+        self.assertEqual(self.client.get(url).status_code, 404)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(url).status_code, 404)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            anon.short_code = code
+            anon.save(update_fields=["short_code"])
+        self.assertEqual(self.client.get(url)["Location"], "https://www.anon9.com")
+
+    def test_generated_slug_is_fetched_by_primary_key(self):
+        url = UrlModel.objects.create(original_url="https://www.pk.com", user=self.user)
+        url.short_url = utils.SlugGenerator().encode_url(url.pk)
+        url.save()
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(get_link(url.short_url)["id"], url.pk)
+        self.assertEqual(len(queries), 1)
+        self.assertIn(f'"id" = {url.pk}', queries[0]["sql"])
+
+    def test_decodable_custom_alias_falls_back_to_short_url(self):
+        other = UrlModel.objects.create(original_url="https://www.other.com", user=self.user)
+        # A custom alias that happens to be the Hashid of another row's id.
+        alias = utils.SlugGenerator().encode_url(other.pk + 1000)
+        UrlModel.objects.create(
+            original_url="https://www.alias.com", short_url=alias, user=self.user
+        )
+        self.assertEqual(get_link(alias)["original_url"], "https://www.alias.com")
+
+    def test_undecodable_anonymous_code_costs_no_query(self):
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse("redirect", args=["not-a-code"]))
+        self.assertEqual(response.status_code, 404)
+
+    def test_save_invalidates_cached_link(self):
+        get_link("cached1")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.url.original_url = "https://www.changed.com"
+            self.url.save()
+        self.assertIsNone(cache.get(link_cache_key("cached1")))
+        self.assertEqual(get_link("cached1")["original_url"], "https://www.changed.com")
+
+    def test_delete_invalidates_cached_link(self):
+        get_link("cached1")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.url.delete()
+        self.assertIsNone(get_link("cached1"))
+
+    def test_redirect_uses_cached_destination(self):
+        get_link("cached1")
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse("u:redirect_url", args=["cached1"]))
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(response["Location"], "https://www.cached.com")
+
+
+@override_settings(CACHES=LOCMEM_CACHES, CLICK_COUNTER_BACKEND="local")
+class ClickCounterTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        click_counter._backend = None
+        self.user = User.objects.create_user(
+            username="clickuser", email="clickuser@example.com", password="testpass"
+        )
+        self.url = UrlModel.objects.create(
+            original_url="https://www.clicks.com",
+            short_url="clicks1",
+            user=self.user,
+            click_count=5,
+        )
+
+    def tearDown(self):
+        click_counter._backend = None
+
+    def test_redirect_counts_without_writing_row(self):
+        self.client.get(reverse("u:redirect_url", args=["clicks1"]))
+        self.client.get(reverse("u:redirect_url", args=["clicks1"]))
+        self.url.refresh_from_db()
+        self.assertEqual(self.url.click_count, 5)
+
+        click_counter.flush()
+        self.url.refresh_from_db()
+        self.assertEqual(self.url.click_count, 7)
+
+    def test_concurrent_increments_are_not_lost(self):
+        def click():
+            for _ in range(500):
+                click_counter.incr(self.url.pk)
+
+        threads = [threading.Thread(target=click) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        click_counter.flush()
+        self.url.refresh_from_db()
+        self.assertEqual(self.url.click_count, 5 + 8 * 500)
+
+    def test_flush_applies_one_update_per_link(self):
+        other = UrlModel.objects.create(
+            original_url="https://www.other.com", short_url="clicks2", user=self.user
+        )
+        with CaptureQueriesContext(connection) as ctx:
+            apply_click_deltas({self.url.pk: 3, other.pk: 4})
+        updates = [q["sql"] for q in ctx.captured_queries if q["sql"].startswith("UPDATE")]
+        self.assertEqual(len(updates), 2)
+        self.assertEqual(UrlModel.objects.get(pk=other.pk).click_count, 4)
+
+    def test_failed_flush_keeps_pending_clicks(self):
+        backend = LocalClickBackend(shards=4)
+        backend.incr(self.url.pk, 3)
+
+        def fail(deltas):
+            raise RuntimeError("database unavailable")
+
+        with self.assertRaises(RuntimeError):
+            backend.drain(fail)
+        backend.drain(apply_click_deltas)
+        self.url.refresh_from_db()
+        self.assertEqual(self.url.click_count, 8)
+
+
+@override_settings(
+    CACHES=LOCMEM_CACHES,
+    VISIT_BUFFER_BACKEND="local",
+    VISIT_BATCH_SIZE=3,
+    VISIT_MAX_LATENCY=3600,
+)
+class VisitIngestionTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        visit_ingestor._buffer = None
+        self.user = User.objects.create_user(
+            username="visituser", email="visituser@example.com", password="testpass"
+        )
+        self.url = UrlModel.objects.create(
+            original_url="https://www.visits.com", short_url="visits1", user=self.user
+        )
+        self.visit = {"ip_address": "10.0.0.1", "browser": "Chrome", "os": "Linux"}
+
+    def tearDown(self):
+        visit_ingestor._buffer = None
+
+    def test_visits_are_buffered_until_drained(self):
+        clicked_at = timezone.now() - timedelta(minutes=5)
+        visit_ingestor.add(self.url.pk, self.visit, timestamp=clicked_at)
+        self.assertEqual(UrlVisit.objects.count(), 0)
+
+        visit_ingestor.drain()
+        visit = UrlVisit.objects.get()
+        self.assertEqual(visit.url, self.url)
+        self.assertEqual(visit.timestamp, clicked_at)
+
+    def test_full_batch_is_written_immediately(self):
+        for _ in range(3):
+            visit_ingestor.add(self.url.pk, self.visit)
+        self.assertEqual(UrlVisit.objects.filter(url=self.url).count(), 3)
+
+    def test_write_visits_is_one_bulk_insert(self):
+        now = timezone.now().isoformat()
+        visits = [
+            dict(self.visit, url_id=self.url.pk, timestamp=now) for _ in range(3)
+        ]
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(write_visits(visits), 3)
+        # The savepoint only guards the surrounding test transaction.
+        statements = [q["sql"] for q in queries if "SAVEPOINT" not in q["sql"]]
+        self.assertEqual(len(statements), 2)
+        self.assertTrue(statements[1].startswith("INSERT"))
+
+    def test_bad_values_are_cleaned(self):
+        now = timezone.now().isoformat()
+        visit = dict(
+            self.visit,
+            url_id=self.url.pk,
+            timestamp=now,
+            ip_address="1.2.3.4, <script>",
+            referrer="https://ref.example.com/" + "x" * 300,
+        )
+        self.assertEqual(write_visits([visit]), 1)
+        stored = UrlVisit.objects.get()
+        self.assertIsNone(stored.ip_address)
+        self.assertEqual(len(stored.referrer), 200)
+
+    def test_rejected_rows_are_dropped_and_the_buffer_moves_on(self):
+        real_bulk_create = UrlVisit.objects.bulk_create
+
+        def bulk_create(rows, **kwargs):
+            if len(rows) > 1 or rows[0].city == "bad":
+                raise DataError("value too long")
+            return real_bulk_create(rows, **kwargs)
+
+        for city in ("good", "bad", "fine"):
+            visit = dict(self.visit, url_id=self.url.pk, city=city)
+            visit_ingestor.buffer.push(dict(visit, timestamp=timezone.now().isoformat()))
+        with mock.patch.object(UrlVisit.objects, "bulk_create", side_effect=bulk_create):
+            with self.assertLogs("urlLogic", "WARNING"):
+                visit_ingestor.drain()
+        self.assertEqual(len(visit_ingestor.buffer), 0)
+        self.assertEqual(
+            sorted(UrlVisit.objects.values_list("city", flat=True)), ["fine", "good"]
+        )
+
+    def test_visits_for_deleted_links_are_dropped(self):
+        now = timezone.now().isoformat()
+        visits = [
+            dict(self.visit, url_id=self.url.pk, timestamp=now),
+            dict(self.visit, url_id=self.url.pk + 1000, timestamp=now),
+        ]
+        self.assertEqual(write_visits(visits), 1)
+
+
+class AnalyticsPolicyTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username="policyuser", email="policyuser@example.com", password="x", is_active=True
+        )
+        self.url = UrlModel.objects.create(
+            original_url="https://www.sampled.com", short_url="sample1", user=self.user
+        )
+        now = timezone.now().isoformat()
+        human = {"ip_address": "10.0.0.1", "browser": "Chrome", "os": "Linux", "is_bot": False}
+        bot = {"ip_address": "10.0.0.2", "browser": "Googlebot", "os": "Other", "is_bot": True}
+        self.visits = [
+            dict(human, url_id=self.url.pk, timestamp=now),
+            dict(bot, url_id=self.url.pk, timestamp=now),
+            dict(bot, url_id=self.url.pk, timestamp=now, weight=3),
+        ]
+
+    @override_settings(ANALYTICS_SAMPLE_THRESHOLD=10)
+    def test_hot_links_are_sampled_without_bias(self):
+        sampler = VisitSampler(rng=random.Random(0))
+        with mock.patch("urlLogic.sampling.time.monotonic", return_value=100.0):
+            weights = [sampler.weight(self.url.pk) for _ in range(5000)]
+
+        kept = [w for w in weights if w]
+        self.assertEqual(weights[:10], [1] * 10)
+        self.assertLess(len(kept), 200)
+        self.assertAlmostEqual(sum(kept), 5000, delta=500)
+
+    @override_settings(ANALYTICS_SAMPLE_THRESHOLD=0)
+    def test_sampling_can_be_disabled(self):
+        sampler = VisitSampler()
+        self.assertEqual({sampler.weight(self.url.pk) for _ in range(500)}, {1})
+
+    @override_settings(ANALYTICS_BOT_POLICY="store")
+    def test_bots_are_stored_by_default(self):
+        self.assertEqual(write_visits(self.visits), 3)
+
+    @override_settings(ANALYTICS_BOT_POLICY="aggregate")
+    def test_bots_can_be_counted_in_aggregate(self):
+        self.assertEqual(write_visits(self.visits), 1)
+        self.url.refresh_from_db()
+        self.assertEqual(self.url.bot_click_count, 4)
+
+    @override_settings(ANALYTICS_BOT_POLICY="drop")
+    def test_bots_can_be_dropped(self):
+        self.assertEqual(write_visits(self.visits), 1)
+        self.url.refresh_from_db()
+        self.assertEqual(self.url.bot_click_count, 0)
+
+    def test_dashboard_scales_counts_by_weight(self):
+        UrlVisit.objects.create(url=self.url, ip_address="10.0.0.1", browser="Chrome", os="Linux")
+        UrlVisit.objects.create(
+            url=self.url, ip_address="10.0.0.1", browser="Chrome", os="Linux", weight=9
+        )
+        self.client.force_login(self.user)
+        response = self.client.get(reverse("u:analytics_dashboard", args=[self.url.pk]))
+        self.assertEqual(response.context["total_visits"], 10)
+        self.assertEqual(response.context["visits_by_day"][0]["clicks"], 10)
+
+
+class VisitEnrichmentTestCase(TestCase):
+    CHROME = (
+        "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+        "(KHTML, like Gecko) Chrome/124.0.0.0 Safari/537.36"
+    )
+    GOOGLEBOT = "Mozilla/5.0 (compatible; Googlebot/2.1; +http://www.google.com/bot.html)"
+
+    def test_capture_visit_does_no_parsing(self):
+        request = Client().get("/").wsgi_request
+        request.META["HTTP_USER_AGENT"] = self.CHROME
+        with mock.patch.object(utils, "parse_user_agent") as parse:
+            visit = utils.capture_visit(request)
+        parse.assert_not_called()
+        self.assertEqual(visit["user_agent"], self.CHROME)
+        self.assertNotIn("browser", visit)
+
+    def test_enrich_resolves_each_distinct_value_once(self):
+        visits = [
+            {"ip_address": "10.0.0.1", "user_agent": self.CHROME, "referrer": None},
+            {"ip_address": "10.0.0.1", "user_agent": self.CHROME, "referrer": None},
+            {"ip_address": "10.0.0.2", "user_agent": self.GOOGLEBOT, "referrer": None},
+        ]
+        with mock.patch.object(
+            utils, "parse_user_agent", wraps=utils.parse_user_agent
+        ) as parse, mock.patch.object(utils, "locate_ip", wraps=utils.locate_ip) as locate:
+            enriched = utils.enrich_visits(visits)
+
+        self.assertEqual(parse.call_count, 2)
+        self.assertEqual(locate.call_count, 2)
+        self.assertEqual(enriched[0]["browser"], "Chrome")
+        self.assertFalse(enriched[0]["is_bot"])
+        self.assertTrue(enriched[2]["is_bot"])
+        self.assertNotIn("user_agent", enriched[0])
+
+    def test_parsed_user_agents_are_memoized(self):
+        utils.ua_cache.clear()
+        first = utils.parse_user_agent(self.CHROME)
+        with mock.patch.object(utils.user_agents, "parse") as parse:
+            second = utils.parse_user_agent(self.CHROME)
+        parse.assert_not_called()
+        self.assertEqual(first, second)
+        self.assertEqual(utils.ua_cache.stats()["hits"], 1)
+
+    def test_enriched_visits_are_left_alone(self):
+        visit = {"ip_address": "10.0.0.1", "browser": "Firefox", "os": "Linux"}
+        self.assertEqual(utils.enrich_visits([dict(visit)]), [visit])
+
+
+@override_settings(
+    CACHES=LOCMEM_CACHES,
+    BLOOM_FILTER_ENABLED=False,
+    CLICK_FLUSH_INTERVAL=3600,
+    VISIT_MAX_LATENCY=3600,
+)
+class RedirectFastPathTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            username="fastuser", email="fastuser@example.com", password="x", is_active=True
+        )
+        UrlModel.objects.create(
+            original_url="https://www.fast.com", short_url="fast1", user=self.user
+        )
+        self.client.force_login(self.user)
+
+    def test_only_redirect_routes_match(self):
+        self.assertEqual(match_redirect("/u/fast1/").view_name, "u:redirect_url")
+        self.assertEqual(match_redirect("/s/abcd/").view_name, "redirect")
+        self.assertIsNone(match_redirect("/u/shortenurl/"))
+        self.assertIsNone(match_redirect("/u/generateqr/"))
+        self.assertIsNone(match_redirect("/u/analytics/1/"))
+        self.assertIsNone(match_redirect("/u/fast1"))
+        self.assertIsNone(match_redirect("/blog/"))
+
+    def test_redirect_skips_session_and_user(self):
+        url = reverse("u:redirect_url", args=["fast1"])
+        self.client.get(url)
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+        self.assertEqual(response["Location"], "https://www.fast.com")
+        self.assertFalse(hasattr(response.wsgi_request, "session"))
+        self.assertFalse(hasattr(response.wsgi_request, "user"))
+
+    def test_other_pages_get_the_full_stack(self):
+        response = self.client.get(reverse("u:home"))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.wsgi_request.user, self.user)
+
+    async def test_async_mode_awaits_the_view(self):
+        async def get_response(request):
+            raise AssertionError("fast path should not call the stack")
+
+        middleware = RedirectFastPathMiddleware(get_response)
+        request = AsyncRequestFactory().get("/u/fast1/")
+        response = await middleware(request)
+        self.assertEqual(response["Location"], "https://www.fast.com")
+
+
+@override_settings(CACHES=LOCMEM_CACHES, BLOOM_FILTER_ENABLED=False)
+class SingleInsertCreationTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            email="ids@example.com", username="ids", password="x", is_active=True
+        )
+        self.client.force_login(self.user)
+
+    def link_writes(self, queries, table):
+        return [
+            q["sql"]
+            for q in queries
+            if q["sql"].startswith(("INSERT", "UPDATE")) and f'"{table}"' in q["sql"]
+        ]
+
+    def test_make_short_url_inserts_once(self):
+        UrlModel.objects.create(original_url="https://a.example.com/", user=self.user)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.post(reverse("u:make_short_url"), {"long_url": "https://b.example.com/"})
+        writes = self.link_writes(queries, "urlLogic_urlmodel")
+        self.assertEqual(len(writes), 1)
+        self.assertTrue(writes[0].startswith("INSERT"))
+
+        link = UrlModel.objects.get(original_url="https://b.example.com/")
+        self.assertEqual(link.short_url, utils.SlugGenerator().encode_url(link.pk))
+        self.assertEqual(get_link(link.short_url)["id"], link.pk)
+
+    def test_custom_alias_needs_no_key(self):
+        self.client.post(
+            reverse("u:make_short_url"),
+            {"long_url": "https://c.example.com/", "short_url": "mine"},
+        )
+        self.assertTrue(UrlModel.objects.filter(short_url="mine").exists())
+
+    def test_anonymous_link_inserts_once(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.post(reverse("urlshort"), {"original_url": "https://d.example.com/"})
+        writes = self.link_writes(queries, "urlLogic_shorturlanonymous")
+        self.assertEqual(len(writes), 1)
+        link = ShortUrlAnonymous.objects.get()
+        self.assertEqual(link.short_code, utils.SlugGenerator().encode_url(link.pk))
+
+    def test_reserved_keys_are_skipped_by_autoincrement(self):
+        reserved = allocate_ids(UrlModel, 3)
+        self.assertEqual(len(set(reserved)), 3)
+        link = UrlModel.objects.create(original_url="https://e.example.com/", user=self.user)
+        self.assertGreater(link.pk, max(reserved))
+
+
+@override_settings(ID_BLOCK_SIZE=10)
+class IdBlockTestCase(TransactionTestCase):
+    def tearDown(self):
+        allocator_for(ShortUrlAnonymous).reset()
+
+    def test_blocks_are_served_from_memory(self):
+        allocator_for(ShortUrlAnonymous).reset()
+        first = allocate_ids(ShortUrlAnonymous, 1)
+        with self.assertNumQueries(0):
+            rest = allocate_ids(ShortUrlAnonymous, 9)
+        self.assertEqual(first + rest, list(range(first[0], first[0] + 10)))
+
+        link = ShortUrlAnonymous.objects.create(
+            original_url="https://f.example.com/", ip_address="10.0.0.1", short_code="x"
+        )
+        self.assertEqual(link.pk, first[0] + 10)
+
+
+class SnowflakeTestCase(TestCase):
+    def test_ids_increase_through_clock_steps_and_full_milliseconds(self):
+        times = iter([1000] * (snowflake.MAX_SEQUENCE + 2) + [999, 1003])
+        generator = snowflake.Snowflake(5, clock=lambda: next(times))
+        ids = [generator.next_id() for _ in range(snowflake.MAX_SEQUENCE + 4)]
+        self.assertEqual(ids, sorted(set(ids)))
+        self.assertEqual(
+            generator.parse(ids[0]), {"timestamp_ms": 1000, "node_id": 5, "sequence": 0}
+        )
+        # Sequence exhausted: borrow the next millisecond instead of waiting.
+        self.assertEqual(generator.parse(ids[snowflake.MAX_SEQUENCE + 1])["timestamp_ms"], 1001)
+        # The clock stepped back to 999: keep counting from 1001.
+        self.assertEqual(generator.parse(ids[-2])["timestamp_ms"], 1001)
+        self.assertEqual(generator.parse(ids[-1])["timestamp_ms"], 1003)
+
+    def test_base62_slugs_have_a_fixed_width(self):
+        slugs = utils.SlugGenerator("snowflake")
+        for pk in (1, 62, 12345, (1 << snowflake.ID_BITS) - 1):
+            slug = slugs.encode_url(pk)
+            self.assertEqual(len(slug), snowflake.SLUG_LENGTH)
+            self.assertEqual(slugs.decode_pk(slug), pk)
+        self.assertEqual(snowflake.base62_decode(snowflake.base62_encode(10**15)), 10**15)
+        with self.assertRaises(ValueError):
+            snowflake.base62_decode("ab-c")
+
+    def test_hashids_slugs_still_decode(self):
+        old = utils.SlugGenerator("hashids").encode_url(42)
+        self.assertEqual(utils.SlugGenerator("snowflake").decode_pk(old), 42)
+        self.assertIsNone(utils.SlugGenerator("snowflake").decode_pk("my-alias"))
+
+
+@override_settings(SLUG_GENERATOR="snowflake")
+class SnowflakeSlugTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            email="flake@example.com", username="flake", password="x", is_active=True
+        )
+        self.client.force_login(self.user)
+
+    def test_links_are_created_without_reserving_keys(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.post(reverse("u:make_short_url"), {"long_url": "https://a.example.com/"})
+        self.assertFalse(any("sqlite_sequence" in q["sql"] for q in queries))
+        link = UrlModel.objects.get()
+        self.assertEqual(len(link.short_url), snowflake.SLUG_LENGTH)
+        self.assertEqual(snowflake.generator().parse(link.pk)["node_id"], snowflake.node_id())
+        self.assertEqual(get_link(link.short_url)["id"], link.pk)
+
+    def test_anonymous_links_redirect(self):
+        self.client.post(reverse("urlshort"), {"original_url": "https://b.example.com/"})
+        link = ShortUrlAnonymous.objects.get()
+        self.assertEqual(len(link.short_code), snowflake.SLUG_LENGTH)
+        response = self.client.get(reverse("redirect", args=[link.short_code]))
+        self.assertEqual(response["Location"], "https://b.example.com/")
+
+    def test_slug_filter_sees_ids_from_a_node_that_is_behind(self):
+        ahead = snowflake.Snowflake(1, clock=lambda: 2_000_000)
+        behind = snowflake.Snowflake(2, clock=lambda: 1_000_000)
+        slugs = utils.SlugGenerator("snowflake")
+
+        def create(pk):
+            link = UrlModel(original_url=f"https://{pk}.example.com/", user=self.user)
+            link.pk, link.short_url = pk, slugs.encode_url(pk)
+            UrlModel.objects.bulk_create([link])
+            return link.short_url
+
+        slug_filter._backend = None
+        self.addCleanup(setattr, slug_filter, "_backend", None)
+        first = create(ahead.next_id())
+        self.assertTrue(slug_filter.might_exist(first))
+        # Saved by another node after this filter's last scan, with a lower id.
+        late = create(behind.next_id())
+        slug_filter.backend.last_refresh -= 60
+        self.assertTrue(slug_filter.might_exist(late))
+
+    def test_slug_filter_admits_ids_issued_since_its_last_scan(self):
+        slug_filter._backend = None
+        self.addCleanup(setattr, slug_filter, "_backend", None)
+        epoch = snowflake.epoch_ms(settings.SNOWFLAKE_EPOCH)
+        old = snowflake.Snowflake(3, epoch, clock=lambda: epoch + 1000).next_id()
+        self.assertFalse(slug_filter.might_exist(utils.SlugGenerator().encode_url(old)))
+
+        with mock.patch("urlLogic.signals.slug_filter", SlugFilter()):
+            link = create_link(
+                UrlModel, "short_url", original_url="https://c.example.com/", user=self.user
+            )
+        self.assertNotIn(link.short_url, slug_filter.backend.bloom)
+        self.assertEqual(get_link(link.short_url)["id"], link.pk)
+
+    def test_allocated_ids_are_unique_and_ordered(self):
+        ids = allocate_ids(UrlModel, 5000)
+        self.assertEqual(ids, sorted(set(ids)))
+
+
+@override_settings(
+    SLUG_POOL_ENABLED=True,
+    SLUG_POOL_BACKEND="local",
+    SLUG_POOL_LENGTHS=[5, 7],
+    SLUG_POOL_LENGTH=5,
+    SLUG_POOL_LOW_WATER=5,
+    SLUG_POOL_TARGET=20,
+)
+class SlugPoolTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        slug_pool._backend = None
+        self.user = User.objects.create_user(
+            email="pool@example.com", username="pool", password="x", is_active=True
+        )
+        self.client.force_login(self.user)
+
+    def tearDown(self):
+        slug_pool._backend = None
+
+    def test_refill_skips_codes_in_use(self):
+        UrlModel.objects.create(
+            original_url="https://a.example.com/", short_url="abcde", user=self.user
+        )
+        with mock.patch("urlLogic.slugpool.random_codes", return_value={"abcde", "ABCDE"}):
+            self.assertEqual(slug_pool.refill(5, target=2), 1)
+        self.assertEqual(slug_pool.backend.pools[5], {"ABCDE"})
+
+    def test_anonymous_link_pops_a_code(self):
+        slug_pool.refill(5)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.post(reverse("urlshort"), {"original_url": "https://b.example.com/"})
+        link = ShortUrlAnonymous.objects.get()
+        self.assertEqual(len(link.short_code), 5)
+        self.assertNotIn(link.short_code, slug_pool.backend.pools[5])
+        self.assertEqual(slug_pool.depths(), {5: 19, 7: 0})
+        link_queries = [q["sql"] for q in queries if "urlLogic_shorturlanonymous" in q["sql"]]
+        self.assertEqual(len(link_queries), 1)
+        self.assertTrue(link_queries[0].startswith("INSERT"))
+
+        response = self.client.get(reverse("redirect", args=[link.short_code]))
+        self.assertEqual(response["Location"], "https://b.example.com/")
+
+    def test_user_link_gets_the_requested_length(self):
+        self.client.post(
+            reverse("u:make_short_url"),
+            {"long_url": "https://c.example.com/", "code_length": "7"},
+        )
+        link = UrlModel.objects.get()
+        self.assertEqual(len(link.short_url), 7)
+        self.assertEqual(get_link(link.short_url)["id"], link.pk)
+        # The empty pool was refilled inline when the link took its code.
+        self.assertEqual(slug_pool.backend.depth(7), 19)
+
+    def test_taken_code_falls_back_to_a_generated_slug(self):
+        UrlModel.objects.create(
+            original_url="https://d.example.com/", short_url="taken", user=self.user
+        )
+        slug_pool.backend.add(5, ["taken"])
+        with override_settings(SLUG_POOL_LOW_WATER=0), self.assertLogs("urlLogic", "WARNING"):
+            link = slug_pool.create_link(
+                UrlModel, "short_url", 5, original_url="https://e.example.com/", user=self.user
+            )
+        self.assertEqual(link.short_url, utils.SlugGenerator().encode_url(link.pk))
+
+    @override_settings(METRICS_TOKEN="scrape-me")
+    def test_depth_is_reported(self):
+        slug_pool.refill(7)
+        response = self.client.get(
+            reverse("metrics"), headers={"Authorization": "Bearer scrape-me"}
+        )
+        text = response.content.decode()
+        self.assertIn('urlly_slug_pool_depth{length="5"} 0', text)
+        self.assertIn('urlly_slug_pool_depth{length="7"} 20', text)
+
+
+class DomainBlocklistTestCase(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "blocked.txt")
+        domain_blocklist.entries = None
+
+    def tearDown(self):
+        domain_blocklist.entries = None
+        self.directory.cleanup()
+
+    def write(self, text, mtime):
+        with open(self.path, "w") as f:
+            f.write(text)
+        os.utime(self.path, ns=(mtime, mtime))
+
+    def test_entries_match_whole_label_suffixes(self):
+        entries = SuffixSet(["evil.com", "bad.co.uk"])
+        self.assertEqual(entries.match("evil.com"), "evil.com")
+        self.assertEqual(entries.match("login.secure.evil.com"), "evil.com")
+        self.assertEqual(entries.match("x.bad.co.uk"), "bad.co.uk")
+        self.assertIsNone(entries.match("notevil.com"))
+        self.assertIsNone(entries.match("evil.com.example.org"))
+        self.assertIsNone(entries.match("co.uk"))
+
+    def test_feed_formats_are_read_as_domains(self):
+        lines = [
+            "# comment", "", "0.0.0.0 Hosts.Example", "*.wild.example",
+            "||adblock.example^", "plain.example # trailing", "bücher.example",
+        ]
+        self.assertEqual(
+            sorted(filter(None, map(normalize_domain, lines))),
+            ["adblock.example", "hosts.example", "plain.example", "wild.example", "xn--bcher-kva.example"],
+        )
+
+    def test_validator_uses_the_host_only(self):
+        with self.assertRaises(ValidationError):
+            validate_url_format_and_blacklist("http://localhost:8000/admin")
+        with self.assertRaises(ValidationError):
+            validate_url_format_and_blacklist("https://WWW.URL-LY.onrender.com./x")
+        validate_url_format_and_blacklist("https://localhost.example.com/")
+        validate_url_format_and_blacklist("https://localhost@example.com/")
+
+    def test_file_is_reloaded_when_it_changes(self):
+        self.write("evil.example\n", 1_000_000_000)
+        with override_settings(BLOCKLIST_PATH=self.path, BLOCKLIST_RELOAD_INTERVAL=0):
+            self.assertEqual(domain_blocklist.match("www.evil.example"), "evil.example")
+            self.assertEqual(domain_blocklist.match("localhost"), "localhost")
+
+            self.write("other.example\n", 2_000_000_000)
+            self.assertIsNone(domain_blocklist.match("www.evil.example"))
+            self.assertEqual(domain_blocklist.match("other.example"), "other.example")
+
+    def test_missing_file_keeps_the_loaded_entries(self):
+        self.write("evil.example\n", 1_000_000_000)
+        with override_settings(BLOCKLIST_PATH=self.path, BLOCKLIST_RELOAD_INTERVAL=0):
+            self.assertEqual(domain_blocklist.match("www.evil.example"), "evil.example")
+
+            os.remove(self.path)
+            with self.assertLogs("urlLogic", "WARNING"):
+                self.assertEqual(domain_blocklist.match("www.evil.example"), "evil.example")
+            self.assertEqual(domain_blocklist.match("127.0.0.1"), "127.0.0.1")
+
+            # The next good file is picked up again.
+            self.write("other.example\n", 2_000_000_000)
+            self.assertIsNone(domain_blocklist.match("www.evil.example"))
+            self.assertEqual(domain_blocklist.match("other.example"), "other.example")
+
+    def test_file_is_not_checked_between_intervals(self):
+        self.write("evil.example\n", 1_000_000_000)
+        with override_settings(BLOCKLIST_PATH=self.path, BLOCKLIST_RELOAD_INTERVAL=3600):
+            self.assertTrue(domain_blocklist.match("evil.example"))
+            self.write("", 2_000_000_000)
+            with mock.patch("urlLogic.blocklist.os.stat") as stat:
+                self.assertTrue(domain_blocklist.match("evil.example"))
+            stat.assert_not_called()
+
+    def test_bench_command_runs(self):
+        out = io.StringIO()
+        call_command("bench_blocklist", sizes=[100], urls=50, stdout=out)
+        self.assertIn("100 entries", out.getvalue())
+
+
+@override_settings(CACHES=LOCMEM_CACHES, THREAT_FILTER_RELOAD_INTERVAL=0)
+class ThreatScreenTestCase(TestCase):
+    FEED = [
+        "# phishing feed",
+        "evil.example",
+        "sites.example.com/~user/paypal/",
+        "https://Shop.Example.org:443/login.php",
+        "http://tracker.example/a?b=2&a=1",
+    ]
+
+    def setUp(self):
+        cache.clear()
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "threats.filter")
+        write_filter(self.path, compile_feed(self.FEED))
+        self.settings_override = override_settings(THREAT_FILTER_PATH=self.path)
+        self.settings_override.enable()
+        self.reset()
+        self.user = User.objects.create_user(
+            username="threats", email="threats@example.com", password="x", is_active=True
+        )
+
+    def tearDown(self):
+        self.settings_override.disable()
+        self.reset()
+        self.directory.cleanup()
+
+    def reset(self):
+        threat_screen.filter = threat_screen.signature = threat_screen.last_check = None
+
+    def test_entries_match_pages_folders_and_hosts(self):
+        for url in (
+            "https://evil.example/anything?x=1",
+            "http://sites.example.com/~user/paypal/verify/index.html",
+            "https://shop.example.org/login.php?session=123",
+            "https://tracker.example/a?a=1&b=2&utm_source=mail",
+        ):
+            self.assertIsNotNone(threat_screen.match(url), url)
+        for url in (
+            "https://www.evil.example/",
+            "https://sites.example.com/~other/",
+            "https://shop.example.org/",
+            "https://tracker.example/a?a=1",
+        ):
+            self.assertIsNone(threat_screen.match(url), url)
+
+    def test_bloom_positives_are_confirmed_exactly(self):
+        threat_filter = threat_screen.current()
+        with mock.patch.object(ThreatFilter, "might_contain", return_value=True):
+            self.assertIsNone(threat_filter.match("https://innocent.example/"))
+            self.assertEqual(threat_filter.match("https://evil.example/"), "evil.example/")
+
+    def test_link_creation_is_screened(self):
+        self.client.force_login(self.user)
+        response = self.client.post(
+            reverse("u:make_short_url"), {"long_url": "evil.example/download"}
+        )
+        self.assertContains(response, "reported as malicious")
+        self.assertFalse(UrlModel.objects.exists())
+
+        self.client.post(reverse("urlshort"), {"original_url": "https://evil.example/"})
+        self.assertFalse(ShortUrlAnonymous.objects.exists())
+
+    def test_redirects_are_screened_when_enabled(self):
+        UrlModel.objects.create(
+            original_url="https://evil.example/", short_url="late", user=self.user
+        )
+        path = reverse("u:redirect_url", args=["late"])
+        self.assertEqual(self.client.get(path).status_code, 302)
+        with override_settings(THREAT_SCREEN_REDIRECTS=True):
+            response = self.client.get(path)
+        self.assertEqual(response.status_code, 403)
+        self.assertContains(response, "Link Blocked", status_code=403)
+
+    def test_replaced_file_is_picked_up(self):
+        self.assertIsNone(threat_screen.match("https://new.example/"))
+        write_filter(self.path, compile_feed(["new.example"]))
+        os.utime(self.path, ns=(2_000_000_000, 2_000_000_000))
+        self.assertIsNotNone(threat_screen.match("https://new.example/"))
+        self.assertIsNone(threat_screen.match("https://evil.example/"))
+
+        write_filter(self.path, b"garbage")
+        self.assertIsNotNone(threat_screen.match("https://new.example/"))
+
+    def test_build_command(self):
+        feed = os.path.join(self.directory.name, "feed.txt")
+        with open(feed, "w") as f:
+            f.write("\n".join(self.FEED + ["cmd.example/x/"]))
+        out = io.StringIO()
+        call_command("build_threat_filter", feed, probes=100, stdout=out)
+        self.assertIn("listed_found: 5/5", out.getvalue())
+        self.assertIsNotNone(threat_screen.match("https://cmd.example/x/y"))
+
+
+@override_settings(CACHES=LOCMEM_CACHES, BULK_SHORTEN_CHUNK_SIZE=50)
+class BulkShortenTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            email="bulk@example.com", username="bulk", password="x", is_active=True
+        )
+
+    def rows(self, text, fmt="csv"):
+        return bulk.parse_rows(io.StringIO(text), fmt)
+
+    def test_csv_and_json_lines_are_parsed(self):
+        rows = self.rows("long_url,Alias,expiry\nexample.com/a,a1,\n\nhttps://b.example.com/,,2030-01-01\n")
+        self.assertEqual(
+            [(r.line, r.url, r.alias, r.expiry) for r in rows],
+            [(2, "example.com/a", "a1", ""), (4, "https://b.example.com/", "", "2030-01-01")],
+        )
+        rows = self.rows('{"url": "https://c.example.com/", "short_url": "c1"}\n"https://d.example.com/"\n', "jsonl")
+        self.assertEqual([(r.url, r.alias) for r in rows], [("https://c.example.com/", "c1"), ("https://d.example.com/", "")])
+
+        with self.assertRaises(bulk.BulkInputError):
+            self.rows("alias\nx\n")
+        with self.assertRaises(bulk.BulkInputError):
+            self.rows("{oops\n", "jsonl")
+
+    def test_invalid_and_duplicate_rows_are_rejected_with_set_queries(self):
+        UrlModel.objects.create(original_url="https://taken.example.com/", short_url="taken", user=self.user)
+        rows = self.rows(
+            "url,alias,expires_at\n"
+            "https://ok.example.com/,,\n"
+            "https://localhost/x,,\n"
+            "https://r.example.com/,shortenurl,\n"
+            "https://bad.example.com/,no spaces,\n"
+            "https://past.example.com/,,2001-01-01\n"
+            "https://when.example.com/,,soon\n"
+            "https://ok.example.com/,,\n"
+            "https://taken.example.com/,,\n"
+            "https://new.example.com/,taken,\n"
+        )
+        with self.assertNumQueries(2):
+            valid = bulk.validate_rows(self.user, rows)
+        self.assertEqual([r.url for r in valid], ["https://ok.example.com/"])
+        self.assertEqual(
+            [r.error for r in rows[1:]],
+            [
+                "This domain is not allowed.",
+                "This alias is reserved.",
+                "Aliases are 1-10 letters, digits, '-' or '_'.",
+                "Expiry is in the past.",
+                "Expiry must be an ISO 8601 date or datetime.",
+                "Duplicate URL in this file.",
+                "This URL has already been shortened.",
+                "This short URL already exists.",
+            ],
+        )
+
+    def test_links_are_created_in_chunks(self):
+        text = "url,alias\n" + "".join(f"https://x.example.com/{i},{'al%d' % i if i % 10 == 0 else ''}\n" for i in range(120))
+        rows = self.rows(text)
+        with CaptureQueriesContext(connection) as queries:
+            links = bulk.shorten(self.user, rows)
+        inserts = [q for q in queries if q["sql"].startswith("INSERT") and '"urlLogic_urlmodel"' in q["sql"]]
+        self.assertEqual(len(links), 120)
+        self.assertEqual(len(inserts), 3)
+        self.assertFalse(any(q["sql"].startswith("UPDATE") and '"urlLogic_urlmodel"' in q["sql"] for q in queries))
+
+        slugs = utils.SlugGenerator()
+        for link in UrlModel.objects.filter(user=self.user):
+            if link.short_url.startswith("al"):
+                continue
+            self.assertEqual(link.short_url, slugs.encode_url(link.pk))
+        self.assertEqual(UrlModel.objects.filter(user=self.user).count(), 120)
+
+    def test_new_codes_reach_the_slug_filter_and_clear_cached_misses(self):
+        self.assertIsNone(get_link("fresh"))
+        with self.captureOnCommitCallbacks(execute=True):
+            bulk.shorten(self.user, self.rows("url,alias\nhttps://f.example.com/,fresh\n"))
+        self.assertTrue(slug_filter.might_exist("fresh"))
+        self.assertEqual(get_link("fresh")["original_url"], "https://f.example.com/")
+
+    def test_conflicting_chunk_is_retried_row_by_row(self):
+        rows = self.rows("url,alias\nhttps://g.example.com/,g1\nhttps://h.example.com/,g2\n")
+        valid = bulk.validate_rows(self.user, rows)
+        UrlModel.objects.create(original_url="https://other.example.com/", short_url="g2", user=self.user)
+        links = bulk.create_links(self.user, valid)
+        self.assertEqual([link.short_url for link in links], ["g1"])
+        self.assertEqual(rows[1].error, "This short URL already exists.")
+
+    def test_upload_returns_a_results_file(self):
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(reverse("u:bulk_shorten")).status_code, 200)
+        upload = SimpleUploadedFile(
+            "links.jsonl", b'{"url": "https://u.example.com/", "alias": "up1"}\n{"url": "nope nope"}\n'
+        )
+        response = self.client.post(reverse("u:bulk_shorten"), {"file": upload})
+        self.assertEqual(response["Content-Type"], "text/csv")
+        self.assertIn("attachment", response["Content-Disposition"])
+        lines = list(csv.reader(io.StringIO(response.content.decode())))
+        self.assertEqual(lines[0], list(bulk.RESULT_FIELDS))
+        self.assertEqual(lines[1], ["1", "https://u.example.com/", "http://testserver/u/up1/", "created", ""])
+        self.assertEqual(lines[2][3], "error")
+
+    @override_settings(BULK_SHORTEN_MAX_ROWS=1)
+    def test_upload_row_limit(self):
+        self.client.force_login(self.user)
+        upload = SimpleUploadedFile("links.csv", b"url\nhttps://a.example.com/\nhttps://b.example.com/\n")
+        response = self.client.post(reverse("u:bulk_shorten"), {"file": upload})
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(UrlModel.objects.exists())
+
+    def test_management_command(self):
+        with tempfile.TemporaryDirectory() as directory:
+            source = os.path.join(directory, "in.csv")
+            output = os.path.join(directory, "out.csv")
+            with open(source, "w") as f:
+                f.write("url\nhttps://m.example.com/\n")
+            call_command(
+                "bulk_shorten", source, user="bulk", output=output,
+                base_url="https://url.ly/", stderr=io.StringIO(),
+            )
+            with open(output) as f:
+                lines = list(csv.reader(f))
+        link = UrlModel.objects.get(original_url="https://m.example.com/")
+        self.assertEqual(lines[1][2], f"https://url.ly/u/{link.short_url}/")
+
+
+class HistogramTestCase(TestCase):
+    def test_buckets_and_quantiles(self):
+        histogram = Histogram((1, 10, 100))
+        for value in (0.5, 1, 5, 5, 50, 500):
+            histogram.observe(value)
+        self.assertEqual(histogram.counts, [2, 2, 1, 1])
+        self.assertEqual(histogram.count, 6)
+        self.assertEqual(histogram.quantile(0.5), 5.5)
+        self.assertEqual(histogram.quantile(1), 100)
+
+    def test_fingerprint_ignores_literals(self):
+        self.assertEqual(
+            fingerprint('SELECT "a" FROM "t" WHERE "id" IN (%s, %s, %s) LIMIT 21'),
+            'SELECT "a" FROM "t" WHERE "id" IN (...) LIMIT ?',
+        )
+        self.assertEqual(
+            fingerprint("SELECT 1 FROM t WHERE name = 'x''y'\n  AND n = 2.5"),
+            fingerprint("SELECT 7 FROM t WHERE name = 'z' AND n = 3"),
+        )
+
+
+@override_settings(
+    CACHES=LOCMEM_CACHES,
+    BLOOM_FILTER_ENABLED=False,
+    CLICK_FLUSH_INTERVAL=3600,
+    VISIT_MAX_LATENCY=3600,
+    SERVER_TIMING_TOKEN="let-me-see",
+)
+class RequestMetricsTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        request_metrics.reset()
+        user = User.objects.create_user(
+            username="metrics", email="metrics@example.com", password="x", is_active=True
+        )
+        UrlModel.objects.create(
+            original_url="https://www.metrics.com", short_url="metric1", user=user
+        )
+
+    def test_requests_are_recorded_per_view(self):
+        url = reverse("u:redirect_url", args=["metric1"])
+        self.client.get(url)
+        self.client.get(url)
+        self.client.get("/no/such/page/")
+
+        snapshot = request_metrics.snapshot()
+        view = snapshot["views"]["u:redirect_url"]
+        self.assertEqual(view["wall_ms"]["count"], 2)
+        self.assertEqual(view["queries"]["sum"], 1)
+        self.assertEqual((view["cache_hits"], view["cache_misses"]), (1, 1))
+        self.assertEqual(view["statuses"], {"302": 2})
+        self.assertIn("unresolved", snapshot["views"])
+        self.assertEqual(snapshot["cache"]["link"], {"hit": 1, "miss": 1})
+
+    def test_server_timing_on_demand(self):
+        url = reverse("u:redirect_url", args=["metric1"])
+        self.assertNotIn("Server-Timing", self.client.get(url))
+        wrong = self.client.get(url, headers={"X-Server-Timing": "guess"})
+        self.assertNotIn("Server-Timing", wrong)
+        non_ascii = self.client.get(url, headers={"X-Server-Timing": "clé"})
+        self.assertNotIn("Server-Timing", non_ascii)
+        response = self.client.get(url, headers={"X-Server-Timing": "let-me-see"})
+        self.assertRegex(response["Server-Timing"], r"^total;dur=[\d.]+, db;dur=")
+
+    @override_settings(REQUEST_SLOW_MS=0)
+    def test_slow_requests_log_query_fingerprints(self):
+        with self.assertLogs("urlLogic", "WARNING") as logs:
+            self.client.get(reverse("u:redirect_url", args=["metric1"]))
+        self.assertIn("Slow request GET /u/metric1/ (u:redirect_url, 302)", logs.output[0])
+        self.assertIn('FROM "urlLogic_urlmodel"', logs.output[0])
+
+
+@override_settings(
+    CACHES=LOCMEM_CACHES,
+    BLOOM_FILTER_ENABLED=False,
+    CLICK_FLUSH_INTERVAL=3600,
+    VISIT_MAX_LATENCY=3600,
+    METRICS_TOKEN="scrape-me",
+    METRICS_DIR="",
+)
+class PrometheusMetricsTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        request_metrics.reset()
+        user = User.objects.create_user(
+            username="prom", email="prom@example.com", password="x", is_active=True
+        )
+        UrlModel.objects.create(
+            original_url="https://www.prom.com", short_url="prom1", user=user
+        )
+
+    def scrape(self):
+        response = self.client.get(
+            reverse("metrics"), headers={"Authorization": "Bearer scrape-me"}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response["Content-Type"].startswith("text/plain; version=0.0.4"))
+        return response.content.decode()
+
+    def test_requires_the_token(self):
+        self.assertEqual(self.client.get(reverse("metrics")).status_code, 404)
+        wrong = self.client.get(reverse("metrics"), headers={"Authorization": "Bearer x"})
+        self.assertEqual(wrong.status_code, 404)
+        non_ascii = self.client.get(reverse("metrics"), headers={"Authorization": "Bearer é"})
+        self.assertEqual(non_ascii.status_code, 404)
+
+    def test_exposes_view_histograms_and_cache_counters(self):
+        self.client.get(reverse("u:redirect_url", args=["prom1"]))
+        self.client.get(reverse("u:redirect_url", args=["prom1"]))
+        text = self.scrape()
+        self.assertIn(
+            'urlly_request_duration_seconds_count{view="u:redirect_url"} 2', text
+        )
+        self.assertIn(
+            'urlly_request_queries_bucket{view="u:redirect_url",le="0"} 1', text
+        )
+        self.assertIn('urlly_requests_total{view="u:redirect_url",status="302"} 2', text)
+        self.assertIn('urlly_cache_lookups_total{cache="link",result="hit"} 1', text)
+        self.assertIn('urlly_lru_cache_lookups_total{cache="user_agent",result="hit"}', text)
+        self.assertIn("urlly_visit_ingestion_lag_seconds ", text)
+        self.assertIn("urlly_metrics_processes 1", text)
+
+    def test_counts_failed_enqueues(self):
+        from celery import Task
+
+        from .tasks import drain_visit_buffer
+
+        with mock.patch.object(Task, "apply_async", side_effect=ConnectionError):
+            with self.assertRaises(ConnectionError):
+                drain_visit_buffer.delay()
+        self.assertIn(
+            'urlly_celery_enqueue_failures_total{task="urlLogic.tasks.drain_visit_buffer"} 1',
+            self.scrape(),
+        )
+
+    def test_merges_and_archives_worker_processes(self):
+        request_metrics.increment("db_connections_opened", 2)
+        with tempfile.TemporaryDirectory() as directory:
+            with override_settings(METRICS_DIR=directory):
+                # Pretend another worker published the same numbers.
+                with mock.patch("os.getpid", return_value=999999):
+                    metrics_store.publish()
+                self.assertIn("urlly_metrics_processes 2", self.scrape())
+                self.assertIn("urlly_db_connections_opened_total 4", self.scrape())
+
+                archive_process(directory, 999999)
+                self.assertFalse(os.path.exists(f"{directory}/metrics-999999.json"))
+                text = self.scrape()
+                self.assertIn("urlly_metrics_processes 1", text)
+                self.assertIn("urlly_db_connections_opened_total 4", text)
+
+
+@override_settings(REDIRECT_MAX_AGE=86400)
+class RedirectPolicyTestCase(TestCase):
+    def link(self, redirect_type, cache_max_age=None, expires_at=None):
+        return {
+            "id": 1,
+            "original_url": "https://www.policy.com",
+            "expires_at": expires_at,
+            "redirect_type": redirect_type,
+            "cache_max_age": cache_max_age,
+        }
+
+    def test_temporary_redirects_are_not_cached(self):
+        for redirect_type in (RedirectType.FOUND, RedirectType.TEMPORARY):
+            response = link_redirect(self.link(redirect_type))
+            self.assertEqual(response.status_code, redirect_type)
+            self.assertEqual(response["Cache-Control"], "no-store")
+
+    def test_permanent_redirect_is_cacheable(self):
+        response = link_redirect(self.link(RedirectType.PERMANENT))
+        self.assertEqual(response.status_code, 301)
+        self.assertEqual(response["Cache-Control"], "public, max-age=86400")
+
+        response = link_redirect(self.link(RedirectType.PERMANENT, cache_max_age=600))
+        self.assertEqual(response["Cache-Control"], "public, max-age=600")
+
+    def test_expiry_caps_cache_lifetime(self):
+        expires_at = timezone.now() + timedelta(minutes=5)
+        response = link_redirect(self.link(RedirectType.PERMANENT, expires_at=expires_at))
+        max_age = int(response["Cache-Control"].split("max-age=")[1])
+        self.assertTrue(295 <= max_age <= 300)
+
+        response = link_redirect(
+            self.link(RedirectType.PERMANENT, cache_max_age=0)
+        )
+        self.assertEqual(response["Cache-Control"], "no-store")
+
+    def test_policy_is_set_from_the_edit_form(self):
+        user = User.objects.create_user(
+            username="policyuser", email="policy@example.com", password="x", is_active=True
+        )
+        url = UrlModel.objects.create(
+            original_url="https://www.policy.com", short_url="policy1", user=user
+        )
+        self.client.force_login(user)
+        self.client.post(
+            reverse("u:edit_url", args=[url.pk]),
+            {"redirect_type": "301", "cache_max_age": "120"},
+        )
+        url.refresh_from_db()
+        self.assertEqual((url.redirect_type, url.cache_max_age), (301, 120))
+
+
+@override_settings(CACHES=LOCMEM_CACHES, BLOOM_FILTER_ENABLED=False)
+class BenchmarkSeedTestCase(TestCase):
+    def test_seeded_links_resolve(self):
+        user = User.objects.create_user(
+            email="seed@example.com", username="seed", password="pw", is_active=True
+        )
+        links = seed_links(user, 20, custom_ratio=0.5)
+        anonymous = seed_anonymous_links(5)
+        seed_visits([link.pk for link in links], 100)
+
+        self.assertEqual(UrlVisit.objects.count(), 100)
+        for link in links:
+            self.assertEqual(get_link(link.short_url)["id"], link.pk)
+        response = self.client.get(reverse("redirect", args=[anonymous[0].short_code]))
+        self.assertEqual(response.status_code, 302)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ViewQueryBudgetTestCase(QueryBudgetMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email="budget@example.com", username="budget", password="x", is_active=True
+        )
+        cls.links = seed_links(cls.user, 300)
+        seed_visits([link.pk for link in cls.links], 3000)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def test_home(self):
+        response = self.assertWithinBudget(
+            lambda: self.client.get(reverse("u:home")), max_queries=4, max_ms=1000
+        )
+        self.assertEqual(len(response.context["urls"]), 300)
+
+    def test_analytics_dashboard(self):
+        url = reverse("u:analytics_dashboard", args=[self.links[0].pk])
+
+        def uncached():
+            cache.clear()  # Measure the view, not its cache_page entry.
+            return self.client.get(url)
+
+        response = self.assertWithinBudget(uncached, max_queries=9, max_ms=250)
+        self.assertTrue(response.context["has_data"])
+
+    def test_latency_budget_is_opt_in(self):
+        def slow():
+            time.sleep(0.01)
+            return "response"
+
+        with mock.patch.dict(os.environ, {"LATENCY_BUDGETS": ""}):
+            self.assertEqual(self.assertWithinBudget(slow, max_queries=0, max_ms=1), "response")
+        with mock.patch.dict(os.environ, {"LATENCY_BUDGETS": "1"}):
+            with self.assertRaises(AssertionError):
+                self.assertWithinBudget(slow, max_queries=0, max_ms=1, runs=1)
+
+
+class SpaceSavingTestCase(TestCase):
+    def test_heavy_hitters_survive_a_long_tail(self):
+        summary = SpaceSaving(capacity=10)
+        rng = random.Random(0)
+        for i in range(20000):
+            summary.offer("hot" if i % 5 == 0 else f"tail{rng.randrange(5000)}")
+        item, count, error = summary.top(1)[0]
+        self.assertEqual(item, "hot")
+        self.assertLessEqual(count - error, 4000)
+        self.assertGreaterEqual(count, 4000)
+
+    def test_merge_keeps_the_top_items(self):
+        a = SpaceSaving(2, {"x": [5, 0], "y": [1, 0]})
+        b = SpaceSaving(2, {"x": [2, 0], "z": [4, 1]})
+        a.merge(b)
+        self.assertEqual(a.top(), [("x", 7, 0), ("z", 4, 1)])
+
+
+@override_settings(CACHES=LOCMEM_CACHES, HOT_LINKS_PUBLISH_INTERVAL=3600)
+class HotLinksTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            username="hotuser",
+            email="hotuser@example.com",
+            password="x",
+            is_active=True,
+            is_staff=True,
+            is_superuser=True,
+        )
+        self.hot = UrlModel.objects.create(
+            original_url="https://www.hot.com", short_url="hot1", user=self.user
+        )
+        self.cold = UrlModel.objects.create(
+            original_url="https://www.cold.com", short_url="cold1", user=self.user
+        )
+
+    def publish(self, clicks):
+        tracker = HotLinkTracker()
+        for url_id in clicks:
+            tracker.record(url_id)
+        self.assertTrue(tracker.publish())
+
+    def test_workers_are_merged_through_the_cache(self):
+        self.publish([self.hot.pk] * 5 + [self.cold.pk])
+        self.publish([self.hot.pk] * 3)
+
+        ranking = hot_links()
+        self.assertEqual([link["short_url"] for link in ranking], ["hot1", "cold1"])
+        self.assertAlmostEqual(ranking[0]["score"], 8, delta=0.1)
+
+    def test_hot_links_are_pinned_in_the_link_cache(self):
+        self.publish([self.hot.pk] * 5 + [self.cold.pk])
+        self.assertEqual(pin_hot_links(count=1), 1)
+        self.assertEqual(cache.get(link_cache_key("hot1"))["id"], self.hot.pk)
+        self.assertIsNone(cache.get(link_cache_key("cold1")))
+
+    def test_link_deleted_while_pinning_is_not_pinned(self):
+        self.publish([self.hot.pk] * 5)
+        set_many = cache.set_many
+
+        def delete_then_write(entries, timeout):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.hot.delete()
+            set_many(entries, timeout)
+
+        with mock.patch.object(cache, "set_many", delete_then_write):
+            self.assertEqual(pin_hot_links(count=1), 0)
+        self.assertIsNone(cache.get(link_cache_key("hot1")))
+        response = self.client.get(reverse("u:redirect_url", args=["hot1"]))
+        self.assertEqual(response.status_code, 404)
+
+    def test_stale_pins_of_earlier_runs_are_dropped(self):
+        self.publish([self.hot.pk] * 5)
+        self.assertEqual(pin_hot_links(count=1), 1)
+        # Deleted, but its invalidation never ran (the on_commit callback is
+        # not executed here), and an old entry is still cached.
+        UrlModel.objects.filter(pk=self.hot.pk).delete()
+        cache.set(link_cache_key("hot1"), {"id": self.hot.pk}, None)
+
+        self.assertEqual(pin_hot_links(count=1), 0)
+        self.assertIsNone(cache.get(link_cache_key("hot1")))
+
+    def test_admin_view_and_json_endpoint(self):
+        self.publish([self.hot.pk] * 2)
+        self.client.force_login(self.user)
+
+        response = self.client.get(reverse("admin:urlLogic_urlmodel_hot"))
+        self.assertContains(response, "hot1")
+        response = self.client.get(reverse("admin:urlLogic_urlmodel_hot_json"))
+        self.assertEqual(response.json()["links"][0]["id"], self.hot.pk)
+
+    def test_bad_limit_falls_back_to_the_default(self):
+        self.publish([self.hot.pk] * 2 + [self.cold.pk])
+        self.client.force_login(self.user)
+        url = reverse("admin:urlLogic_urlmodel_hot_json")
+
+        for limit, expected in [("abc", 2), ("", 2), ("-5", 1), ("0", 1), ("1", 1)]:
+            with self.subTest(limit=limit):
+                response = self.client.get(url, {"limit": limit})
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(len(response.json()["links"]), expected)
+        response = self.client.get(reverse("admin:urlLogic_urlmodel_hot"), {"limit": "abc"})
+        self.assertContains(response, "hot1")
+
+    def test_endpoints_require_staff(self):
+        response = self.client.get(reverse("admin:urlLogic_urlmodel_hot_json"))
+        self.assertEqual(response.status_code, 302)
+
+
+class BloomFilterTestCase(TestCase):
+    def test_sizing_meets_target_error_rate(self):
+        num_bits, num_hashes = optimal_parameters(10000, 0.01)
+        self.assertEqual((num_bits, num_hashes), (95856, 7))
+
+        bloom = BloomFilter.for_capacity(10000, 0.01)
+        for i in range(10000):
+            bloom.add(f"code{i}")
+        self.assertTrue(all(f"code{i}" in bloom for i in range(10000)))
+        false_positives = sum(f"other{i}" in bloom for i in range(10000))
+        self.assertLess(false_positives / 10000, 0.02)
+        self.assertAlmostEqual(bloom.stats()["estimated_fp_rate"], 0.01, delta=0.002)
+
+    def test_save_and_load_round_trip(self):
+        bloom = BloomFilter.for_capacity(100, 0.001)
+        bloom.add("abc123")
+        bloom.watermarks = (7, 3)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "codes.bloom")
+            bloom.save(path)
+            loaded = BloomFilter.load(path)
+
+        self.assertIn("abc123", loaded)
+        self.assertEqual(loaded.stats(), bloom.stats())
+        self.assertEqual(loaded.watermarks, (7, 3))
+
+    def test_rejects_foreign_files(self):
+        with self.assertRaises(ValueError):
+            BloomFilter.from_bytes(b"x" * 64)
+
+
+@override_settings(
+    CACHES=LOCMEM_CACHES,
+    BLOOM_FILTER_BACKEND="local",
+    BLOOM_FILTER_PATH="",
+    BLOOM_FILTER_CAPACITY=1000,
+)
+class SlugFilterTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        slug_filter._backend = None
+        self.addCleanup(setattr, slug_filter, "_backend", None)
+        self.user = User.objects.create_user(
+            username="bloomuser", email="bloomuser@example.com", password="testpass"
+        )
+        UrlModel.objects.create(
+            original_url="https://www.bloom.com", short_url="bloom1", user=self.user
+        )
+        ShortUrlAnonymous.objects.create(
+            original_url="https://www.anon.com", short_code="anonb1", ip_address="10.0.0.1"
+        )
+
+    def test_filter_is_built_from_existing_codes(self):
+        self.assertTrue(slug_filter.might_exist("bloom1"))
+        self.assertTrue(slug_filter.might_exist("anonb1"))
+        self.assertFalse(slug_filter.might_exist("nope42"))
+
+    def test_unknown_slug_is_rejected_without_queries(self):
+        slug_filter.might_exist("bloom1")
+        with self.assertNumQueries(0):
+            self.assertIsNone(get_link("nope42"))
+        self.assertIsNone(cache.get(link_cache_key("nope42")))
+
+    def test_new_links_are_added_on_save(self):
+        self.assertFalse(slug_filter.might_exist("bloom2"))
+        UrlModel.objects.create(
+            original_url="https://www.bloom2.com", short_url="bloom2", user=self.user
+        )
+        self.assertTrue(slug_filter.might_exist("bloom2"))
+        self.assertEqual(get_link("bloom2")["original_url"], "https://www.bloom2.com")
+
+    def test_refresh_picks_up_rows_saved_elsewhere(self):
+        slug_filter.might_exist("bloom1")
+        # bulk_create sends no post_save, like a link created by another process.
+        UrlModel.objects.bulk_create(
+            [UrlModel(original_url="https://www.bulk.com", short_url="bulk01", user=self.user)]
+        )
+        self.assertFalse(slug_filter.might_exist("bulk01"))
+
+        slug_filter.backend.last_refresh -= 60
+        self.assertTrue(slug_filter.might_exist("bulk01"))
+
+    def test_refresh_picks_up_rows_with_lower_ids(self):
+        # Another process holds an older block of keys than this one.
+        UrlModel.objects.bulk_create(
+            [UrlModel(pk=1000, original_url="https://hi.com", short_url="high01", user=self.user)]
+        )
+        self.assertTrue(slug_filter.might_exist("high01"))
+        UrlModel.objects.bulk_create(
+            [UrlModel(pk=500, original_url="https://lo.com", short_url="low001", user=self.user)]
+        )
+        slug_filter.backend.last_refresh -= 60
+        self.assertTrue(slug_filter.might_exist("low001"))
+
+    def test_refresh_picks_up_late_commits(self):
+        slug_filter.might_exist("bloom1")
+        link = UrlModel.objects.bulk_create(
+            [UrlModel(original_url="https://www.late.com", short_url="late02", user=self.user)]
+        )[0]
+        # Created before the last scan but committed after it.
+        created_at = timezone.now() - timedelta(seconds=10)
+        UrlModel.objects.filter(pk=link.pk).update(created_at=created_at)
+        count = slug_filter.backend.bloom.count
+
+        slug_filter.backend.last_refresh -= 60
+        self.assertTrue(slug_filter.might_exist("late02"))
+        # Rows in the overlap that were already covered are not added again.
+        self.assertEqual(slug_filter.backend.bloom.count, count + 1)
+
+    def test_link_created_through_another_filter_is_not_rejected(self):
+        gone = create_link(UrlModel, "short_url", original_url="https://gone.com", user=self.user)
+        create_link(UrlModel, "short_url", original_url="https://kept.com", user=self.user)
+        gone.delete()
+        self.assertFalse(slug_filter.might_exist(gone.short_url, "urlLogic.UrlModel"))
+
+        # Saved by another process: only that process's filter hears of it.
+        other = SlugFilter()
+        with mock.patch("urlLogic.signals.slug_filter", other):
+            link = create_link(
+                UrlModel, "short_url", original_url="https://elsewhere.com", user=self.user
+            )
+        self.assertTrue(other.might_exist(link.short_url))
+        self.assertNotIn(link.short_url, slug_filter.backend.bloom)
+        self.assertEqual(get_link(link.short_url)["id"], link.pk)
+        # Keys covered by the last scan are still answered from the filter.
+        self.assertFalse(slug_filter.might_exist(gone.short_url, "urlLogic.UrlModel"))
+
+    def test_codes_saved_during_a_rebuild_survive_it(self):
+        slug_filter.might_exist("bloom1")
+        backend = slug_filter.backend
+        install = backend.install
+
+        def save_then_install(new):
+            # Saved after the scan, committed after the final catch-up.
+            slug_filter.add("inflt1")
+            install(new)
+
+        with mock.patch.object(backend, "install", save_then_install):
+            slug_filter.rebuild()
+        self.assertTrue(slug_filter.might_exist("inflt1"))
+
+    def test_saved_filter_is_loaded_and_caught_up(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "codes.bloom")
+            slug_filter.rebuild()
+            slug_filter.save(path)
+            UrlModel.objects.bulk_create(
+                [UrlModel(original_url="https://www.late.com", short_url="late01", user=self.user)]
+            )
+
+            slug_filter._backend = None
+            with self.settings(BLOOM_FILTER_PATH=path):
+                self.assertTrue(slug_filter.might_exist("bloom1"))
+                self.assertTrue(slug_filter.might_exist("late01"))
+
+    def test_disabled_filter_admits_everything(self):
+        with self.settings(BLOOM_FILTER_ENABLED=False):
+            self.assertTrue(slug_filter.might_exist("nope42"))
+
+    def test_stats_report_error_rate(self):
+        stats = slug_filter.rebuild(fp_rate=0.01)
+        self.assertEqual(stats["count"], 2)
+        self.assertEqual(stats["target_fp_rate"], 0.01)
+        self.assertLess(stats["estimated_fp_rate"], 0.01)
+
+
+class LRUCacheTestCase(TestCase):
+    def test_least_recently_used_entry_is_evicted(self):
+        lru = LRUCache(maxsize=2)
+        lru.set("a", 1)
+        lru.set("b", 2)
+        lru.get("a")
+        lru.set("c", 3)
+
+        self.assertEqual(lru.get("a"), 1)
+        self.assertIsNone(lru.get("b"))
+        self.assertEqual(lru.get("c"), 3)
+        self.assertEqual(lru.evictions, 1)
+
+    def test_get_or_set_counts_hits_and_misses(self):
+        lru = LRUCache(maxsize=8)
+        compute = mock.Mock(side_effect=str.upper)
+        for key in ["x", "y", "x", "x"]:
+            lru.get_or_set(key, compute)
+
+        self.assertEqual(compute.call_count, 2)
+        stats = lru.stats()
+        self.assertEqual((stats["hits"], stats["misses"]), (2, 2))
+        self.assertEqual(stats["hit_ratio"], 0.5)
+
+
+class GeoIPServiceTestCase(TestCase):
+    def test_missing_database_degrades_to_empty_locations(self):
+        service = GeoIPService(path="/nonexistent/GeoLite2-City.mmdb")
+        self.assertIsNone(service._reader)
+
+        location = service.locate("8.8.8.8")
+        self.assertEqual(location, {"country": None, "region": None, "city": None})
+        self.assertFalse(service.available)
+
+    def test_ipv4_results_can_be_cached_per_24(self):
+        service = GeoIPService(granularity="24")
+        self.assertEqual(service.cache_key("203.0.113.57"), "203.0.113.0/24")
+        self.assertEqual(service.cache_key("2001:db8::1"), "2001:db8::1")
+
+        found = {"country": "Testland", "region": None, "city": None}
+        with mock.patch.object(service, "_lookup", return_value=found) as lookup:
+            service.locate("203.0.113.1")
+            service.locate("203.0.113.200")
+        self.assertEqual(lookup.call_count, 1)
+
+    def test_invalid_address_is_not_looked_up(self):
+        service = GeoIPService(granularity="24")
+        with mock.patch.object(service, "_lookup") as lookup:
+            self.assertIsNone(service.locate("not-an-ip")["country"])
+        lookup.assert_not_called()
+
+
+@override_settings(
+    CACHES=LOCMEM_CACHES,
+    CLICK_COUNTER_BACKEND="local",
+    VISIT_BUFFER_BACKEND="local",
+    VISIT_MAX_LATENCY=3600,
+)
+class AsyncRedirectTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        click_counter._backend = None
+        visit_ingestor._buffer = None
+        self.factory = AsyncRequestFactory()
+        self.user = User.objects.create_user(
+            username="asyncuser", email="asyncuser@example.com", password="testpass"
+        )
+        self.url = UrlModel.objects.create(
+            original_url="https://www.async.com", short_url="async1", user=self.user
+        )
+        anon = ShortUrlAnonymous.objects.create(
+            original_url="https://www.anon.com", ip_address="10.0.0.1"
+        )
+        self.anon_code = utils.SlugGenerator().encode_url(anon.pk)
+        anon.short_code = self.anon_code
+        anon.save(update_fields=["short_code"])
+
+    def tearDown(self):
+        click_counter._backend = None
+        visit_ingestor._buffer = None
+
+    async def test_redirect_url_async(self):
+        response = await redirect_url_async(self.factory.get("/u/async1/"), "async1")
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(response["Location"], "https://www.async.com")
+
+        await asyncio.gather(*tracking._pending)
+        self.assertEqual(len(visit_ingestor.buffer), 1)
+
+    async def test_redirect_url_async_unknown_slug(self):
+        response = await redirect_url_async(self.factory.get("/u/nope/"), "nope")
+        self.assertContains(response, "404", status_code=404)
+
+    async def test_redirect_to_original_async(self):
+        response = await redirect_to_original_async(
+            self.factory.get(f"/s/{self.anon_code}/"), self.anon_code
+        )
+        self.assertEqual(response["Location"], "https://www.anon.com")
+
+        response = await redirect_to_original_async(self.factory.get("/s/nope/"), "nope")
+        self.assertEqual(response.status_code, 404)
@@ -0,0 +1,285 @@
+"""
+Screening of link destinations against a local malicious-URL feed.
+
+The domain blocklist (``urlLogic.blocklist``) blocks whole domains; threat
+feeds mostly list single pages and folders on otherwise legitimate hosts
+(``sites.example.com/~user/paypal/``). They are checked here, without a
+network call, when links are created and, with ``THREAT_SCREEN_REDIRECTS``,
+on every redirect.
+
+URLs are compared as keys of the form ``host/path[?query]``, taken from the
+canonical URL (see ``urlLogic.canonical``; the scheme is dropped, so http
+and https match alike). A URL is listed when any of these keys is in the
+feed:
+
+- the full key with its query, and without it
+- each folder of its path: ``host/``, ``host/a/``, ``host/a/b/``...
+  (the first ``MAX_PATH_PREFIXES``)
+
+So a feed line ``evil.example/phish/`` covers everything below that
+folder, ``evil.example/login.php`` covers that page whatever its query, and
+``evil.example`` covers the whole host.
+
+``build_threat_filter`` compiles a plain-text feed (one URL or prefix per
+line, ``#`` comments) into a single file at ``THREAT_FILTER_PATH``:
+
+- a header with the filter's parameters
+- a Bloom filter of the keys, sized for ``THREAT_FILTER_FP_RATE``
+- the sorted 128-bit BLAKE2b digests of the keys
+
+Workers open the file with ``mmap``, so all processes on a host share one
+copy in the page cache and only pages that lookups touch are read. Nearly
+every URL is cleared by the Bloom filter after a few bit probes; the rare
+positives are confirmed by a binary search of the digests, so a false
+positive of the filter never blocks a link. The file is checked for
+changes every ``THREAT_FILTER_RELOAD_INTERVAL`` seconds; replacing it
+(the command writes a temporary file and renames it) swaps the new feed in.
+"""
+
+import hashlib
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+from urllib.parse import urlsplit
+
+from django.conf import settings
+
+from .bloom import BloomFilter, estimated_fp_rate, hash_pair
+from .canonical import canonicalize_url
+
+logger = logging.getLogger("urlLogic")
+
+MAX_PATH_PREFIXES = 6
+DIGEST_SIZE = 16
+
+
+def _key(url):
+    parts = urlsplit(canonicalize_url(url))
+    host = parts.netloc.rpartition("@")[2]
+    return host, parts.path, parts.query
+
+
+def feed_key(line):
+    """
+    Read a feed line as a lookup key.
+
+    Returns:
+        str: ``host/path[?query]``, or "" for blank and comment lines
+    """
+    line = line.split("#", 1)[0].strip()
+    if not line:
+        return ""
+    if "://" not in line:
+        line = "http://" + line
+    host, path, query = _key(line)
+    if not host:
+        return ""
+    return f"{host}{path}?{query}" if query else f"{host}{path}"
+
+
+def lookup_keys(url):
+    """
+    Return the keys under which ``url`` could be listed in a feed.
+    """
+    host, path, query = _key(url)
+    keys = []
+    if query:
+        keys.append(f"{host}{path}?{query}")
+    keys.append(f"{host}{path}")
+    slash = path.find("/")
+    prefixes = 0
+    while slash != -1 and prefixes < MAX_PATH_PREFIXES:
+        prefix = f"{host}{path[: slash + 1]}"
+        if prefix != keys[-1]:
+            keys.append(prefix)
+        prefixes += 1
+        slash = path.find("/", slash + 1)
+    return keys
+
+
+def digest(key):
+    return hashlib.blake2b(key.encode("utf-8"), digest_size=DIGEST_SIZE).digest()
+
+
+def compile_feed(lines, fp_rate=None):
+    """
+    Compile feed lines into the contents of a threat filter file.
+
+    Args:
+        lines: Iterable of feed lines
+        fp_rate: Bloom filter error rate (default ``THREAT_FILTER_FP_RATE``)
+
+    Returns:
+        bytes: Header, Bloom filter bits and sorted digests
+    """
+    keys = {key for key in map(feed_key, lines) if key}
+    bloom = BloomFilter.for_capacity(len(keys), fp_rate or settings.THREAT_FILTER_FP_RATE)
+    for key in keys:
+        bloom.add(key)
+    digests = sorted(map(digest, keys))
+    header = ThreatFilter.HEADER.pack(
+        ThreatFilter.MAGIC,
+        bloom.num_bits,
+        bloom.num_hashes,
+        bloom.count,
+        bloom.fp_rate,
+        len(digests),
+    )
+    return b"".join([header, bloom.bits, *digests])
+
+
+def write_filter(path, data):
+    """
+    Write a compiled filter to ``path``, replacing any previous file atomically.
+    """
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+class ThreatFilter:
+    """
+    Read-only, memory-mapped threat filter file.
+    """
+
+    MAGIC = b"URLYTHR1"
+    HEADER = struct.Struct("<8sQIQdQ")
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self.mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            header = self.HEADER.unpack_from(self.mmap)
+        except struct.error:
+            raise ValueError("Not a threat filter file.")
+        magic, self.num_bits, self.num_hashes, self.count, self.fp_rate, self.num_digests = (
+            header
+        )
+        self.bits_offset = self.HEADER.size
+        self.digests_offset = self.bits_offset + self.num_bits // 8
+        expected = self.digests_offset + self.num_digests * DIGEST_SIZE
+        if magic != self.MAGIC or len(self.mmap) != expected:
+            raise ValueError("Not a threat filter file.")
+
+    def might_contain(self, key):
+        """
+        Bloom filter test: False means ``key`` is definitely not listed.
+        """
+        h1, h2 = hash_pair(key)
+        data, offset, num_bits = self.mmap, self.bits_offset, self.num_bits
+        for i in range(self.num_hashes):
+            pos = (h1 + i * h2) % num_bits
+            if not data[offset + (pos >> 3)] & (0x80 >> (pos & 7)):
+                return False
+        return True
+
+    def contains(self, key):
+        """
+        Exact test: binary search of the sorted digests.
+        """
+        target = digest(key)
+        data, offset = self.mmap, self.digests_offset
+        low, high = 0, self.num_digests
+        while low < high:
+            middle = (low + high) // 2
+            start = offset + middle * DIGEST_SIZE
+            value = data[start : start + DIGEST_SIZE]
+            if value < target:
+                low = middle + 1
+            elif value > target:
+                high = middle
+            else:
+                return True
+        return False
+
+    def match(self, url):
+        """
+        Return the listed key that covers ``url``, or None.
+        """
+        for key in lookup_keys(url):
+            if self.might_contain(key) and self.contains(key):
+                return key
+        return None
+
+    def stats(self):
+        return {
+            "entries": self.num_digests,
+            "file_bytes": len(self.mmap),
+            "bloom_bytes": self.num_bits // 8,
+            "digest_bytes": self.num_digests * DIGEST_SIZE,
+            "num_hashes": self.num_hashes,
+            "target_fp_rate": self.fp_rate,
+            "estimated_fp_rate": estimated_fp_rate(
+                self.num_bits, self.num_hashes, self.count
+            ),
+        }
+
+
+class ThreatScreen:
+    """
+    The ``THREAT_FILTER_PATH`` filter of this process, reopened when the
+    file changes. Without a file every URL passes.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.filter = None
+        self.signature = None
+        self.last_check = None
+
+    def current(self):
+        """
+        Return the open ``ThreatFilter``, or None if there is no file.
+        """
+        last_check = self.last_check
+        if (
+            last_check is None
+            or time.monotonic() - last_check >= settings.THREAT_FILTER_RELOAD_INTERVAL
+        ):
+            self.reload()
+        return self.filter
+
+    def reload(self):
+        with self.lock:
+            self.last_check = time.monotonic()
+            path = settings.THREAT_FILTER_PATH
+            try:
+                stat = os.stat(path) if path else None
+            except OSError:
+                stat = None
+            signature = (path, stat.st_mtime_ns, stat.st_size) if stat else None
+            if signature == self.signature:
+                return
+            try:
+                self.filter = ThreatFilter(path) if signature else None
+            except (OSError, ValueError) as e:
+                logger.warning("Ignoring unreadable threat filter %s: %s", path, e)
+                return
+            self.signature = signature
+            if self.filter is not None:
+                logger.info("Loaded threat filter with %d entries", self.filter.num_digests)
+
+    def match(self, url):
+        """
+        Return the feed entry that lists ``url``, or None.
+
+        Args:
+            url: Absolute URL
+        """
+        if not settings.THREAT_SCREEN_ENABLED:
+            return None
+        threat_filter = self.current()
+        if threat_filter is None:
+            return None
+        try:
+            return threat_filter.match(url)
+        except ValueError:
+            # Not parseable as a URL (e.g. a bad IPv6 literal).
+            return None
+
+
+threat_screen = ThreatScreen()
@@ -0,0 +1,73 @@
+"""
+Click tracking shared by the sync and async redirect paths.
+
+A click is recorded in two places, neither of which touches the database
+on the request path:
+
+- the sharded click counter (``urlLogic.counters``) and the hot link
+  summary (``urlLogic.hotlinks``)
+- the visit buffer (``urlLogic.visits``), unless the link is hot enough
+  for its visits to be sampled (``urlLogic.sampling``)
+
+``record_click`` does both synchronously. ``schedule_click`` is the async
+counterpart: it hands the work to a worker thread and returns immediately,
+so the event loop never waits on Redis (or on an in-process flush).
+"""
+
+import asyncio
+import logging
+
+from asgiref.sync import sync_to_async
+
+from .counters import click_counter
+from .hotlinks import hot_link_tracker
+from .sampling import visit_sampler
+from .visits import visit_ingestor
+
+logger = logging.getLogger("urlLogic")
+
+# Strong references to in-flight background tasks so they are not
+# garbage-collected before they finish.
+_pending = set()
+
+
+def record_click(url_id, visit):
+    """
+    Count a click and buffer its visit data (possibly sampled).
+
+    Args:
+        url_id: ID of the clicked UrlModel
+        visit: Raw visit facts from ``utils.capture_visit``
+    """
+    click_counter.incr(url_id)
+    hot_link_tracker.record(url_id)
+    weight = visit_sampler.weight(url_id)
+    if weight > 1:
+        visit = {**visit, "weight": weight}
+    if weight:
+        visit_ingestor.add(url_id, visit)
+
+
+def _log_failure(task):
+    _pending.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logger.error("Recording a click failed", exc_info=task.exception())
+
+
+def schedule_click(url_id, visit):
+    """
+    Record a click in the background from async code.
+
+    Args:
+        url_id: ID of the clicked UrlModel
+        visit: Raw visit facts from ``utils.capture_visit``
+
+    Must be called from a running event loop. The returned task can be
+    awaited (tests do) but the redirect views do not wait for it.
+    """
+    task = asyncio.get_running_loop().create_task(
+        sync_to_async(record_click, thread_sensitive=False)(url_id, visit)
+    )
+    _pending.add(task)
+    task.add_done_callback(_log_failure)
+    return task
@@ -12,26 +12,34 @@ Core Features:
 URL Patterns:
 - /: Dashboard view for URL management
 - /shortenurl/: Create new shortened URLs
+- /bulk/: Shorten every URL of an uploaded CSV or JSON-lines file
 - /generateqr/: Generate QR codes for URLs
 - /delete/<id>/: Delete existing URLs
 - /updateurl/<id>/: Update URL settings
 - /<slug>/: Redirect to original URL
 - /downloadqr/<id>/: Download QR code image
 - /mailqr/<id>/: Email QR code to user
+
+The redirect route uses the async view when ``ASYNC_REDIRECTS`` is set
+(ASGI deployments) and the sync view otherwise.
 """
 
+from django.conf import settings
 from django.urls import path
 
 from . import views
 
+redirect_view = views.redirect_url_async if settings.ASYNC_REDIRECTS else views.redirect_url
+
 urlpatterns = [
     path("", views.home, name="home"),
     path("shortenurl/", views.make_short_url, name="make_short_url"),
+    path("bulk/", views.bulk_shorten, name="bulk_shorten"),
     path("analytics/<int:id>/", views.analytics_dashboard, name="analytics_dashboard"),
     path("generateqr/", views.generate_qr, name="generate_qr"),
     path("delete/<int:id>/", views.delete_url, name="delete_url"),
     path("updateurl/<int:id>/", views.update_url, name="edit_url"),
-    path("<str:slug>/", views.redirect_url, name="redirect_url"),
+    path("<str:slug>/", redirect_view, name="redirect_url"),
     path("downloadqr/<int:id>/", views.download_qr, name="download_qr"),
     path("mailqr/<int:id>/", views.mail_qr, name="mail_qr"),
 ]
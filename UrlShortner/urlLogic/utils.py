@@ -2,9 +2,9 @@
 Utility functions and classes for URL shortening and analytics.
 
 This module provides core functionality for:
-- URL slug generation and handling
+- URL slug generation and handling (Hashids or Snowflake ids)
 - QR code generation with custom branding
-- Visit analytics and tracking
+- Visit capture (request path) and enrichment (background)
 - Geolocation and user agent parsing
 - IP address handling
 
@@ -12,10 +12,10 @@ The utilities handle both the technical aspects of URL shortening
 and the analytics gathering for URL visits.
 """
 
+import ipaddress
 import os
 from io import BytesIO
 
-import geoip2.database
 import qrcode
 import requests
 import user_agents
@@ -25,18 +25,53 @@ from django.http import FileResponse
 from hashids import Hashids
 from PIL import Image
 
+from . import snowflake
+from .geoip import geoip
+from .lru import LRUCache
+
 hashid = Hashids(min_length=4, salt=settings.SALT)
-reader = geoip2.database.Reader("GeoLite2-City.mmdb")
+# Length of ``UrlVisit.referrer`` (a URLField); longer referrers are cut.
+REFERRER_MAX_LENGTH = 200
+# Per-process memo of parsed user agents, shared by web and Celery code paths.
+ua_cache = LRUCache(maxsize=settings.UA_CACHE_SIZE)
 
 
 class SlugGenerator:
     """
-    Handles encoding and decoding of URL slugs using Hashids.
+    Handles encoding and decoding of URL slugs.
+
+    Slugs are made from a row's primary key by one of two schemes, chosen
+    with ``SLUG_GENERATOR``:
+
+    - "hashids": Hashids of a key from the table's sequence, using a salt
+      for added security (short, variable length)
+    - "snowflake": the key is a Snowflake id made up in-process and the slug
+      is its fixed-width base62 form (see ``urlLogic.snowflake``)
 
-    This class provides a secure way to generate short URLs from IDs and
-    decode them back, using a salt for added security.
+    Slugs of the other scheme are still decoded in snowflake mode, so links
+    created before the switch keep resolving by primary key.
     """
 
+    def __init__(self, scheme=None):
+        self._scheme = scheme
+
+    @property
+    def scheme(self):
+        return self._scheme or settings.SLUG_GENERATOR
+
+    @property
+    def coordination_free(self):
+        """
+        True if primary keys come from ``new_id`` rather than the database.
+        """
+        return self.scheme == "snowflake"
+
+    def new_id(self):
+        """
+        Return a new Snowflake primary key for this process.
+        """
+        return snowflake.generator().next_id()
+
     def encode_url(self, id):
         """
         Convert a numeric ID to a short URL slug.
@@ -47,6 +82,8 @@ class SlugGenerator:
         Returns:
             str: Encoded slug for use in short URLs
         """
+        if self.coordination_free:
+            return snowflake.base62_encode(id, snowflake.SLUG_LENGTH)
         return hashid.encode(id)
 
     def decode_url(self, slug: str):
@@ -59,8 +96,32 @@ class SlugGenerator:
         Returns:
             tuple: Decoded numeric ID(s)
         """
+        if self.coordination_free:
+            pk = self.decode_pk(slug)
+            return () if pk is None else (pk,)
         return hashid.decode(slug)
 
+    def decode_pk(self, slug: str):
+        """
+        Decode a generated slug to the primary key it was made from.
+
+        Args:
+            slug: The URL slug to decode
+
+        Returns:
+            int | None: The primary key, or None if ``slug`` is not a slug
+            this generator could have produced (e.g. a custom alias)
+        """
+        if self.coordination_free and len(slug) == snowflake.SLUG_LENGTH:
+            try:
+                pk = snowflake.base62_decode(slug)
+            except ValueError:
+                pk = None
+            if pk is not None and pk >> snowflake.ID_BITS == 0:
+                return pk
+        ids = hashid.decode(slug)
+        return ids[0] if len(ids) == 1 else None
+
 
 class QrCode:
     """
@@ -190,45 +251,147 @@ def get_client_ip(request):
     return ip
 
 
-def extract_visit_data(request):
+def get_redis_client():
     """
-    Extract comprehensive analytics data from a visit request.
+    Return a raw redis client for the default cache backend.
+
+    Returns:
+        redis.Redis | None: Client sharing the default cache's connection
+        pool, or None when the default cache is not Redis (e.g. LocMemCache
+        in development and tests).
+
+    Used by subsystems that need Redis data structures (hashes, lists)
+    beyond the plain get/set API exposed by Django's cache framework.
+    """
+    from django.core.cache import caches
+    from django.core.cache.backends.redis import RedisCache
+
+    backend = caches["default"]
+    if not isinstance(backend, RedisCache):
+        return None
+    return backend._cache.get_client(write=True)
+
+
+def capture_visit(request):
+    """
+    Capture the raw facts about a visit on the request path.
 
     Args:
         request: The HTTP request object
 
     Returns:
-        dict: Visit analytics including:
-            - IP address and geolocation data
-            - Browser and OS information
-            - Device type
-            - Bot detection
-            - Referrer URL
-            - Geographic location (country, region, city)
+        dict: ``ip_address`` (None if not a valid address), ``user_agent``
+        and ``referrer`` (cut to ``REFERRER_MAX_LENGTH``)
 
-    Uses GeoIP2 for location lookup and user-agents for device detection.
+    Deliberately does no parsing or lookups so the redirect can be returned
+    immediately; ``enrich_visits`` turns these into analytics fields later,
+    in the background consumer that writes ``UrlVisit`` rows.
     """
-    ua_string = request.META.get("HTTP_USER_AGENT", "")
-    user_agent = user_agents.parse(ua_string)
-    ip_address = get_client_ip(request)
-    referrer = request.META.get("HTTP_REFERER", None)
+    referrer = request.META.get("HTTP_REFERER") or None
+    return {
+        "ip_address": clean_ip(get_client_ip(request)),
+        "user_agent": request.META.get("HTTP_USER_AGENT", ""),
+        "referrer": referrer[:REFERRER_MAX_LENGTH] if referrer else None,
+    }
+
+
+def clean_ip(value):
+    """
+    Return ``value`` as a normalized IP address, or None if it is not one.
 
+    ``X-Forwarded-For`` is client-supplied, so it can hold anything.
+    """
+    if not value:
+        return None
     try:
-        geo = reader.city(ip_address)
-        country = geo.country.name
-        region = geo.subdivisions.most_specific.name
-        city = geo.city.name
-    except Exception:
-        country = region = city = None
+        return str(ipaddress.ip_address(value.strip()))
+    except ValueError:
+        return None
+
 
+def parse_user_agent(ua_string):
+    """
+    Parse a user agent string into the fields stored on ``UrlVisit``.
+
+    Args:
+        ua_string: Raw User-Agent header value
+
+    Returns:
+        dict: ``browser``, ``os``, ``device`` and ``is_bot``
+
+    Results are memoized in ``ua_cache``; a handful of user agents make up
+    most traffic, so the ua-parser regex cascade rarely runs.
+    """
+    return dict(ua_cache.get_or_set(ua_string, _parse_user_agent))
+
+
+def _parse_user_agent(ua_string):
+    user_agent = user_agents.parse(ua_string)
     return {
-        "ip_address": ip_address,
         "browser": user_agent.browser.family,
         "os": user_agent.os.family,
         "device": user_agent.device.family,
         "is_bot": user_agent.is_bot,
-        "country": country,
-        "region": region,
-        "city": city,
-        "referrer": referrer,
     }
+
+
+def locate_ip(ip_address):
+    """
+    Look up the geographic location of an IP address.
+
+    Args:
+        ip_address: IPv4 or IPv6 address
+
+    Returns:
+        dict: ``country``, ``region`` and ``city`` (None when unknown)
+
+    Delegates to the lazily opened, cached ``geoip.GeoIPService``.
+    """
+    return geoip.locate(ip_address)
+
+
+def enrich_visits(visits):
+    """
+    Add browser, OS, device, bot and location fields to captured visits.
+
+    Args:
+        visits: List of dicts from ``capture_visit`` (plus any extra keys)
+
+    Returns:
+        list: The same visits with analytics fields filled in and the raw
+        ``user_agent`` removed. Visits that were already enriched are
+        returned unchanged.
+
+    Identical user agent strings and IP addresses within the batch are
+    resolved only once.
+    """
+    raw = [visit for visit in visits if "user_agent" in visit]
+    agents = {ua: parse_user_agent(ua) for ua in {v["user_agent"] for v in raw}}
+    locations = {ip: locate_ip(ip) for ip in {v["ip_address"] for v in raw}}
+
+    for visit in raw:
+        visit.update(agents[visit.pop("user_agent")])
+        visit.update(locations[visit["ip_address"]])
+    return visits
+
+
+def extract_visit_data(request):
+    """
+    Extract comprehensive analytics data from a visit request.
+
+    Args:
+        request: The HTTP request object
+
+    Returns:
+        dict: Visit analytics including:
+            - IP address and geolocation data
+            - Browser and OS information
+            - Device type
+            - Bot detection
+            - Referrer URL
+            - Geographic location (country, region, city)
+
+    Resolves everything synchronously; the redirect path uses
+    ``capture_visit`` instead and leaves enrichment to the visit writer.
+    """
+    return enrich_visits([capture_visit(request)])[0]
@@ -6,30 +6,59 @@ This module provides view functions for:
 - URL management (CRUD operations)
 - QR code generation and delivery
 - URL analytics tracking
+- Prometheus metrics exposition
 - Error handling pages
 
+The public redirect views also have async twins (``*_async``) that are
+routed instead of the sync versions when ``ASYNC_REDIRECTS`` is enabled.
+
 All views implement proper security measures including:
 - Rate limiting for anonymous users
 - Authentication checks for protected operations
 - Transaction management for data integrity
 """
 
+import hmac
 from datetime import datetime, timezone as dt_timezone
 
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
+from django.core.exceptions import ValidationError
+from django.conf import settings
 from django.db import transaction
+from django.http import (
+    Http404,
+    HttpResponse,
+    HttpResponsePermanentRedirect,
+    HttpResponseRedirect,
+)
 from django.shortcuts import get_object_or_404, redirect, render
 from django.urls import reverse
 from django.utils import timezone
+from django.utils.cache import patch_cache_control
 from django.views.decorators.http import require_POST
 from django_ratelimit.decorators import ratelimit
 from django_ratelimit.exceptions import Ratelimited
 
-from .models import ShortUrlAnonymous, UrlModel, UrlVisit
-from .utils import QrCode, SlugGenerator, extract_visit_data, get_client_ip
-
-from django.db.models import Count
+from . import bulk
+from .canonical import url_hash
+from .errors import prerendered_page
+from .ids import create_link
+from .linkcache import aget_anonymous_link, aget_link, get_anonymous_link, get_link
+from .models import (
+    RedirectType,
+    ShortUrlAnonymous,
+    UrlModel,
+    UrlVisit,
+    validate_url_format_and_blacklist,
+)
+from .prometheus import CONTENT_TYPE, exposition
+from .slugpool import slug_pool
+from .threats import threat_screen
+from .tracking import record_click, schedule_click
+from .utils import QrCode, capture_visit, get_client_ip
+
+from django.db.models import Sum
 from django.db.models.functions import TruncDay
 
 from django.views.decorators.cache import cache_page
@@ -37,7 +66,6 @@ from urllib.parse import urlparse
 import logging
 
 logger = logging.getLogger("urlLogic")
-Slug = SlugGenerator()
 
 
 # ------------------------------------------------------------------------------
@@ -54,17 +82,23 @@ def anonymousShorturl(request):
             return redirect("index")  # Redirect to form page
 
         try:
-            with transaction.atomic():
-                url_obj = ShortUrlAnonymous.objects.create(
-                    original_url=original_url, ip_address=get_client_ip(request)
-                )
-                slug = Slug.encode_url(url_obj.pk)
-                url_obj.short_code = slug
-                url_obj.save(update_fields=["short_code"])
+            validate_url_format_and_blacklist(original_url)
+        except ValidationError as e:
+            messages.error(request, e.messages[0])
+            return redirect("index")
 
-                short_url = request.build_absolute_uri(f"/s/{url_obj.short_code}/")
-                messages.success(request, "Short URL created successfully!")
-                return redirect(f"{reverse('index')}?short_url={short_url}")
+        try:
+            fields = {"original_url": original_url, "ip_address": get_client_ip(request)}
+            length = slug_pool.length_for()
+            if length:
+                url_obj = slug_pool.create_link(ShortUrlAnonymous, "short_code", length, **fields)
+            else:
+                # A single INSERT: no surrounding transaction needed.
+                url_obj = create_link(ShortUrlAnonymous, "short_code", **fields)
+
+            short_url = request.build_absolute_uri(f"/s/{url_obj.short_code}/")
+            messages.success(request, "Short URL created successfully!")
+            return redirect(f"{reverse('index')}?short_url={short_url}")
 
         except Ratelimited:
             messages.error(
@@ -80,6 +114,18 @@ def anonymousShorturl(request):
     return render(request, "anony_shorturl.html")
 
 
+def is_screened_out(link):
+    """
+    Check whether a link's destination is now in the threat feed.
+
+    Only with ``THREAT_SCREEN_REDIRECTS``; links are always screened when
+    they are created (see ``urlLogic.threats``).
+    """
+    return settings.THREAT_SCREEN_REDIRECTS and bool(
+        threat_screen.match(link["original_url"])
+    )
+
+
 def redirect_to_original(request, short_code):
     """
     Redirect anonymous shortened URLs to their original destination.
@@ -91,11 +137,31 @@ def redirect_to_original(request, short_code):
     Returns:
         HttpResponse: Redirect to original URL or 404
 
-    Handles redirects for anonymous user-created short URLs,
-    with 404 handling for non-existent URLs.
+    Handles redirects for anonymous user-created short URLs. Unknown codes
+    get the pre-rendered 404 page; both hits and misses are cached (see
+    linkcache.get_anonymous_link).
+    """
+    link = get_anonymous_link(short_code)
+    if link is None:
+        return prerendered_page(request, "404_notF.html", status=404)
+    elif is_screened_out(link):
+        return prerendered_page(request, "url_blocked.html", status=403)
+    return redirect(link["original_url"])
+
+
+async def redirect_to_original_async(request, short_code):
     """
-    url = get_object_or_404(ShortUrlAnonymous, short_code=short_code)
-    return redirect(url.original_url)
+    Async version of ``redirect_to_original`` for ASGI deployments.
+
+    Resolves the code through the async cache and ORM APIs, so the event
+    loop is never blocked on the lookup.
+    """
+    link = await aget_anonymous_link(short_code)
+    if link is None:
+        return prerendered_page(request, "404_notF.html", status=404)
+    elif is_screened_out(link):
+        return prerendered_page(request, "url_blocked.html", status=403)
+    return redirect(link["original_url"])
 
 
 # ------------------------------------------------------------------------------
@@ -137,9 +203,13 @@ def make_short_url(request):
 
     Features:
     - Custom short URL support
+    - Per-link redirect policy (302/307 tracked or cacheable 301)
     - Automatic http:// prefix addition
-    - Duplicate URL checking
-    - Transaction-safe creation
+    - Blocklist and threat feed screening (see ``urlLogic.threats``)
+    - Duplicate URL checking on the canonical URL (see ``urlLogic.canonical``)
+    - Creation in a single INSERT (see ``urlLogic.ids``)
+    - Optional pre-generated codes of a chosen length (``code_length``, see
+      ``urlLogic.slugpool``)
     - Validation for URL format and uniqueness
 
     Security:
@@ -151,6 +221,7 @@ def make_short_url(request):
         long_url = request.POST.get("long_url", "").strip()
         short_url = request.POST.get("short_url", "").strip()
         expiry = request.POST.get("date", "").strip()
+        redirect_type, cache_max_age = parse_redirect_policy(request.POST)
 
         if not long_url:
             messages.error(request, "Please enter a valid URL.")
@@ -159,7 +230,13 @@ def make_short_url(request):
         if not long_url.startswith(("http://", "https://")):
             long_url = "http://" + long_url
 
-        if UrlModel.objects.filter(original_url=long_url, user=request.user).exists():
+        try:
+            validate_url_format_and_blacklist(long_url)
+        except ValidationError as e:
+            messages.error(request, e.messages[0])
+            return render(request, "url_shortner.html")
+
+        if UrlModel.objects.filter(user=request.user, url_hash=url_hash(long_url)).exists():
             messages.error(request, "This URL has already been shortened.")
             return render(request, "url_shortner.html")
 
@@ -174,20 +251,19 @@ def make_short_url(request):
         else:
             expires_at = None
 
+        fields = {
+            "original_url": long_url,
+            "user": request.user,
+            "expires_at": expires_at,
+            "redirect_type": redirect_type,
+            "cache_max_age": cache_max_age,
+        }
+        length = None if short_url else slug_pool.length_for(request.POST.get("code_length"))
         try:
-            with transaction.atomic():
-                url = UrlModel.objects.create(
-                    original_url=long_url,
-                    user=request.user,
-                    expires_at=expires_at,
-                )
-
-                slug = short_url or Slug.encode_url(id=url.pk)
-                if not slug:
-                    raise ValueError("Slug generation failed")
-
-                url.short_url = slug
-                url.save()
+            if length:
+                slug_pool.create_link(UrlModel, "short_url", length, **fields)
+            else:
+                create_link(UrlModel, "short_url", slug=short_url, **fields)
 
         except Exception as e:
             messages.error(request, f"Error: {str(e)}")
@@ -198,6 +274,107 @@ def make_short_url(request):
     return render(request, "url_shortner.html")
 
 
+@login_required()
+@ratelimit(key="user", rate="10/h", method="POST", block=True)
+def bulk_shorten(request):
+    """
+    Shorten every URL of an uploaded CSV or JSON-lines file.
+
+    Args:
+        request: The HTTP request object
+
+    Returns:
+        HttpResponse: The upload form, or on POST a CSV attachment listing
+        each input line with its short URL or the reason it was rejected
+
+    Features:
+    - Optional ``alias`` and ``expires_at`` columns
+    - Duplicates found with set-based queries, links created with
+      ``bulk_create`` in chunks (see ``urlLogic.bulk``)
+    - At most ``BULK_SHORTEN_MAX_ROWS`` rows per file
+    """
+    if request.method == "POST":
+        upload = request.FILES.get("file")
+        if upload is None:
+            messages.error(request, "Please choose a CSV or JSON-lines file.")
+            return render(request, "bulk_shorten.html")
+        fmt = request.POST.get("format", "")
+        if fmt not in ("", "csv", "jsonl"):
+            fmt = ""
+        try:
+            rows = bulk.read_upload(upload, fmt)
+            bulk.shorten(
+                request.user, rows, max_rows=settings.BULK_SHORTEN_MAX_ROWS
+            )
+        except bulk.BulkInputError as e:
+            messages.error(request, str(e))
+            return render(request, "bulk_shorten.html")
+
+        response = HttpResponse(content_type="text/csv")
+        response["Content-Disposition"] = 'attachment; filename="short-links.csv"'
+        bulk.write_results(response, rows, f"{request.scheme}://{request.get_host()}")
+        return response
+
+    return render(request, "bulk_shorten.html")
+
+
+def parse_redirect_policy(data):
+    """
+    Read a link's redirect policy from submitted form data.
+
+    Args:
+        data: ``request.POST``
+
+    Returns:
+        tuple: ``(redirect_type, cache_max_age)``; unknown or missing values
+        fall back to a tracked 302 and the default max-age
+    """
+    try:
+        redirect_type = RedirectType(int(data.get("redirect_type", "")))
+    except ValueError:
+        redirect_type = RedirectType.FOUND
+    max_age = data.get("cache_max_age", "").strip()
+    cache_max_age = int(max_age) if max_age.isdigit() else None
+    return redirect_type, cache_max_age
+
+
+def link_redirect(link):
+    """
+    Build the redirect response for a resolved link.
+
+    Args:
+        link: Link fields from ``linkcache.get_link``
+
+    Returns:
+        HttpResponse: 301, 302 or 307 redirect with Cache-Control headers
+
+    Permanent redirects are public and cacheable for the link's
+    ``cache_max_age`` (default ``REDIRECT_MAX_AGE``), never beyond
+    ``expires_at``. Temporary redirects are sent with ``no-store`` so every
+    click comes back and is counted.
+    """
+    if link["redirect_type"] == RedirectType.PERMANENT:
+        max_age = link["cache_max_age"]
+        if max_age is None:
+            max_age = settings.REDIRECT_MAX_AGE
+        if link["expires_at"]:
+            remaining = (link["expires_at"] - timezone.now()).total_seconds()
+            max_age = min(max_age, int(remaining))
+        response = HttpResponsePermanentRedirect(link["original_url"])
+        if max_age > 0:
+            patch_cache_control(response, public=True, max_age=max_age)
+        else:
+            patch_cache_control(response, no_store=True)
+        return response
+
+    response = HttpResponseRedirect(
+        link["original_url"],
+        preserve_request=link["redirect_type"] == RedirectType.TEMPORARY,
+    )
+    patch_cache_control(response, no_store=True)
+    return response
+
+
 def redirect_url(request, slug):
     """
     Handle redirects for authenticated user shortened URLs with analytics.
@@ -210,10 +387,15 @@ def redirect_url(request, slug):
         HttpResponse: Redirect to original URL or error page
 
     Features:
+    - Cached slug resolution, including short-lived caching of unknown
+      slugs (see linkcache.get_link)
+    - Pre-rendered 404/expired/blocked pages (see errors.prerendered_page)
     - URL existence validation
     - Expiration checking
-    - Click counting
-    - Comprehensive visit analytics:
+    - Per-link redirect status and Cache-Control (see link_redirect)
+    - Click counting via sharded counters (see counters.ClickCounter)
+    - Comprehensive visit analytics, captured raw here and enriched,
+      buffered and bulk inserted in the background (see visits.VisitIngestor):
         - IP address tracking
         - Browser and OS detection
         - Device identification
@@ -224,24 +406,47 @@ def redirect_url(request, slug):
     Security:
     - Validates URL existence
     - Checks expiration
+    - Optionally re-screens the destination (``THREAT_SCREEN_REDIRECTS``)
     - Records all access attempts
     """
-    url = UrlModel.objects.filter(short_url=slug).first()
-    if url is None:
-        return render(request, "404_notF.html")
-    elif url.expires_at and timezone.now() > url.expires_at:
-        return render(request, "url_expired.html")
-    url.click_count += 1
-    url.save()
-    url_visit_data = extract_visit_data(request)
+    link = get_link(slug)
+    if link is None:
+        return prerendered_page(request, "404_notF.html", status=404)
+    elif link["expires_at"] and timezone.now() > link["expires_at"]:
+        return prerendered_page(request, "url_expired.html")
+    elif is_screened_out(link):
+        return prerendered_page(request, "url_blocked.html", status=403)
+    record_click(link["id"], capture_visit(request))
 
-    from .tasks import save_url_visit_data
+    return link_redirect(link)
 
-    transaction.on_commit(
-        lambda: save_url_visit_data.delay(url.id, url_visit_data)  # type: ignore
-    )
 
-    return redirect(url.original_url)
+async def redirect_url_async(request, slug):
+    """
+    Async version of ``redirect_url`` for ASGI deployments.
+
+    Args:
+        request: The HTTP request object
+        slug: The shortened URL identifier
+
+    Returns:
+        HttpResponse: Redirect to original URL or error page
+
+    Resolution uses the async cache and ORM APIs (``aget_link``). Click
+    counting and visit buffering are handed to a worker thread with
+    ``schedule_click`` and not awaited, so the redirect is returned without
+    waiting on analytics.
+    """
+    link = await aget_link(slug)
+    if link is None:
+        return prerendered_page(request, "404_notF.html", status=404)
+    elif link["expires_at"] and timezone.now() > link["expires_at"]:
+        return prerendered_page(request, "url_expired.html")
+    elif is_screened_out(link):
+        return prerendered_page(request, "url_blocked.html", status=403)
+    schedule_click(link["id"], capture_visit(request))
+
+    return link_redirect(link)
 
 
 @login_required()
@@ -253,30 +458,31 @@ def analytics_dashboard(request, id):
     has_data = visits.exists()
 
     if has_data:
+        # Sampled rows stand for ``weight`` clicks each (see urlLogic.sampling).
         visits_by_day = (
             visits.annotate(day=TruncDay("timestamp"))
             .values("day")
-            .annotate(clicks=Count("id"))
+            .annotate(clicks=Sum("weight"))
             .order_by("day")
         )
 
         visits_by_country = (
-            visits.values("country").annotate(total=Count("id")).order_by("-total")[:5]
+            visits.values("country").annotate(total=Sum("weight")).order_by("-total")[:5]
         )
 
         visits_by_device = (
-            visits.values("device").annotate(total=Count("id")).order_by("-total")
+            visits.values("device").annotate(total=Sum("weight")).order_by("-total")
         )
 
         visits_by_referrer = (
             visits.values("referrer")
-            .annotate(total=Count("id"))
+            .annotate(total=Sum("weight"))
             .exclude(referrer__isnull=True)
             .exclude(referrer="")
             .order_by("-total")[:5]
         )
 
-        total_visits = visits.count()
+        total_visits = visits.aggregate(total=Sum("weight"))["total"]
         top_country = visits_by_country[0]["country"] if visits_by_country else None
         top_device = visits_by_device[0]["device"] if visits_by_device else None
         top_referrer = visits_by_referrer[0]["referrer"] if visits_by_referrer else None
@@ -367,6 +573,7 @@ def update_url(request, id):
     Features:
     - Edit original URL destination
     - Update expiration date/time
+    - Change the redirect policy (status code and cache lifetime)
     - View comprehensive URL statistics
     - Timezone-aware datetime handling
 
@@ -393,6 +600,8 @@ def update_url(request, id):
                 url.expires_at = aware_expiry.astimezone(dt_timezone.utc)
             except ValueError:
                 pass
+        if "redirect_type" in request.POST:
+            url.redirect_type, url.cache_max_age = parse_redirect_policy(request.POST)
         url.save()
         return redirect("u:home")
 
@@ -402,6 +611,7 @@ def update_url(request, id):
         ("Created At", url.created_at),
         ("Expires At", url.expires_at if url.expires_at else "Never"),
         ("Click Count", url.click_count),
+        ("Redirect", url.get_redirect_type_display()),
     ]
 
     return render(
@@ -545,3 +755,31 @@ def mail_qr(request, id):
     )
     messages.success(request, "QR code email has been sent.")
     return redirect("u:home")
+
+
+def metrics(request):
+    """
+    Serve application metrics in the Prometheus text format.
+
+    Args:
+        request: The HTTP request object
+
+    Returns:
+        HttpResponse: The metrics of every worker process on this host (see
+        ``urlLogic.prometheus``)
+
+    Security:
+    - Requires ``Authorization: Bearer <METRICS_TOKEN>``
+    - Without a token the endpoint is only served with DEBUG on; otherwise
+      it answers 404, as it does for a wrong token
+    """
+    token = settings.METRICS_TOKEN
+    if token:
+        given = request.headers.get("Authorization", "").removeprefix("Bearer ")
+        if not hmac.compare_digest(given.encode(), token.encode()):
+            raise Http404
+    elif not settings.DEBUG:
+        raise Http404
+    response = HttpResponse(exposition(), content_type=CONTENT_TYPE)
+    patch_cache_control(response, no_store=True)
+    return response
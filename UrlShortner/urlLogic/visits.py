@@ -0,0 +1,310 @@
+"""
+Micro-batched ingestion of URL visit analytics.
+
+Previously every click produced its own Celery message, and each message
+ran a ``UrlModel.objects.get`` followed by a single-row insert. A viral link
+therefore cost one broker round trip and two queries per click.
+
+Visits are now appended to a buffer on the redirect path and drained in
+chunks of ``VISIT_BATCH_SIZE`` through a single ``bulk_create`` that uses
+``url_id`` directly. The buffer is drained when either:
+
+- it reaches ``VISIT_BATCH_SIZE`` entries (a drain task is scheduled), or
+- ``VISIT_MAX_LATENCY`` seconds have passed (Celery beat schedules a drain),
+
+so no visit waits longer than ``VISIT_MAX_LATENCY`` before it is stored.
+
+The redirect path only captures raw facts (IP, user agent string, referrer
+and timestamp). User agent parsing and GeoIP lookups happen here, once per
+distinct value in each batch, before the rows are inserted.
+
+Two buffer backends mirror ``urlLogic.counters``:
+
+- ``RedisVisitBuffer``: a Redis list shared by all processes.
+- ``LocalVisitBuffer``: an in-process deque for development and tests. It
+  drains itself, since no worker can see it.
+"""
+
+import json
+import logging
+import threading
+import time
+from collections import Counter, deque
+from datetime import datetime
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DatabaseError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .utils import REFERRER_MAX_LENGTH, clean_ip, enrich_visits, get_redis_client
+
+logger = logging.getLogger("urlLogic")
+
+DRAIN_LOCK_KEY = "urlly:visits:drain-lock"
+DRAIN_SCHEDULED_KEY = "urlly:visits:drain-scheduled"
+
+
+class RedisVisitBuffer:
+    """
+    Visits stored as JSON entries in a Redis list.
+
+    A drain reads a chunk with ``LRANGE`` and trims it off only after the
+    chunk has been written, so a crashed worker never loses visits.
+    """
+
+    key = "urlly:visits"
+
+    def __init__(self, client):
+        self.client = client
+
+    def push(self, visit):
+        return self.client.rpush(self.key, json.dumps(visit))
+
+    def __len__(self):
+        return self.client.llen(self.key)
+
+    def oldest(self):
+        raw = self.client.lindex(self.key, 0)
+        return json.loads(raw)["timestamp"] if raw else None
+
+    def drain(self, write, batch_size):
+        while True:
+            raw = self.client.lrange(self.key, 0, batch_size - 1)
+            if not raw:
+                return
+            write([json.loads(item) for item in raw])
+            self.client.ltrim(self.key, len(raw), -1)
+            if len(raw) < batch_size:
+                return
+
+
+class LocalVisitBuffer:
+    """
+    In-process visit buffer backed by a deque.
+    """
+
+    def __init__(self):
+        self.items = deque()
+        self.lock = threading.Lock()
+        self.last_drain = time.monotonic()
+
+    def push(self, visit):
+        self.items.append(visit)
+        return len(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+    def oldest(self):
+        try:
+            return self.items[0]["timestamp"]
+        except IndexError:
+            return None
+
+    def drain(self, write, batch_size):
+        with self.lock:
+            self.last_drain = time.monotonic()
+            while self.items:
+                batch = [
+                    self.items.popleft()
+                    for _ in range(min(batch_size, len(self.items)))
+                ]
+                try:
+                    write(batch)
+                except Exception:
+                    # Requeue in the original order so the next drain retries.
+                    self.items.extendleft(reversed(batch))
+                    raise
+
+    def drain_due(self):
+        return time.monotonic() - self.last_drain >= settings.VISIT_MAX_LATENCY
+
+
+def write_visits(visits):
+    """
+    Store a batch of buffered visits with a single bulk insert.
+
+    Args:
+        visits: List of visit dicts as produced by ``VisitIngestor.add``
+
+    Returns:
+        int: Number of UrlVisit rows created
+
+    Raw visits are enriched first (see ``utils.enrich_visits``), then bot
+    visits are handled according to ``ANALYTICS_BOT_POLICY``. Visits for
+    links deleted since the click are dropped; one ``id__in`` query per
+    batch finds the links that still exist.
+
+    Values are cut to their column sizes and invalid IP addresses stored
+    as None. If the batch insert still fails, the rows are inserted one at
+    a time and those the database rejects are logged and dropped, so the
+    batch always counts as written and one bad visit never blocks the
+    buffer behind it.
+    """
+    from .models import UrlModel, UrlVisit
+
+    visits = enrich_visits(visits)
+    if settings.ANALYTICS_BOT_POLICY != "store":
+        bots = Counter()
+        for visit in visits:
+            if visit.get("is_bot"):
+                bots[visit["url_id"]] += visit.get("weight", 1)
+        visits = [visit for visit in visits if not visit.get("is_bot")]
+        if settings.ANALYTICS_BOT_POLICY == "aggregate":
+            with transaction.atomic():
+                for url_id in sorted(bots):
+                    UrlModel.objects.filter(id=url_id).update(
+                        bot_click_count=F("bot_click_count") + bots[url_id]
+                    )
+    url_ids = {visit["url_id"] for visit in visits}
+    existing = set(
+        UrlModel.objects.filter(id__in=url_ids).values_list("id", flat=True)
+    )
+    rows = [
+        UrlVisit(
+            url_id=visit["url_id"],
+            timestamp=datetime.fromisoformat(visit["timestamp"]),
+            ip_address=clean_ip(visit.get("ip_address")),
+            browser=_clip(visit.get("browser"), 50),
+            os=_clip(visit.get("os"), 50),
+            device=_clip(visit.get("device"), 50),
+            is_bot=visit.get("is_bot") or False,
+            country=_clip(visit.get("country"), 100),
+            region=_clip(visit.get("region"), 100),
+            city=_clip(visit.get("city"), 100),
+            referrer=_clip(visit.get("referrer"), REFERRER_MAX_LENGTH),
+            weight=visit.get("weight", 1),
+        )
+        for visit in visits
+        if visit["url_id"] in existing
+    ]
+    try:
+        with transaction.atomic():
+            UrlVisit.objects.bulk_create(rows, batch_size=settings.VISIT_BATCH_SIZE)
+    except DatabaseError:
+        return _write_one_by_one(rows)
+    return len(rows)
+
+
+def _clip(value, length):
+    return value[:length] if isinstance(value, str) else value
+
+
+def _write_one_by_one(rows):
+    """
+    Insert rows one at a time after a batch insert failed, dropping (and
+    logging) the rows the database rejects so they cannot stall the buffer.
+    """
+    from .models import UrlVisit
+
+    written = 0
+    for row in rows:
+        try:
+            with transaction.atomic():
+                UrlVisit.objects.bulk_create([row])
+        except DatabaseError as e:
+            logger.warning(
+                "Dropping visit to link %s the database rejected: %s", row.url_id, e
+            )
+        else:
+            written += 1
+    return written
+
+
+class VisitIngestor:
+    """
+    Entry point for buffering visits and draining them into ``UrlVisit``.
+
+    The backend is chosen from ``VISIT_BUFFER_BACKEND`` ("redis", "local" or
+    "auto"); "auto" uses Redis whenever the default cache is Redis.
+    """
+
+    def __init__(self):
+        self._buffer = None
+        self._lock = threading.Lock()
+
+    @property
+    def buffer(self):
+        if self._buffer is None:
+            with self._lock:
+                if self._buffer is None:
+                    self._buffer = self._build_buffer()
+        return self._buffer
+
+    def _build_buffer(self):
+        choice = settings.VISIT_BUFFER_BACKEND
+        client = get_redis_client() if choice in ("auto", "redis") else None
+        if client is not None:
+            return RedisVisitBuffer(client)
+        if choice == "redis":
+            raise RuntimeError(
+                "VISIT_BUFFER_BACKEND is 'redis' but the default cache is not Redis."
+            )
+        return LocalVisitBuffer()
+
+    def add(self, url_id, visit_data, timestamp=None):
+        """
+        Buffer one visit for later bulk insertion.
+
+        Args:
+            url_id: ID of the visited UrlModel
+            visit_data: Dict of visit fields (see ``UrlVisit``)
+            timestamp: Time of the click (defaults to now)
+        """
+        visit = dict(visit_data)
+        visit["url_id"] = url_id
+        visit["timestamp"] = (timestamp or timezone.now()).isoformat()
+        size = self.buffer.push(visit)
+
+        if isinstance(self.buffer, LocalVisitBuffer):
+            if size >= settings.VISIT_BATCH_SIZE or self.buffer.drain_due():
+                try:
+                    self.drain()
+                except Exception:
+                    # Already logged; the visits stay queued for the next drain.
+                    pass
+        elif size >= settings.VISIT_BATCH_SIZE and cache.add(
+            DRAIN_SCHEDULED_KEY, 1, settings.VISIT_MAX_LATENCY
+        ):
+            from .tasks import drain_visit_buffer
+
+            drain_visit_buffer.delay()  # type: ignore
+
+    def lag(self):
+        """
+        Measure how far visit ingestion is behind.
+
+        Returns:
+            tuple: Number of buffered visits and the age in seconds of the
+            oldest one (0 when the buffer is empty)
+        """
+        depth = len(self.buffer)
+        oldest = self.buffer.oldest() if depth else None
+        if oldest is None:
+            return depth, 0.0
+        age = timezone.now() - datetime.fromisoformat(oldest)
+        return depth, max(0.0, age.total_seconds())
+
+    def drain(self):
+        """
+        Write every buffered visit to the database in chunks.
+
+        Returns:
+            bool: False if another drain currently holds the lock
+        """
+        if not cache.add(DRAIN_LOCK_KEY, 1, settings.VISIT_MAX_LATENCY * 12):
+            return False
+        try:
+            self.buffer.drain(write_visits, settings.VISIT_BATCH_SIZE)
+        except Exception:
+            logger.exception("Draining the visit buffer failed")
+            raise
+        finally:
+            cache.delete(DRAIN_LOCK_KEY)
+            cache.delete(DRAIN_SCHEDULED_KEY)
+        return True
+
+
+visit_ingestor = VisitIngestor()